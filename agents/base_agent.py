@@ -1,38 +1,84 @@
 # rag_chatbot/agents/base_agent.py
 
+import logging
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, Iterable, Optional
 
 # Import the MCPMessage and message_bus from utils
-from utils.mcp import MCPMessage, message_bus
+from utils.mcp import MCPMessage, MessageType, message_bus
+
+logger = logging.getLogger(__name__)
 
 class BaseAgent(ABC):
     """
     Abstract base class for all agents in the RAG chatbot system.
     Defines the common interface for agents to handle messages.
+
+    Each agent owns a thread pool. Messages delivered by the message bus are
+    handed to the pool, so a slow handler (e.g. parsing a large PDF) never
+    blocks the agent that sent the message.
     """
-    def __init__(self, name: str):
+    def __init__(self, name: str, max_workers: int = 4,
+                 message_types: Optional[Iterable[MessageType]] = None):
         """
         Initializes the BaseAgent with a unique name.
 
         Args:
             name (str): The name of the agent. This name is used as the 'receiver'
                         in MCP messages.
+            max_workers (int): The number of worker threads processing this agent's
+                               messages. Use 1 to process messages strictly in the
+                               order they were sent.
+            message_types (Optional[Iterable[MessageType]]): The message types this agent
+                                                            consumes. The message bus does
+                                                            not deliver other types to it.
+                                                            None subscribes to every type.
         """
         self.name = name
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
         # Register this agent's message handling method with the global message bus.
         # This allows other agents to send messages to this agent by its name.
-        message_bus.register_handler(self.name, self.handle_message)
-        print(f"BaseAgent: {self.name} initialized and registered with MessageBus.")
+        message_bus.register_handler(self.name, self.handle_message, message_types)
+        logger.debug("%s initialized and registered with MessageBus.", self.name)
 
-    @abstractmethod
     def handle_message(self, message: MCPMessage):
+        """
+        Queues an incoming MCPMessage on the agent's thread pool and returns immediately.
+
+        Args:
+            message (MCPMessage): The incoming message to be processed.
+        """
+        future = self._executor.submit(self._handle_impl, message)
+        future.add_done_callback(lambda f: self._log_handler_failure(f, message))
+
+    def _log_handler_failure(self, future: Future, message: MCPMessage):
+        """
+        Logs an exception raised by a handler; the thread pool would otherwise swallow it.
+        """
+        exc = future.exception()
+        if exc is not None:
+            logger.error("%s failed to process message type '%s' (trace=%s): %s",
+                         self.name, message.type.name, message.trace_id, exc, exc_info=exc)
+
+    @abstractmethod
+    def _handle_impl(self, message: MCPMessage):
         """
         Abstract method to be implemented by concrete agent classes.
         This method defines how an agent processes an incoming MCPMessage.
+        It runs on one of the agent's worker threads.
 
         Args:
             message (MCPMessage): The incoming message to be processed.
         """
         pass # Concrete implementations will provide the logic here
 
+    def shutdown(self, wait: bool = True):
+        """
+        Stops accepting new messages and releases the agent's worker threads.
+
+        Args:
+            wait (bool): Whether to wait for messages already queued to be processed.
+        """
+        self._executor.shutdown(wait=wait)
+        logger.debug("%s shut down.", self.name)
@@ -1,11 +1,41 @@
 # rag_chatbot/agents/coordinator_agent.py
 
-from typing import Dict, Any, Callable, List
+import collections
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Dict, Any, Callable, List, Optional
 
 # Import BaseAgent and MCP components
 from agents.base_agent import BaseAgent
-from utils.mcp import MCPMessage, message_bus
-import uuid # For generating trace_ids
+from utils.mcp import MCPMessage, MessageType, message_bus, new_trace_id
+
+logger = logging.getLogger(__name__)
+
+@dataclass(slots=True)
+class ConversationState:
+    """
+    Tracks the progress of a single upload or query flow, keyed by its trace_id.
+
+    Attributes:
+        status (str): Current stage of the flow (e.g., "uploading", "querying",
+                      "complete", "error").
+        file_name (Optional[str]): Name of the uploaded file, for upload flows.
+        original_query (Optional[str]): The user's question, for query flows.
+        answer (Optional[str]): The generated answer once available.
+        source_chunks (list): Text chunks used to produce the answer.
+        source_metadata (list): Metadata of the source chunks.
+        error (Optional[str]): Error details if the flow failed.
+        context (Optional[str]): Additional context for the error.
+    """
+    status: str
+    file_name: Optional[str] = None
+    original_query: Optional[str] = None
+    answer: Optional[str] = None
+    source_chunks: list = field(default_factory=list)
+    source_metadata: list = field(default_factory=list)
+    error: Optional[str] = None
+    context: Optional[str] = None
 
 class CoordinatorAgent(BaseAgent):
     """
@@ -13,47 +43,80 @@ class CoordinatorAgent(BaseAgent):
     It receives requests from the UI, routes them to the appropriate agents,
     and collects final responses to send back to the UI.
     """
-    def __init__(self, ui_callback: Callable[[Dict[str, Any]], None]):
-        # Initialize the base agent with its specific name
-        super().__init__("CoordinatorAgent")
+    # Delay (in seconds) used to coalesce UI updates arriving within one tick.
+    UI_FLUSH_INTERVAL = 0.02
+    # Maximum number of pending progress updates. If the UI falls behind, the
+    # oldest ones are dropped instead of accumulating without bound.
+    UI_STATUS_QUEUE_SIZE = 64
+    # UI update types that only report progress and may be dropped under backpressure.
+    # Each PARTIAL_RESPONSE carries the whole answer so far, so a newer one supersedes
+    # any older one. FINAL_RESPONSE and ERROR_MESSAGE are always delivered.
+    DROPPABLE_UI_TYPES = frozenset({"STATUS_UPDATE", "PARTIAL_RESPONSE"})
+
+    def __init__(self, ui_callback: Callable[[Dict[str, Any]], None], batch_size: Optional[int] = None):
+        """
+        Initializes the CoordinatorAgent.
+
+        Args:
+            ui_callback (Callable): Function used to send updates back to the UI.
+                                    It receives "BATCH" messages whose 'items'
+                                    list holds the individual UI updates.
+            batch_size (Optional[int]): If set, pending UI updates are flushed as
+                                        soon as this many have accumulated instead
+                                        of waiting for the flush interval.
+        """
+        # Dispatch table mapping message types to their handlers.
+        # It is built first so the message bus only delivers the types listed here.
+        # A single dict lookup per message replaces a chain of string comparisons.
+        self._handlers: Dict[MessageType, Callable[[MCPMessage], None]] = {
+            MessageType.UI_UPLOAD_REQUEST: self._handle_ui_upload_request,
+            MessageType.UI_UPLOAD_BATCH_REQUEST: self._handle_ui_upload_batch_request,
+            MessageType.UI_QUERY_REQUEST: self._handle_ui_query_request,
+            MessageType.PARTIAL_RESPONSE: self._handle_partial_response,
+            MessageType.FINAL_RESPONSE: self._handle_final_response,
+            MessageType.ERROR_MESSAGE: self._handle_error_message,
+        }
+        # Initialize the base agent with its specific name.
+        # A single worker keeps messages for a conversation (e.g. streamed partial
+        # answers followed by the final one) in the order they were sent.
+        super().__init__("CoordinatorAgent", max_workers=1, message_types=self._handlers.keys())
         # Store a callback function to send responses back to the Streamlit UI.
         self.ui_callback = ui_callback
+        # UI updates are buffered and delivered in batches so that several updates
+        # arriving close together cause a single UI refresh.
+        self.batch_size = batch_size
+        self._pending_ui: List[Dict[str, Any]] = []
+        self._pending_status: collections.deque = collections.deque(maxlen=self.UI_STATUS_QUEUE_SIZE)
+        self._dropped_ui_updates = 0 # Progress updates dropped because the queue was full
+        self._ui_lock = threading.Lock()
+        self._ui_timer: Optional[threading.Timer] = None
         # Dictionary to store ongoing conversation states, keyed by trace_id.
-        self.conversation_states: Dict[str, Dict[str, Any]] = {}
-        print("CoordinatorAgent: Initialized with UI callback.")
+        self.conversation_states: Dict[int, ConversationState] = {}
+        logger.info("CoordinatorAgent initialized with UI callback.")
 
-    def handle_message(self, message: MCPMessage):
+    def _handle_impl(self, message: MCPMessage):
         """
         Handles incoming MCP messages from other agents or the UI.
 
         Supported message types:
         - "UI_UPLOAD_REQUEST": From UI, contains file details for ingestion.
+        - "UI_UPLOAD_BATCH_REQUEST": From UI, contains the details of several files to ingest together.
         - "UI_QUERY_REQUEST": From UI, contains user's question.
-        - "INGESTION_COMPLETE_CONFIRMATION": (Optional) From IngestionAgent after successful parse.
-        - "RETRIEVAL_RESULT": From RetrievalAgent, contains retrieved chunks.
+        - "PARTIAL_RESPONSE": From LLMResponseAgent, contains a newly generated piece of the answer.
         - "FINAL_RESPONSE": From LLMResponseAgent, contains the generated answer.
         - "ERROR_MESSAGE": From any agent, indicating an error.
         """
-        print(f"CoordinatorAgent: Received message of type '{message.type}' from {message.sender} (Trace ID: {message.trace_id})")
-
-        if message.type == "UI_UPLOAD_REQUEST":
-            self._handle_ui_upload_request(message)
-        elif message.type == "UI_QUERY_REQUEST":
-            self._handle_ui_query_request(message)
-        elif message.type == "INGESTION_COMPLETE":
-            # This message is typically handled by RetrievalAgent, but Coordinator can log/monitor
-            print(f"CoordinatorAgent: Ingestion for {message.payload.get('source_metadata', {}).get('file_name')} complete.")
-            # No direct action needed here, as RetrievalAgent will pick it up.
-        elif message.type == "RETRIEVAL_RESULT":
-            # This message is typically handled by LLMResponseAgent, but Coordinator can log/monitor
-            print(f"CoordinatorAgent: Retrieval complete for query '{message.payload.get('query')}'.")
-            # No direct action needed here, as LLMResponseAgent will pick it up.
-        elif message.type == "FINAL_RESPONSE":
-            self._handle_final_response(message)
-        elif message.type == "ERROR_MESSAGE":
-            self._handle_error_message(message)
+        logger.debug("Received %s from %s (trace=%s)", message.type.name, message.sender, message.trace_id)
+
+        handler = self._handlers.get(message.type)
+        if handler:
+            handler(message)
         else:
-            print(f"CoordinatorAgent: Unrecognized message type: {message.type}")
+            self._log_unknown(message)
+
+    def _log_unknown(self, message: MCPMessage):
+        """Logs a message whose type has no registered handler."""
+        logger.warning("Unrecognized message type: %s", message.type.name)
 
     def _handle_ui_upload_request(self, message: MCPMessage):
         """
@@ -65,43 +128,86 @@ class CoordinatorAgent(BaseAgent):
         file_type = message.payload.get("file_type")
 
         if not file_path or not file_name or not file_type:
-            print("CoordinatorAgent Error: Missing file details in UI_UPLOAD_REQUEST payload.")
+            logger.error("Missing file details in UI_UPLOAD_REQUEST payload.")
             self._send_ui_error("Missing file details for upload.", message.trace_id)
             return
 
-        print(f"CoordinatorAgent: Routing upload request for '{file_name}' to IngestionAgent.")
-        # Create a new trace_id for this specific upload operation
-        upload_trace_id = str(uuid.uuid4())
+        logger.info("Routing upload request for '%s' to IngestionAgent.", file_name)
+        # Keep the UI's trace_id, so the UI can match the updates to its request
+        upload_trace_id = message.trace_id
         
-        # Store initial state for this trace
-        self.conversation_states[upload_trace_id] = {
-            "status": "uploading",
-            "file_name": file_name,
-            "original_query": None # Not a query, but a file upload
-        }
+        # Store initial state for this trace (not a query, but a file upload)
+        self.conversation_states[upload_trace_id] = ConversationState(
+            status="uploading",
+            file_name=file_name
+        )
 
         # Send message to IngestionAgent
         ingestion_message = MCPMessage(
             sender=self.name,
             receiver="IngestionAgent",
-            type="UPLOAD_DOCUMENT",
-            trace_id=upload_trace_id, # Use the new trace ID
+            type=MessageType.UPLOAD_DOCUMENT,
+            trace_id=upload_trace_id, # Keep the UI request's trace ID
             payload={
                 "file_path": file_path,
                 "file_name": file_name,
-                "file_type": file_type
+                "file_type": file_type,
+                "content_hash": message.payload.get("content_hash")
             }
         )
         message_bus.send_message(ingestion_message)
         
         # Send an immediate UI update to show processing status
-        self.ui_callback({
+        self._enqueue_ui({
             "type": "STATUS_UPDATE",
             "status": "Processing document...",
             "file_name": file_name,
             "trace_id": upload_trace_id
         })
 
+    def _handle_ui_upload_batch_request(self, message: MCPMessage):
+        """
+        Handles a request from the UI to ingest several uploaded documents together.
+        Sends them to the IngestionAgent as one batch, so that their chunks are
+        embedded in a single pass.
+        """
+        files = message.payload.get("files") or []
+        valid_files = [f for f in files if f.get("file_path") and f.get("file_name") and f.get("file_type")]
+
+        if len(valid_files) != len(files):
+            logger.error("Missing file details in UI_UPLOAD_BATCH_REQUEST payload.")
+            self._send_ui_error("Missing file details for upload.", message.trace_id)
+        if not valid_files:
+            return
+
+        file_names = ", ".join(f["file_name"] for f in valid_files)
+        logger.info("Routing batch upload of %d files to IngestionAgent: %s", len(valid_files), file_names)
+        # Keep the UI's trace_id, so the UI can match the updates to its request
+        upload_trace_id = message.trace_id
+
+        # Store initial state for this trace (not a query, but a file upload)
+        self.conversation_states[upload_trace_id] = ConversationState(
+            status="uploading",
+            file_name=file_names
+        )
+
+        # Send message to IngestionAgent
+        ingestion_message = MCPMessage(
+            sender=self.name,
+            receiver="IngestionAgent",
+            type=MessageType.UPLOAD_DOCUMENT_BATCH,
+            trace_id=upload_trace_id, # Keep the UI request's trace ID
+            payload={"files": valid_files}
+        )
+        message_bus.send_message(ingestion_message)
+
+        # Send an immediate UI update to show processing status
+        self._enqueue_ui({
+            "type": "STATUS_UPDATE",
+            "status": f"Processing {len(valid_files)} documents...",
+            "file_name": file_names,
+            "trace_id": upload_trace_id
+        })
 
     def _handle_ui_query_request(self, message: MCPMessage):
         """
@@ -110,29 +216,26 @@ class CoordinatorAgent(BaseAgent):
         """
         query = message.payload.get("query")
         if not query:
-            print("CoordinatorAgent Error: Missing 'query' in UI_QUERY_REQUEST payload.")
+            logger.error("Missing 'query' in UI_QUERY_REQUEST payload.")
             self._send_ui_error("Your query is empty. Please ask a question.", message.trace_id)
             return
 
-        print(f"CoordinatorAgent: Routing query '{query}' to RetrievalAgent.")
-        # Create a new trace_id for this query operation
-        query_trace_id = str(uuid.uuid4())
+        logger.info("Routing query '%s' to RetrievalAgent.", query)
+        # Keep the UI's trace_id, so the UI can match the response to its query
+        query_trace_id = message.trace_id
 
         # Store initial state for this trace
-        self.conversation_states[query_trace_id] = {
-            "status": "querying",
-            "original_query": query,
-            "answer": None,
-            "source_chunks": [],
-            "source_metadata": []
-        }
+        self.conversation_states[query_trace_id] = ConversationState(
+            status="querying",
+            original_query=query
+        )
         
         # Send message to RetrievalAgent
         retrieval_message = MCPMessage(
             sender=self.name,
             receiver="RetrievalAgent",
-            type="QUERY_REQUEST",
-            trace_id=query_trace_id, # Use the new trace ID
+            type=MessageType.QUERY_REQUEST,
+            trace_id=query_trace_id, # Keep the UI request's trace ID
             payload={
                 "query": query
             }
@@ -140,13 +243,36 @@ class CoordinatorAgent(BaseAgent):
         message_bus.send_message(retrieval_message)
 
         # Send an immediate UI update to show processing status
-        self.ui_callback({
+        self._enqueue_ui({
             "type": "STATUS_UPDATE",
             "status": "Searching for answers...",
             "original_query": query,
             "trace_id": query_trace_id
         })
 
+    def _handle_partial_response(self, message: MCPMessage):
+        """
+        Handles a streamed piece of the answer from the LLMResponseAgent.
+        Accumulates it into the conversation state and forwards the answer so far to the UI.
+        """
+        trace_id = message.trace_id
+        delta = message.payload.get("delta", "")
+
+        state = self.conversation_states.get(trace_id)
+        if state is not None:
+            state.answer = (state.answer or "") + delta
+            answer_so_far = state.answer
+        else:
+            logger.warning("Received PARTIAL_RESPONSE for unknown trace %s", trace_id)
+            answer_so_far = delta
+
+        self._enqueue_ui({
+            "type": "PARTIAL_RESPONSE",
+            "trace_id": trace_id,
+            "delta": delta,
+            "answer": answer_so_far
+        })
+
     def _handle_final_response(self, message: MCPMessage):
         """
         Handles the final response from the LLMResponseAgent.
@@ -158,16 +284,15 @@ class CoordinatorAgent(BaseAgent):
         source_metadata = message.payload.get("source_metadata", [])
         original_query = message.payload.get("original_query")
 
-        if trace_id in self.conversation_states:
-            self.conversation_states[trace_id].update({
-                "status": "complete",
-                "answer": answer,
-                "source_chunks": source_chunks,
-                "source_metadata": source_metadata
-            })
-            print(f"CoordinatorAgent: Final response received for Trace ID: {trace_id}. Sending to UI.")
+        state = self.conversation_states.get(trace_id)
+        if state is not None:
+            state.status = "complete"
+            state.answer = answer
+            state.source_chunks = source_chunks
+            state.source_metadata = source_metadata
+            logger.info("Final response received for trace %s. Sending to UI.", trace_id)
             # Send the complete response back to the UI via the callback
-            self.ui_callback({
+            self._enqueue_ui({
                 "type": "FINAL_RESPONSE",
                 "trace_id": trace_id,
                 "query": original_query,
@@ -178,9 +303,9 @@ class CoordinatorAgent(BaseAgent):
             # Clean up the conversation state after completion
             del self.conversation_states[trace_id]
         else:
-            print(f"CoordinatorAgent Warning: Received FINAL_RESPONSE for unknown trace ID: {trace_id}")
+            logger.warning("Received FINAL_RESPONSE for unknown trace %s", trace_id)
             # Fallback to send directly if trace_id not found (e.g., for direct testing)
-            self.ui_callback({
+            self._enqueue_ui({
                 "type": "FINAL_RESPONSE",
                 "trace_id": trace_id,
                 "query": original_query,
@@ -198,39 +323,87 @@ class CoordinatorAgent(BaseAgent):
         error_details = message.payload.get("error", "An unknown error occurred.")
         context = message.payload.get("context", "")
 
-        print(f"CoordinatorAgent Error: Received error from {message.sender} (Trace ID: {trace_id}): {error_details} - Context: {context}")
+        logger.error("Received error from %s (trace=%s): %s - Context: %s", message.sender, trace_id, error_details, context)
 
-        if trace_id in self.conversation_states:
-            self.conversation_states[trace_id].update({
-                "status": "error",
-                "error": error_details,
-                "context": context
-            })
+        state = self.conversation_states.get(trace_id)
+        if state is not None:
+            state.status = "error"
+            state.error = error_details
+            state.context = context
             # Send the error back to the UI
-            self.ui_callback({
+            self._enqueue_ui({
                 "type": "ERROR_MESSAGE",
                 "trace_id": trace_id,
                 "error": error_details,
                 "context": context,
+                # The file the error concerns, for upload errors that name one
+                "file_name": message.payload.get("file_name"),
                 "sender": message.sender
             })
             # Optionally, clean up the state or keep it for debugging
             # del self.conversation_states[trace_id]
         else:
-            print(f"CoordinatorAgent Warning: Received ERROR_MESSAGE for unknown trace ID: {trace_id}. Sending directly to UI.")
-            self.ui_callback({
+            logger.warning("Received ERROR_MESSAGE for unknown trace %s. Sending directly to UI.", trace_id)
+            self._enqueue_ui({
                 "type": "ERROR_MESSAGE",
                 "trace_id": trace_id,
                 "error": error_details,
                 "context": context,
+                # The file the error concerns, for upload errors that name one
+                "file_name": message.payload.get("file_name"),
                 "sender": message.sender
             })
 
-    def _send_ui_error(self, error_message: str, trace_id: str = None):
+    def _enqueue_ui(self, payload: Dict[str, Any]):
+        """
+        Buffers a UI update and arms the flush timer on the first pending item.
+        Progress updates (DROPPABLE_UI_TYPES) go into a bounded queue that drops
+        the oldest entry when full; all other updates are always kept.
+
+        Args:
+            payload (Dict[str, Any]): The UI update to deliver.
+        """
+        flush_now = False
+        with self._ui_lock:
+            if payload["type"] in self.DROPPABLE_UI_TYPES:
+                if len(self._pending_status) == self._pending_status.maxlen:
+                    self._dropped_ui_updates += 1
+                    logger.debug("UI queue full; dropped oldest progress update (%d dropped so far).",
+                                 self._dropped_ui_updates)
+                self._pending_status.append(payload)
+            else:
+                self._pending_ui.append(payload)
+            if self.batch_size and len(self._pending_ui) + len(self._pending_status) >= self.batch_size:
+                flush_now = True
+            elif self._ui_timer is None:
+                self._ui_timer = threading.Timer(self.UI_FLUSH_INTERVAL, self._flush_ui)
+                self._ui_timer.daemon = True
+                self._ui_timer.start()
+        if flush_now:
+            self._flush_ui()
+
+    def _flush_ui(self):
+        """
+        Drains all pending UI updates and delivers them as a single BATCH message.
+        Progress updates come first, so a trace's FINAL_RESPONSE always follows
+        its last partial answer.
+        """
+        with self._ui_lock:
+            items = list(self._pending_status)
+            items.extend(self._pending_ui)
+            self._pending_status.clear()
+            self._pending_ui = []
+            if self._ui_timer is not None:
+                self._ui_timer.cancel()
+                self._ui_timer = None
+        if items:
+            self.ui_callback({"type": "BATCH", "items": items})
+
+    def _send_ui_error(self, error_message: str, trace_id: Optional[int] = None):
         """Helper to send a generic error message to the UI."""
-        self.ui_callback({
+        self._enqueue_ui({
             "type": "ERROR_MESSAGE",
-            "trace_id": trace_id or str(uuid.uuid4()),
+            "trace_id": trace_id or new_trace_id(),
             "error": error_message,
             "context": "CoordinatorAgent initiated error."
         })
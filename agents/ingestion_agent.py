@@ -1,14 +1,32 @@
 # rag_chatbot/agents/ingestion_agent.py
 
+import logging
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Callable, Iterator, List, Optional, Tuple
 
 # Import BaseAgent and MCP components
 from agents.base_agent import BaseAgent
-from utils.mcp import MCPMessage, message_bus
+from utils.mcp import MCPMessage, MessageType, message_bus
 
-# Import document parsing utility
-from utils.document_parser import parse_document
+# Import the chunking utility. The document parser is imported on first use
+# (see _get_parser), because it pulls in pypdf, python-docx, python-pptx and pandas.
+from utils.text_chunker import chunk_stream
+from config import EMBEDDING_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+_parse_document_stream: Optional[Callable[[str], Iterator[str]]] = None
+
+def _get_parser() -> Callable[[str], Iterator[str]]:
+    """
+    Returns utils.document_parser.parse_document_stream, importing the parser
+    module (and the document libraries it loads) the first time it is needed.
+    """
+    global _parse_document_stream
+    if _parse_document_stream is None:
+        from utils.document_parser import parse_document_stream
+        _parse_document_stream = parse_document_stream
+    return _parse_document_stream
 
 class IngestionAgent(BaseAgent):
     """
@@ -16,29 +34,40 @@ class IngestionAgent(BaseAgent):
     and preparing their text content for further processing (chunking and embedding).
     """
     def __init__(self):
-        # Initialize the base agent with its specific name
-        super().__init__("IngestionAgent")
-        print("IngestionAgent: Initialized.")
+        # Dispatch table mapping message types to their handlers.
+        # It is built first so the message bus only delivers the types listed here.
+        self._handlers: Dict[MessageType, Callable[[MCPMessage], None]] = {
+            MessageType.UPLOAD_DOCUMENT: self._process_document_upload,
+            MessageType.UPLOAD_DOCUMENT_BATCH: self._process_document_batch,
+        }
+        # Initialize the base agent with its specific name.
+        # Several workers let multiple uploads be parsed at the same time.
+        super().__init__("IngestionAgent", max_workers=4, message_types=self._handlers.keys())
+        logger.info("IngestionAgent initialized.")
 
-    def handle_message(self, message: MCPMessage):
+    def _handle_impl(self, message: MCPMessage):
         """
         Handles incoming MCP messages relevant to document ingestion.
 
         Supported message types:
         - "UPLOAD_DOCUMENT": Triggered when a user uploads a new document.
                              Payload should contain 'file_path' and 'file_name'.
+        - "UPLOAD_DOCUMENT_BATCH": Triggered when several documents are uploaded together.
+                                   Payload contains 'files', a list of such file details.
         """
-        print(f"IngestionAgent: Received message of type '{message.type}' from {message.sender} (Trace ID: {message.trace_id})")
+        logger.debug("Received %s from %s (trace=%s)", message.type.name, message.sender, message.trace_id)
 
-        if message.type == "UPLOAD_DOCUMENT":
-            self._process_document_upload(message)
+        handler = self._handlers.get(message.type)
+        if handler:
+            handler(message)
         else:
-            print(f"IngestionAgent: Unrecognized message type: {message.type}")
+            logger.warning("Unrecognized message type: %s", message.type.name)
 
     def _process_document_upload(self, message: MCPMessage):
         """
-        Processes an UPLOAD_DOCUMENT message by parsing the document
-        and sending the raw text to the RetrievalAgent.
+        Processes an UPLOAD_DOCUMENT message by parsing the document straight
+        into chunks and sending them to the RetrievalAgent, in batches if the
+        document is large (see _parse_to_chunks).
 
         Args:
             message (MCPMessage): The UPLOAD_DOCUMENT message.
@@ -46,63 +75,177 @@ class IngestionAgent(BaseAgent):
         file_path = message.payload.get("file_path")
         file_name = message.payload.get("file_name")
         file_type = message.payload.get("file_type") # e.g., '.pdf', '.docx'
+        content_hash = message.payload.get("content_hash") # Digest of the file contents, if known
 
         if not file_path:
-            print("IngestionAgent Error: 'file_path' missing in UPLOAD_DOCUMENT payload.")
+            logger.error("'file_path' missing in UPLOAD_DOCUMENT payload.")
             return
 
-        print(f"IngestionAgent: Attempting to parse document: {file_name} ({file_path})")
-        try:
-            # Use the utility function to parse the document
-            raw_text = parse_document(file_path)
-            print(f"IngestionAgent: Successfully parsed {file_name}. Text length: {len(raw_text)} characters.")
-
-            # Prepare metadata for the document chunks
-            source_metadata = {
-                "file_name": file_name,
-                "file_type": file_type,
-                "original_path": file_path # Keep original path for debugging/reference
+        parsed = self._parse_to_chunks(message, file_path, file_name, file_type, content_hash)
+        if parsed is not None:
+            # The document fits in one batch; otherwise its batches were already sent.
+            chunks, source_metadata = parsed
+            self._send_chunk_batch(message, chunks, source_metadata, final=True)
+
+    def _send_chunk_batch(self, message: MCPMessage, chunks: List[Tuple[int, str]],
+                          source_metadata: Dict[str, Any], final: bool):
+        """
+        Sends a batch of a document's chunks to the RetrievalAgent.
+
+        Args:
+            message (MCPMessage): The upload message being processed.
+            chunks (List[Tuple[int, str]]): (start_index, chunk_text) pairs.
+            source_metadata (Dict[str, Any]): The document's source metadata.
+            final (bool): Whether this is the document's last batch.
+        """
+        # The RetrievalAgent will then only need to embed and index them.
+        # The message bus passes the payload by reference, so the chunks
+        # are not copied on their way to the RetrievalAgent.
+        response_message = MCPMessage(
+            sender=self.name,
+            receiver="RetrievalAgent", # Target the RetrievalAgent
+            type=MessageType.INGESTION_COMPLETE,
+            trace_id=message.trace_id, # Maintain the same trace ID
+            payload={
+                "chunks": chunks, # List of (start_index, chunk_text) pairs
+                "source_metadata": source_metadata,
+                "final": final
             }
+        )
+        message_bus.send_message(response_message)
+
+    def _process_document_batch(self, message: MCPMessage):
+        """
+        Processes an UPLOAD_DOCUMENT_BATCH message by parsing every document into
+        chunks and sending the chunks of all small documents to the RetrievalAgent
+        in one message. Documents with more than EMBEDDING_BATCH_SIZE chunks are
+        streamed to it in batches instead (see _parse_to_chunks). Documents that
+        fail to parse or contain no text are reported individually and left out.
+
+        Args:
+            message (MCPMessage): The UPLOAD_DOCUMENT_BATCH message.
+        """
+        files = message.payload.get("files")
+        if not files:
+            logger.error("'files' missing in UPLOAD_DOCUMENT_BATCH payload.")
+            return
+
+        documents: List[Dict[str, Any]] = []
+        for file_info in files:
+            parsed = self._parse_to_chunks(message, file_info.get("file_path"), file_info.get("file_name"),
+                                           file_info.get("file_type"), file_info.get("content_hash"))
+            if parsed is not None:
+                chunks, source_metadata = parsed
+                documents.append({"chunks": chunks, "source_metadata": source_metadata})
 
-            # Send a message to the RetrievalAgent with the raw text and metadata.
-            # The RetrievalAgent will then handle chunking and embedding.
-            response_message = MCPMessage(
-                sender=self.name,
-                receiver="RetrievalAgent", # Target the RetrievalAgent
-                type="INGESTION_COMPLETE",
-                trace_id=message.trace_id, # Maintain the same trace ID
-                payload={
-                    "raw_text": raw_text,
-                    "source_metadata": source_metadata
-                }
-            )
-            message_bus.send_message(response_message)
-
-        except ValueError as ve:
-            print(f"IngestionAgent Error: Failed to parse document {file_name}: {ve}")
-            # Optionally, send an error message back to the Coordinator or UI
-            error_message = MCPMessage(
-                sender=self.name,
-                receiver="CoordinatorAgent", # Send error back to coordinator
-                type="ERROR_MESSAGE",
-                trace_id=message.trace_id,
-                payload={
-                    "error": str(ve),
-                    "context": f"Failed to parse document: {file_name}"
-                }
-            )
-            message_bus.send_message(error_message)
+        if not documents:
+            logger.info("No document of the batch is left to send in one message.")
+            return
+
+        response_message = MCPMessage(
+            sender=self.name,
+            receiver="RetrievalAgent", # Target the RetrievalAgent
+            type=MessageType.INGESTION_BATCH_COMPLETE,
+            trace_id=message.trace_id, # Maintain the same trace ID
+            payload={"documents": documents}
+        )
+        message_bus.send_message(response_message)
+
+    def _parse_to_chunks(self, message: MCPMessage, file_path: str, file_name: str, file_type: str,
+                         content_hash: Optional[str] = None) -> Optional[Tuple[List[Tuple[int, str]], Dict[str, Any]]]:
+        """
+        Parses a document into chunks, reporting any failure to the CoordinatorAgent.
+
+        As soon as the document has more than EMBEDDING_BATCH_SIZE chunks, they are
+        sent to the RetrievalAgent in batches of that size while the document is
+        still being parsed, so embedding overlaps parsing and neither agent holds
+        all of a large document's chunks at once. Smaller documents are returned,
+        so several of them can be embedded together.
+
+        Args:
+            message (MCPMessage): The message that requested the ingestion.
+            file_path (str): The path of the document on disk.
+            file_name (str): The original name of the document.
+            file_type (str): The document's extension, e.g. '.pdf'.
+            content_hash (Optional[str]): The digest of the file contents, if known.
+
+        Returns:
+            Optional[Tuple[List[Tuple[int, str]], Dict[str, Any]]]: The (start_index, chunk_text)
+            pairs and the document's source metadata, or None if the chunks were
+            streamed, parsing failed or the document yielded no text.
+        """
+        source_metadata = self._source_metadata(file_path, file_name, file_type, content_hash)
+        logger.info("Attempting to parse document: %s (%s)", file_name, file_path)
+        batch: List[Tuple[int, str]] = []
+        num_chunks = 0
+        try:
+            # Stream the parsed pages/paragraphs directly through the chunker, so the
+            # document's full text is never materialized as a single string.
+            # A batch is only sent once the next chunk exists, so the last batch is
+            # never empty and is sent (marked final) by the caller or below.
+            for chunk in chunk_stream(_get_parser()(file_path)):
+                if len(batch) == EMBEDDING_BATCH_SIZE:
+                    self._send_chunk_batch(message, batch, source_metadata, final=False)
+                    batch = []
+                batch.append(chunk)
+                num_chunks += 1
         except Exception as e:
-            print(f"IngestionAgent Unexpected Error: {e}")
-            error_message = MCPMessage(
-                sender=self.name,
-                receiver="CoordinatorAgent",
-                type="ERROR_MESSAGE",
-                trace_id=message.trace_id,
-                payload={
-                    "error": f"An unexpected error occurred during ingestion: {e}",
-                    "context": f"Document: {file_name}"
-                }
-            )
-            message_bus.send_message(error_message)
+            self._report_parse_error(message, file_name, e)
+            return None
+        if num_chunks == 0:
+            # E.g. a scanned PDF without a text layer; there is nothing to index.
+            self._report_parse_error(message, file_name, ValueError(f"No text could be extracted from {file_name}."))
+            return None
+        logger.info("Successfully parsed %s into %d chunks.", file_name, num_chunks)
+        if num_chunks > len(batch):
+            # Some batches were streamed already; the document ends with this one.
+            self._send_chunk_batch(message, batch, source_metadata, final=True)
+            return None
+        return batch, source_metadata
+
+    @staticmethod
+    def _source_metadata(file_path: str, file_name: str, file_type: str,
+                         content_hash: Optional[str] = None) -> Dict[str, Any]:
+        """Returns the metadata attached to every chunk of a document."""
+        source_metadata = {
+            "file_name": file_name,
+            "file_type": file_type,
+            "original_path": file_path # Keep original path for debugging/reference
+        }
+        if content_hash:
+            # Stored with the chunks, so the index remembers which files it contains.
+            source_metadata["content_hash"] = content_hash
+        return source_metadata
 
+    def _report_parse_error(self, message: MCPMessage, file_name: str, error: Exception):
+        """
+        Reports a document that could not be parsed to the CoordinatorAgent.
+
+        Args:
+            message (MCPMessage): The message that requested the ingestion.
+            file_name (str): The original name of the document.
+            error (Exception): The parsing error. Parsers raise ValueError for
+                               expected failures; anything else is unexpected.
+        """
+        if isinstance(error, ValueError):
+            logger.error("Failed to parse document %s: %s", file_name, error)
+            payload = {
+                "error": str(error),
+                "context": f"Failed to parse document: {file_name}",
+                "file_name": file_name
+            }
+        else:
+            logger.error("Unexpected error while ingesting %s: %s", file_name, error, exc_info=error)
+            payload = {
+                "error": f"An unexpected error occurred during ingestion: {error}",
+                "context": f"Document: {file_name}",
+                "file_name": file_name
+            }
+        error_message = MCPMessage(
+            sender=self.name,
+            receiver="CoordinatorAgent", # Send error back to coordinator
+            type=MessageType.ERROR_MESSAGE,
+            trace_id=message.trace_id,
+            payload=payload
+        )
+        message_bus.send_message(error_message)
@@ -1,15 +1,51 @@
 # rag_chatbot/agents/llm_response_agent.py
 
-import requests
-import json
-from typing import Dict, Any, List
+import asyncio
+import logging
+import threading
+from typing import Dict, Any, List, Callable, Optional, Tuple
 
 # Import BaseAgent and MCP components
+import httpx
+import orjson
+
 from agents.base_agent import BaseAgent
-from utils.mcp import MCPMessage, message_bus
+from utils.mcp import MCPMessage, MessageType, message_bus
+from utils.cache import LRUCache, fingerprint
 
 # Import configuration settings
-from config import LLM_MODEL_NAME, GEMINI_API_KEY, GEMINI_API_URL, TOP_K_RETRIEVED_CHUNKS
+from config import (
+    LLM_MODEL_NAME, GEMINI_API_KEY, GEMINI_API_URL, TOP_K_RETRIEVED_CHUNKS,
+    GEMINI_MAX_CONNECTIONS, GEMINI_MAX_RETRIES, GEMINI_RETRY_BACKOFF, GEMINI_RETRY_STATUSES,
+    LLM_CACHE_SIZE
+)
+
+logger = logging.getLogger(__name__)
+
+def _build_prompt(prefix: str, chunks: List[str], query: str) -> str:
+    """
+    Assembles the prompt from the system prefix, the context chunks (one per line) and the query.
+
+    All pieces are gathered into one list and joined once: str.join sums the
+    lengths, allocates the result a single time and copies each piece into
+    place, so no intermediate strings are built for the context or the buffer.
+
+    Args:
+        prefix (str): The system instruction, ending where the context begins.
+        chunks (List[str]): The retrieved context chunks.
+        query (str): The user's question.
+
+    Returns:
+        str: The full prompt.
+    """
+    parts = [prefix]
+    for chunk in chunks:
+        parts.append(chunk)
+        parts.append("\n")
+    parts.append("\nQuestion: ")
+    parts.append(query)
+    parts.append("\n\nAnswer:")
+    return "".join(parts)
 
 class LLMResponseAgent(BaseAgent):
     """
@@ -17,15 +53,72 @@ class LLMResponseAgent(BaseAgent):
     1. Receiving retrieved context and the user query from the RetrievalAgent.
     2. Constructing a prompt for the Large Language Model (LLM).
     3. Calling the LLM (Gemini API) to generate an answer.
-    4. Sending the final answer and source context back to the CoordinatorAgent.
+    4. Streaming partial answers, then the final answer and source context,
+       back to the CoordinatorAgent.
     """
     def __init__(self):
-        # Initialize the base agent with its specific name
-        super().__init__("LLMResponseAgent")
-        # No direct LLM object initialization here, as we'll make direct API calls
-        print("LLMResponseAgent: Initialized. Ready to call Gemini API.")
+        # Dispatch table mapping message types to their handlers.
+        # It is built first so the message bus only delivers the types listed here.
+        self._handlers: Dict[MessageType, Callable[[MCPMessage], None]] = {
+            MessageType.RETRIEVAL_RESULT: self._schedule_response,
+        }
+        # Initialize the base agent with its specific name.
+        # Handlers only schedule coroutines on the agent's event loop (below), where
+        # the Gemini calls run concurrently, so one worker thread is enough.
+        super().__init__("LLMResponseAgent", max_workers=1, message_types=self._handlers.keys())
+        # Gemini calls run as coroutines on a dedicated event loop thread, so a slow
+        # LLM call no longer blocks the message bus and several queries can be in
+        # flight at once.
+        self._loop = asyncio.new_event_loop()
+        self._loop_thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="LLMResponseAgentLoop",
+            daemon=True
+        )
+        self._loop_thread.start()
+        # A single AsyncClient shared across the agent's lifetime keeps HTTPS
+        # connections (and TLS sessions) alive between queries, so only the first
+        # query pays for the TCP and TLS handshakes.
+        # The transport retries requests that failed to connect; transient 5xx
+        # responses are retried in _stream_answer.
+        self._client = httpx.AsyncClient(
+            http2=True,
+            transport=httpx.AsyncHTTPTransport(
+                http2=True,
+                limits=httpx.Limits(
+                    max_connections=GEMINI_MAX_CONNECTIONS,
+                    max_keepalive_connections=GEMINI_MAX_CONNECTIONS
+                ),
+                retries=GEMINI_MAX_RETRIES
+            ),
+            timeout=30.0 # 30-second timeout for the API call
+        )
+
+        # Per-call constants, computed once for the agent's lifetime.
+        # Construct the API URL with the API key (which will be provided by Canvas if empty).
+        # alt=sse makes the streaming endpoint return Server-Sent Events.
+        self._api_url = f"{GEMINI_API_URL}?alt=sse&key={GEMINI_API_KEY}"
+        self._headers = {"Content-Type": "application/json"}
+        # Define the system instruction for the LLM; the prompt prefix ends where the context begins
+        system_instruction = """You are an AI assistant designed to answer questions based on the provided context.
+        If the answer is not found in the context, state that you don't have enough information.
+        Do not make up answers."""
+        self._system_prefix = f"{system_instruction}\n\nContext:\n"
+        self._gen_config = {
+            "temperature": 0.7,
+            "topP": 0.95,
+            "topK": 50,
+            "maxOutputTokens": 500,
+        }
+        # Generated answers, keyed by the normalized query and a fingerprint of the context.
+        self._llm_cache = LRUCache(maxsize=LLM_CACHE_SIZE)
+        # Gemini calls currently in progress, keyed like the cache. Identical queries
+        # arriving while a call is in flight wait for its result instead of making
+        # their own call. Only accessed from the event loop, so no lock is needed.
+        self._inflight: Dict[Tuple[str, int], asyncio.Future] = {}
+        logger.info("LLMResponseAgent initialized. Ready to call Gemini API.")
 
-    def handle_message(self, message: MCPMessage):
+    def _handle_impl(self, message: MCPMessage):
         """
         Handles incoming MCP messages relevant to LLM response generation.
 
@@ -33,15 +126,24 @@ class LLMResponseAgent(BaseAgent):
         - "RETRIEVAL_RESULT": Triggered by RetrievalAgent after finding relevant chunks.
                               Payload contains 'query', 'retrieved_context', and 'source_metadata'.
         """
-        print(f"LLMResponseAgent: Received message of type '{message.type}' from {message.sender} (Trace ID: {message.trace_id})")
+        logger.debug("Received %s from %s (trace=%s)", message.type.name, message.sender, message.trace_id)
 
-        if message.type == "RETRIEVAL_RESULT":
-            self._generate_response(message)
+        handler = self._handlers.get(message.type)
+        if handler:
+            handler(message)
         else:
-            print(f"LLMResponseAgent: Unrecognized message type: {message.type}")
+            logger.warning("Unrecognized message type: %s", message.type.name)
 
+    def _schedule_response(self, message: MCPMessage):
+        """
+        Schedules response generation on the agent's event loop and returns immediately.
 
-    def _generate_response(self, message: MCPMessage):
+        Args:
+            message (MCPMessage): The RETRIEVAL_RESULT message.
+        """
+        asyncio.run_coroutine_threadsafe(self._generate_response(message), self._loop)
+
+    async def _generate_response(self, message: MCPMessage):
         """
         Generates a response using the LLM (Gemini API) based on the query and retrieved context.
 
@@ -53,92 +155,52 @@ class LLMResponseAgent(BaseAgent):
         source_metadata = message.payload.get("source_metadata", [])
 
         if not query:
-            print("LLMResponseAgent Error: 'query' missing in RETRIEVAL_RESULT payload.")
+            logger.error("'query' missing in RETRIEVAL_RESULT payload.")
+            return
+
+        # Without any retrieved context the LLM would only be told it lacks information,
+        # so answer directly and skip the API call.
+        if not retrieved_context:
+            self._send_no_context_answer(query, message.trace_id)
+            return
+
+        # Answer a repeated question against the same context from the cache.
+        cache_key = (query.strip().lower(), fingerprint(retrieved_context))
+        cached_answer = self._llm_cache.get(cache_key)
+        if cached_answer is not None:
+            logger.info("Answering query '%s' from the LLM cache.", query)
+            self._send_final_response(message.trace_id, cached_answer, retrieved_context, source_metadata, query)
             return
 
         # Construct the prompt for the LLM
-        context_str = "\n".join(retrieved_context)
-        
-        # Define the system instruction for the LLM
-        system_instruction = """You are an AI assistant designed to answer questions based on the provided context.
-        If the answer is not found in the context, state that you don't have enough information.
-        Do not make up answers."""
+        # The prompt combines system instruction, context, and query.
+        full_prompt = _build_prompt(self._system_prefix, retrieved_context, query)
 
         # Prepare the chat history for the Gemini API call
-        # The prompt should combine system instruction, context, and query
-        full_prompt = f"{system_instruction}\n\nContext:\n{context_str}\n\nQuestion: {query}\n\nAnswer:"
-        
-        chat_history = []
-        chat_history.append({"role": "user", "parts": [{"text": full_prompt}]})
+        chat_history = [{"role": "user", "parts": [{"text": full_prompt}]}]
 
         payload = {
             "contents": chat_history,
-            "generationConfig": {
-                "temperature": 0.7,
-                "topP": 0.95,
-                "topK": 50,
-                "maxOutputTokens": 500,
-            }
+            "generationConfig": self._gen_config
         }
 
-        # Construct the API URL with the API key (which will be provided by Canvas if empty)
-        api_url_with_key = f"{GEMINI_API_URL}?key={GEMINI_API_KEY}"
-
-        print(f"LLMResponseAgent: Calling Gemini API at {api_url_with_key} for query: '{query}'")
+        logger.info("Calling Gemini API at %s for query: '%s'", GEMINI_API_URL, query)
         try:
-            # Make the POST request to the Gemini API with a timeout
-            response = requests.post(
-                api_url_with_key,
-                headers={'Content-Type': 'application/json'},
-                data=json.dumps(payload),
-                timeout=30 # Add a 30-second timeout for the API call
-            )
-            
-            print(f"LLMResponseAgent: Received response status code: {response.status_code}")
-            response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
-            
-            result = response.json()
-            print(f"LLMResponseAgent: Received Gemini API response: {json.dumps(result, indent=2)}") # Log full response
-
-            generated_answer = "No answer generated."
-
-            # Parse the Gemini API response
-            if result.get("candidates") and len(result["candidates"]) > 0 and \
-               result["candidates"][0].get("content") and \
-               result["candidates"][0]["content"].get("parts") and \
-               len(result["candidates"][0]["content"]["parts"]) > 0:
-                generated_answer = result["candidates"][0]["content"]["parts"][0].get("text", "No text part found in response.")
-            elif result.get("error"): # Check for explicit error object in response
-                error_message = result["error"].get("message", "Unknown error from Gemini API.")
-                generated_answer = f"Error from LLM API: {error_message}"
-                print(f"LLMResponseAgent Error: Gemini API returned an error: {error_message}")
-            else:
-                print(f"LLMResponseAgent Warning: Unexpected Gemini API response structure: {result}")
-                generated_answer = f"Error: Unexpected response from LLM. Details: {json.dumps(result)}"
+            generated_answer, cacheable = await self._single_flight_answer(cache_key, payload, message.trace_id)
 
-            print(f"LLMResponseAgent: Generated answer (first 100 chars): {generated_answer[:100]}...")
+            logger.debug("Generated answer (first 100 chars): %.100s...", generated_answer)
+            if cacheable:
+                self._llm_cache.put(cache_key, generated_answer)
 
             # Send the final answer and source context back to the CoordinatorAgent
-            final_response_message = MCPMessage(
-                sender=self.name,
-                receiver="CoordinatorAgent", # Target the CoordinatorAgent
-                type="FINAL_RESPONSE",
-                trace_id=message.trace_id, # Maintain the same trace ID
-                payload={
-                    "answer": generated_answer.strip(), # Clean up whitespace
-                    "source_chunks": retrieved_context, # The actual text chunks used
-                    "source_metadata": source_metadata, # Metadata of the chunks
-                    "original_query": query
-                }
-            )
-            message_bus.send_message(final_response_message)
+            self._send_final_response(message.trace_id, generated_answer, retrieved_context, source_metadata, query)
 
-        except requests.exceptions.Timeout:
-            print(f"LLMResponseAgent Error: Gemini API request timed out after 30 seconds for query: '{query}'")
+        except httpx.TimeoutException:
+            logger.error("Gemini API request timed out after 30 seconds for query: '%s'", query)
             error_message = MCPMessage(
                 sender=self.name,
                 receiver="CoordinatorAgent",
-                type="ERROR_MESSAGE",
+                type=MessageType.ERROR_MESSAGE,
                 trace_id=message.trace_id,
                 payload={
                     "error": "LLM API request timed out. Please try again.",
@@ -146,12 +208,12 @@ class LLMResponseAgent(BaseAgent):
                 }
             )
             message_bus.send_message(error_message)
-        except requests.exceptions.RequestException as e:
-            print(f"LLMResponseAgent Error: Network or API request failed: {e}")
+        except httpx.HTTPError as e:
+            logger.error("Network or API request failed: %s", e)
             error_message = MCPMessage(
                 sender=self.name,
                 receiver="CoordinatorAgent",
-                type="ERROR_MESSAGE",
+                type=MessageType.ERROR_MESSAGE,
                 trace_id=message.trace_id,
                 payload={
                     "error": f"LLM API request failed: {e}",
@@ -159,12 +221,12 @@ class LLMResponseAgent(BaseAgent):
                 }
             )
             message_bus.send_message(error_message)
-        except json.JSONDecodeError as e:
-            print(f"LLMResponseAgent Error: Failed to parse JSON response from LLM: {e}. Raw response: {response.text if 'response' in locals() else 'N/A'}")
+        except orjson.JSONDecodeError as e:
+            logger.error("Failed to parse JSON response from LLM: %s", e)
             error_message = MCPMessage(
                 sender=self.name,
                 receiver="CoordinatorAgent",
-                type="ERROR_MESSAGE",
+                type=MessageType.ERROR_MESSAGE,
                 trace_id=message.trace_id,
                 payload={
                     "error": f"LLM response parsing failed: {e}",
@@ -173,11 +235,11 @@ class LLMResponseAgent(BaseAgent):
             )
             message_bus.send_message(error_message)
         except Exception as e:
-            print(f"LLMResponseAgent Unexpected Error: {e}")
+            logger.exception("Unexpected error while generating a response for query '%s': %s", query, e)
             error_message = MCPMessage(
                 sender=self.name,
                 receiver="CoordinatorAgent",
-                type="ERROR_MESSAGE",
+                type=MessageType.ERROR_MESSAGE,
                 trace_id=message.trace_id,
                 payload={
                     "error": f"An unexpected error occurred during LLM response generation: {e}",
@@ -186,6 +248,207 @@ class LLMResponseAgent(BaseAgent):
             )
             message_bus.send_message(error_message)
 
-    def _initialize_llm(self):
-        print("LLMResponseAgent: _initialize_llm called, but direct API calls are used for Gemini.")
-        return None
+    async def _single_flight_answer(self, cache_key: Tuple[str, int], payload: Dict[str, Any],
+                                    trace_id: int) -> Tuple[str, bool]:
+        """
+        Generates the answer for 'cache_key', sharing a single Gemini call among
+        identical queries that arrive while it is in progress.
+
+        Only the query that starts the call receives PARTIAL_RESPONSE messages;
+        the others receive the shared answer once it is complete.
+
+        Args:
+            cache_key (Tuple[str, int]): The normalized query and context fingerprint.
+            payload (Dict[str, Any]): The request body for the Gemini API.
+            trace_id (int): The trace ID of the originating query.
+
+        Returns:
+            Tuple[str, bool]: As returned by _stream_answer.
+
+        Raises:
+            Exception: Whatever the shared Gemini call raised.
+        """
+        inflight = self._inflight.get(cache_key)
+        if inflight is not None:
+            logger.info("Waiting for an identical in-flight Gemini call (trace=%s).", trace_id)
+            # shield() keeps the shared call running if this waiter is cancelled.
+            return await asyncio.shield(inflight)
+
+        inflight = self._loop.create_future()
+        self._inflight[cache_key] = inflight
+        try:
+            result = await self._stream_answer(payload, trace_id)
+            inflight.set_result(result)
+            return result
+        except Exception as e:
+            inflight.set_exception(e)
+            inflight.exception() # Mark as retrieved; there may be no other waiters
+            raise
+        finally:
+            del self._inflight[cache_key]
+            if not inflight.done():
+                inflight.cancel()
+
+    async def _stream_answer(self, payload: Dict[str, Any], trace_id: int) -> Tuple[str, bool]:
+        """
+        Calls the Gemini streaming endpoint and forwards each text delta to the
+        CoordinatorAgent as a PARTIAL_RESPONSE message as soon as it arrives.
+        Transient server errors (GEMINI_RETRY_STATUSES) are retried with exponential backoff.
+
+        Args:
+            payload (Dict[str, Any]): The request body for the Gemini API.
+            trace_id (int): The trace ID of the originating query.
+
+        Returns:
+            Tuple[str, bool]: The complete generated answer (or an error description
+                              returned by the API), and whether the answer was
+                              generated successfully and may be cached.
+
+        Raises:
+            httpx.HTTPError: If the request fails or the API returns a 4xx/5xx status.
+            orjson.JSONDecodeError: If an event's data is not valid JSON.
+        """
+        # The body is encoded with orjson, which produces bytes directly.
+        body = orjson.dumps(payload)
+        attempt = 0
+        while True:
+            # Make the POST request to the Gemini API over the pooled async client.
+            async with self._client.stream(
+                "POST",
+                self._api_url,
+                headers=self._headers,
+                content=body
+            ) as response:
+                logger.debug("Received response status code: %s", response.status_code)
+                retryable = response.status_code in GEMINI_RETRY_STATUSES and attempt < GEMINI_MAX_RETRIES
+                if not retryable:
+                    if response.is_error:
+                        await response.aread() # Load the error body so it is available in the exception
+                        response.raise_for_status() # Raise an HTTPError for bad responses (4xx or 5xx)
+                    return await self._read_events(response, trace_id)
+
+            # Transient server error: nothing has been streamed yet, so retry after a backoff.
+            delay = GEMINI_RETRY_BACKOFF * (2 ** attempt)
+            attempt += 1
+            logger.warning("Gemini API returned %s; retrying in %.1fs (attempt %d of %d).",
+                           response.status_code, delay, attempt, GEMINI_MAX_RETRIES)
+            await asyncio.sleep(delay)
+
+    async def _read_events(self, response: httpx.Response, trace_id: int) -> Tuple[str, bool]:
+        """
+        Reads the Server-Sent Events of a successful streaming response.
+
+        Args:
+            response (httpx.Response): The open streaming response.
+            trace_id (int): The trace ID of the originating query.
+
+        Returns:
+            Tuple[str, bool]: The complete generated answer (or an error description
+                              returned by the API), and whether the answer was
+                              generated successfully and may be cached.
+        """
+        answer_parts: List[str] = []
+        unexpected_result: Optional[Dict[str, Any]] = None
+        # Each Server-Sent Event carries one JSON response chunk on a "data:" line.
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            result = orjson.loads(line[5:])
+            # Log each event only when debugging; serializing it is not free.
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Received Gemini API event: %s", orjson.dumps(result, option=orjson.OPT_INDENT_2).decode())
+
+            # Parse the Gemini API response chunk
+            candidates = result.get("candidates")
+            if candidates:
+                parts = (candidates[0].get("content") or {}).get("parts") or []
+                delta = "".join(part.get("text", "") for part in parts)
+                if delta:
+                    answer_parts.append(delta)
+                    self._send_partial_response(trace_id, delta)
+            elif result.get("error"): # Check for explicit error object in response
+                error_message = result["error"].get("message", "Unknown error from Gemini API.")
+                logger.error("Gemini API returned an error: %s", error_message)
+                return f"Error from LLM API: {error_message}", False
+            else:
+                # Events without candidates (e.g. usage metadata only) carry no text.
+                logger.warning("Unexpected Gemini API response structure: %s", result)
+                unexpected_result = result
+
+        if not answer_parts and unexpected_result is not None:
+            return f"Error: Unexpected response from LLM. Details: {orjson.dumps(unexpected_result).decode()}", False
+        if not answer_parts:
+            return "No answer generated.", False
+        return "".join(answer_parts), True
+
+    def _send_partial_response(self, trace_id: int, delta: str):
+        """
+        Sends a PARTIAL_RESPONSE message carrying a newly generated piece of the answer.
+
+        Args:
+            trace_id (int): The trace ID of the originating query.
+            delta (str): The text generated since the previous partial response.
+        """
+        partial_response_message = MCPMessage(
+            sender=self.name,
+            receiver="CoordinatorAgent",
+            type=MessageType.PARTIAL_RESPONSE,
+            trace_id=trace_id,
+            payload={"delta": delta}
+        )
+        message_bus.send_message(partial_response_message)
+
+    def _send_final_response(self, trace_id: int, answer: str, source_chunks: List[str],
+                             source_metadata: List[Dict[str, Any]], query: str):
+        """
+        Sends a FINAL_RESPONSE message with the answer and its source context to the CoordinatorAgent.
+
+        Args:
+            trace_id (int): The trace ID of the originating query.
+            answer (str): The generated answer.
+            source_chunks (List[str]): The text chunks used to produce the answer.
+            source_metadata (List[Dict[str, Any]]): Metadata of the chunks.
+            query (str): The user's original question.
+        """
+        final_response_message = MCPMessage(
+            sender=self.name,
+            receiver="CoordinatorAgent", # Target the CoordinatorAgent
+            type=MessageType.FINAL_RESPONSE,
+            trace_id=trace_id, # Maintain the same trace ID
+            payload={
+                "answer": answer.strip(), # Clean up whitespace
+                "source_chunks": source_chunks, # The actual text chunks used
+                "source_metadata": source_metadata, # Metadata of the chunks
+                "original_query": query
+            }
+        )
+        message_bus.send_message(final_response_message)
+
+    def _send_no_context_answer(self, query: str, trace_id: int):
+        """
+        Answers a query for which no context was retrieved, without calling the LLM.
+
+        Args:
+            query (str): The user's original question.
+            trace_id (int): The trace ID of the originating query.
+        """
+        logger.info("No context retrieved for query '%s'. Skipping Gemini API call.", query)
+        self._send_final_response(
+            trace_id,
+            "I don't have enough information to answer that question. "
+            "Please upload a document that covers this topic.",
+            [],
+            [],
+            query
+        )
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stops the agent's worker thread, closes the HTTP client and stops the event loop.
+
+        Args:
+            wait (bool): Whether to wait for messages already queued to be processed.
+        """
+        super().shutdown(wait=wait)
+        asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
@@ -1,14 +1,25 @@
 # rag_chatbot/agents/retrieval_agent.py
 
-from typing import Dict, Any, List
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Any, List, Callable, Optional, Tuple
 
 # Import BaseAgent and MCP components
 from agents.base_agent import BaseAgent
-from utils.mcp import MCPMessage, message_bus
+from utils.mcp import MCPMessage, MessageType, message_bus
 
-# Import the VectorStoreManager
+# Import the VectorStoreManager and the query caches
 from utils.vector_store_manager import VectorStoreManager
+from utils.cache import LRUCache
+from utils.semantic_cache import SemanticCache
+from utils.rerank import mmr_rerank
 from config import TOP_K_RETRIEVED_CHUNKS # Import the configuration for top_k
+from config import QUERY_CACHE_SIZE, QUERY_CACHE_TTL, SEMANTIC_CACHE_THRESHOLD, QUERY_EMBEDDING_CACHE_SIZE
+from config import RETRIEVAL_BATCH_SIZE, RETRIEVAL_MAX_WAIT_MS
+from config import RERANK_ENABLED, RERANK_FETCH_K, RERANK_LAMBDA
+
+logger = logging.getLogger(__name__)
 
 class RetrievalAgent(BaseAgent):
     """
@@ -18,122 +29,446 @@ class RetrievalAgent(BaseAgent):
     2. Receiving user queries from CoordinatorAgent and retrieving relevant chunks.
     """
     def __init__(self):
-        # Initialize the base agent with its specific name
-        super().__init__("RetrievalAgent")
-        # Initialize the VectorStoreManager, which handles embeddings and FAISS operations.
-        self.vector_store_manager = VectorStoreManager()
-        print("RetrievalAgent: Initialized with VectorStoreManager.")
+        # Dispatch table mapping message types to their handlers.
+        # It is built first so the message bus only delivers the types listed here.
+        self._handlers: Dict[MessageType, Callable[[MCPMessage], None]] = {
+            MessageType.INGESTION_COMPLETE: self._add_documents_to_store,
+            MessageType.INGESTION_BATCH_COMPLETE: self._add_document_batch_to_store,
+            MessageType.QUERY_REQUEST: self._enqueue_query,
+            MessageType.CACHE_STATS: self._report_cache_stats,
+        }
+        # Initialize the base agent with its specific name.
+        # Its single worker answers queries (and cache statistics requests) in order.
+        super().__init__("RetrievalAgent", max_workers=1, message_types=self._handlers.keys())
+        # Documents are indexed on a second single-worker pool, so embedding a large
+        # upload does not hold up queries; the VectorStoreManager only locks the index
+        # for the actual FAISS add and search. Batches of one document stay in order.
+        self._ingest_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{self.name}-ingest")
+        # The VectorStoreManager handles embeddings and FAISS operations. Loading the
+        # embedding model and the index takes seconds, so it is the query worker's
+        # first task rather than part of startup: the UI is up meanwhile, query
+        # handlers run after it on the same worker, and ingestion waits for it.
+        self.vector_store_manager: Optional[VectorStoreManager] = None
+        self._vector_store_ready = self._executor.submit(self._load_vector_store)
+        self._vector_store_ready.add_done_callback(self._log_load_failure)
+        # Two-tier cache of retrieval results, as (context_texts, source_info) pairs.
+        # The exact cache is keyed on the query text. The semantic cache reuses the
+        # result of a previous query whose embedding is nearly identical; it is
+        # created on first use, once the embedding dimension is known.
+        self._exact_cache = LRUCache(maxsize=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+        self._semantic_cache: Optional[SemanticCache] = None
+        self._cache_stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "embedding_hits": 0}
+        # Query embeddings by query text. Unlike the result caches, it stays valid
+        # when documents are added (the embedding model does not change), so a
+        # question asked again after an upload still skips the forward pass.
+        self._embedding_cache = LRUCache(maxsize=QUERY_EMBEDDING_CACHE_SIZE)
+        # Incremented whenever the caches are invalidated. A search that overlapped
+        # an index update does not cache its (possibly outdated) results.
+        self._cache_generation = 0
+        # Queries arriving close together are answered as one batch: one embedding
+        # call and one FAISS search for all of them.
+        self._pending_queries: List[MCPMessage] = []
+        self._query_lock = threading.Lock()
+        self._query_timer: Optional[threading.Timer] = None
+        logger.info("RetrievalAgent initialized; loading VectorStoreManager in the background.")
+
+    # Message types handled on the ingestion pool.
+    _INGESTION_TYPES = frozenset({MessageType.INGESTION_COMPLETE, MessageType.INGESTION_BATCH_COMPLETE})
 
     def handle_message(self, message: MCPMessage):
+        """
+        Queues an incoming MCPMessage on the ingestion pool (for new chunks) or on
+        the query worker (for everything else) and returns immediately.
+
+        Args:
+            message (MCPMessage): The incoming message to be processed.
+        """
+        if message.type in self._INGESTION_TYPES:
+            future = self._ingest_executor.submit(self._handle_ingestion, message)
+            future.add_done_callback(lambda f: self._log_handler_failure(f, message))
+        else:
+            super().handle_message(message)
+
+    def _handle_ingestion(self, message: MCPMessage):
+        """Runs on the ingestion pool once the VectorStoreManager has loaded."""
+        self._vector_store_ready.result()
+        self._handle_impl(message)
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stops accepting new messages and releases the query and ingestion workers,
+        then saves chunks not yet written to disk.
+
+        Args:
+            wait (bool): Whether to wait for messages already queued to be processed.
+        """
+        self._ingest_executor.shutdown(wait=wait)
+        super().shutdown(wait=wait)
+        if self.vector_store_manager is not None:
+            self.vector_store_manager.flush()
+
+    def _load_vector_store(self):
+        """Creates the VectorStoreManager and warms up the embedding model."""
+        self.vector_store_manager = VectorStoreManager()
+        # The first call loads the embedding model (unless another session already
+        # did) and pays for its lazy initialization (tokenizer caches, CUDA context
+        # and kernel selection); pay it now instead of on the first upload or question.
+        self.vector_store_manager.embed_query("warmup")
+        logger.info("VectorStoreManager loaded and embedding model warmed up.")
+
+    @staticmethod
+    def _log_load_failure(future: Future):
+        """Logs an exception raised while loading the VectorStoreManager."""
+        exc = future.exception()
+        if exc is not None:
+            logger.error("Failed to load the vector store: %s", exc, exc_info=exc)
+
+    def _handle_impl(self, message: MCPMessage):
         """
         Handles incoming MCP messages relevant to document retrieval and indexing.
 
         Supported message types:
-        - "INGESTION_COMPLETE": Triggered by IngestionAgent after parsing a document.
-                                Payload contains 'raw_text' and 'source_metadata'.
+        - "INGESTION_COMPLETE": Triggered by IngestionAgent for each batch of a document's chunks.
+                                Payload contains 'chunks', 'source_metadata' and 'final',
+                                which marks the document's last batch.
+        - "INGESTION_BATCH_COMPLETE": Triggered by IngestionAgent after parsing several documents.
+                                      Payload contains 'documents', a list of
+                                      {'chunks', 'source_metadata'} dicts.
         - "QUERY_REQUEST": Triggered by CoordinatorAgent when a user asks a question.
-                           Payload contains 'query'.
+                           Payload contains 'query'. Queries are answered in small batches.
+        - "CACHE_STATS": Requests the query cache statistics, which are sent back
+                         to the sender in a "CACHE_STATS" message.
         """
-        print(f"RetrievalAgent: Received message of type '{message.type}' from {message.sender} (Trace ID: {message.trace_id})")
+        logger.debug("Received %s from %s (trace=%s)", message.type.name, message.sender, message.trace_id)
 
-        if message.type == "INGESTION_COMPLETE":
-            self._add_documents_to_store(message)
-        elif message.type == "QUERY_REQUEST":
-            self._retrieve_chunks_for_query(message)
+        handler = self._handlers.get(message.type)
+        if handler:
+            handler(message)
         else:
-            print(f"RetrievalAgent: Unrecognized message type: {message.type}")
+            logger.warning("Unrecognized message type: %s", message.type.name)
 
     def _add_documents_to_store(self, message: MCPMessage):
         """
-        Adds parsed document text (chunks) to the vector store.
+        Adds a batch of parsed document chunks to the vector store.
+
+        A document arrives in several batches, which are embedded as they arrive;
+        the index is saved to disk after a final batch, once enough chunks have
+        accumulated since the last save.
 
         Args:
             message (MCPMessage): The INGESTION_COMPLETE message.
         """
-        raw_text = message.payload.get("raw_text")
+        chunks = message.payload.get("chunks")
         source_metadata = message.payload.get("source_metadata", {})
+        final = message.payload.get("final", True)
 
-        if not raw_text:
-            print("RetrievalAgent Error: 'raw_text' missing in INGESTION_COMPLETE payload.")
+        if not chunks:
+            logger.error("'chunks' missing in INGESTION_COMPLETE payload.")
             return
 
-        print(f"RetrievalAgent: Adding document '{source_metadata.get('file_name', 'unknown')}' to vector store.")
+        logger.debug("Adding %d chunks of document '%s' to vector store.",
+                     len(chunks), source_metadata.get("file_name", "unknown"))
         try:
-            # Use the VectorStoreManager to split text, generate embeddings, and add to FAISS.
-            added_documents = self.vector_store_manager.add_documents_to_index(raw_text, source_metadata)
+            # Use the VectorStoreManager to generate embeddings and add the chunks to FAISS.
+            added_ids = self.vector_store_manager.add_chunks_to_index(chunks, source_metadata, save=final)
             
-            if added_documents:
-                print(f"RetrievalAgent: Successfully added {len(added_documents)} chunks to vector store.")
+            if added_ids:
+                logger.info("Successfully added %d chunks to vector store.", len(added_ids))
+                # Cached retrieval results may no longer be the best matches.
+                self._invalidate_query_caches()
                 # Optionally, send a confirmation message back to Coordinator or log.
             else:
-                print("RetrievalAgent: No documents were added to the vector store.")
+                logger.warning("No documents were added to the vector store.")
 
         except Exception as e:
-            print(f"RetrievalAgent Error: Failed to add documents to vector store: {e}")
+            logger.error("Failed to add documents to vector store: %s", e)
             # Send an error message back to the CoordinatorAgent
             error_message = MCPMessage(
                 sender=self.name,
                 receiver="CoordinatorAgent",
-                type="ERROR_MESSAGE",
+                type=MessageType.ERROR_MESSAGE,
                 trace_id=message.trace_id,
                 payload={
                     "error": str(e),
-                    "context": f"Failed to add document '{source_metadata.get('file_name', 'unknown')}' to vector store."
+                    "context": f"Failed to add document '{source_metadata.get('file_name', 'unknown')}' to vector store.",
+                    "file_name": source_metadata.get("file_name")
                 }
             )
             message_bus.send_message(error_message)
 
-    def _retrieve_chunks_for_query(self, message: MCPMessage):
+    def _add_document_batch_to_store(self, message: MCPMessage):
         """
-        Retrieves relevant text chunks from the vector store based on a user query.
+        Adds the chunks of several parsed documents to the vector store in a single
+        embedding pass.
 
         Args:
-            message (MCPMessage): The QUERY_REQUEST message.
+            message (MCPMessage): The INGESTION_BATCH_COMPLETE message.
         """
-        query = message.payload.get("query")
+        documents = message.payload.get("documents")
 
-        if not query:
-            print("RetrievalAgent Error: 'query' missing in QUERY_REQUEST payload.")
+        if not documents:
+            logger.error("'documents' missing in INGESTION_BATCH_COMPLETE payload.")
             return
 
-        print(f"RetrievalAgent: Retrieving chunks for query: '{query}'")
+        file_names = ", ".join(doc["source_metadata"].get("file_name", "unknown") for doc in documents)
+        logger.info("Adding %d documents to vector store: %s", len(documents), file_names)
         try:
-            # Use the VectorStoreManager to perform the similarity search.
-            # TOP_K_RETRIEVED_CHUNKS is defined in config.py
-            retrieved_chunks = self.vector_store_manager.retrieve_relevant_chunks(query, k=TOP_K_RETRIEVED_CHUNKS)
-            
-            # Extract the text content and metadata from the retrieved LangChain Document objects
-            context_texts = [doc.page_content for doc in retrieved_chunks]
-            source_info = [doc.metadata for doc in retrieved_chunks] # Keep metadata for source context
+            added_ids = self.vector_store_manager.add_chunk_batches_to_index(
+                [(doc["chunks"], doc["source_metadata"]) for doc in documents]
+            )
 
-            print(f"RetrievalAgent: Retrieved {len(context_texts)} chunks for query.")
+            if added_ids:
+                logger.info("Successfully added %d chunks to vector store.", len(added_ids))
+                # Cached retrieval results may no longer be the best matches.
+                self._invalidate_query_caches()
+            else:
+                logger.warning("No documents were added to the vector store.")
+
+        except Exception as e:
+            logger.error("Failed to add documents to vector store: %s", e)
+            # Send an error message back to the CoordinatorAgent
+            error_message = MCPMessage(
+                sender=self.name,
+                receiver="CoordinatorAgent",
+                type=MessageType.ERROR_MESSAGE,
+                trace_id=message.trace_id,
+                payload={
+                    "error": str(e),
+                    "context": f"Failed to add documents '{file_names}' to vector store."
+                }
+            )
+            message_bus.send_message(error_message)
 
+    def is_document_indexed(self, content_hash: str) -> bool:
+        """
+        Checks whether a file with the given contents has already been added to
+        the vector store. Unlike the message handlers, this may be called from
+        any thread, so the UI can skip re-uploads before sending them.
+
+        It never blocks: until the initial load has finished, or if it failed,
+        files are reported as not indexed. The check only saves work, and the
+        ingestion of an indexed file still skips all its chunks as duplicates.
+
+        Args:
+            content_hash (str): The digest of the file contents (utils.cache.content_hash).
+
+        Returns:
+            bool: True if the file's chunks are known to be indexed already.
+        """
+        if not self._vector_store_ready.done() or self._vector_store_ready.exception() is not None:
+            return False
+        return self.vector_store_manager.is_document_indexed(content_hash)
+
+    def _enqueue_query(self, message: MCPMessage):
+        """
+        Adds a QUERY_REQUEST to the pending batch. The batch is processed once it
+        holds RETRIEVAL_BATCH_SIZE queries, or RETRIEVAL_MAX_WAIT_MS after its
+        first query arrived, whichever comes first.
+
+        Args:
+            message (MCPMessage): The QUERY_REQUEST message.
+        """
+        flush_now = False
+        with self._query_lock:
+            self._pending_queries.append(message)
+            if len(self._pending_queries) >= RETRIEVAL_BATCH_SIZE:
+                flush_now = True
+            elif self._query_timer is None:
+                self._query_timer = threading.Timer(RETRIEVAL_MAX_WAIT_MS / 1000, self._schedule_query_flush)
+                self._query_timer.daemon = True
+                self._query_timer.start()
+        if flush_now:
+            self._flush_queries()
+
+    def _schedule_query_flush(self):
+        """
+        Runs on the timer thread and hands the batch to the agent's query worker,
+        so batches are processed one at a time, in order.
+        """
+        try:
+            self._executor.submit(self._flush_queries)
+        except RuntimeError:
+            logger.debug("RetrievalAgent is shut down; pending queries dropped.")
+
+    def _flush_queries(self):
+        """Drains the pending queries and retrieves chunks for all of them at once."""
+        with self._query_lock:
+            messages = self._pending_queries
+            self._pending_queries = []
+            if self._query_timer is not None:
+                self._query_timer.cancel()
+                self._query_timer = None
+        if messages:
+            self._retrieve_chunks_for_queries(messages)
+
+    def _retrieve_chunks_for_queries(self, messages: List[MCPMessage]):
+        """
+        Retrieves relevant text chunks from the vector store for a batch of user queries.
+        Results are served from the query caches when possible; the remaining
+        queries are embedded together and searched with a single FAISS call.
+
+        Args:
+            messages (List[MCPMessage]): The QUERY_REQUEST messages.
+        """
+        results: Dict[int, Tuple[List[str], List[Dict[str, Any]]]] = {}
+        misses: List[Tuple[int, str]] = [] # (position in messages, query)
+        for position, message in enumerate(messages):
+            query = message.payload.get("query")
+            if not query:
+                logger.error("'query' missing in QUERY_REQUEST payload.")
+                continue
+            logger.info("Retrieving chunks for query: '%s'", query)
+            cached = self._exact_cache.get(query)
+            if cached is not None:
+                self._cache_stats["exact_hits"] += 1
+                logger.debug("Exact query cache hit for '%s'.", query)
+                results[position] = cached
+            else:
+                misses.append((position, query))
+
+        try:
+            if misses:
+                self._resolve_cache_misses(misses, results)
+        except Exception as e:
+            logger.error("Failed to retrieve chunks for %d queries: %s", len(misses), e)
+            # Send an error message back to the CoordinatorAgent for each affected query
+            for position, query in misses:
+                error_message = MCPMessage(
+                    sender=self.name,
+                    receiver="CoordinatorAgent",
+                    type=MessageType.ERROR_MESSAGE,
+                    trace_id=messages[position].trace_id,
+                    payload={
+                        "error": str(e),
+                        "context": f"Failed to retrieve information for query: '{query}'"
+                    }
+                )
+                message_bus.send_message(error_message)
+
+        for position, (context_texts, source_info) in results.items():
+            message = messages[position]
+            logger.debug("Retrieved %d chunks for query.", len(context_texts))
             # Send the retrieved context and the original query to the LLMResponseAgent.
             response_message = MCPMessage(
                 sender=self.name,
                 receiver="LLMResponseAgent", # Target the LLMResponseAgent
-                type="RETRIEVAL_RESULT",
+                type=MessageType.RETRIEVAL_RESULT,
                 trace_id=message.trace_id, # Maintain the same trace ID
                 payload={
-                    "query": query,
+                    "query": message.payload["query"],
                     "retrieved_context": context_texts, # List of strings
                     "source_metadata": source_info # List of dicts
                 }
             )
             message_bus.send_message(response_message)
 
-        except Exception as e:
-            print(f"RetrievalAgent Error: Failed to retrieve chunks for query '{query}': {e}")
-            # Send an error message back to the CoordinatorAgent
-            error_message = MCPMessage(
-                sender=self.name,
-                receiver="CoordinatorAgent",
-                type="ERROR_MESSAGE",
-                trace_id=message.trace_id,
-                payload={
-                    "error": str(e),
-                    "context": f"Failed to retrieve information for query: '{query}'"
-                }
+    def _resolve_cache_misses(self, misses: List[Tuple[int, str]],
+                              results: Dict[int, Tuple[List[str], List[Dict[str, Any]]]]):
+        """
+        Embeds the queries that missed the exact cache in one call, answers those
+        that hit the semantic cache, and searches the vector store for the rest in
+        one batched search. Results are cached and stored in 'results'.
+
+        Args:
+            misses (List[Tuple[int, str]]): (position, query) pairs to resolve.
+            results (Dict[int, Tuple[List[str], List[Dict[str, Any]]]]): Retrieval
+                results by position, updated in place.
+        """
+        # The query embeddings serve both the semantic cache and the search.
+        query_embeddings = self._embed_queries([query for _, query in misses])
+        if self._semantic_cache is None:
+            self._semantic_cache = SemanticCache(
+                dimension=len(query_embeddings[0]),
+                maxsize=QUERY_CACHE_SIZE,
+                threshold=SEMANTIC_CACHE_THRESHOLD,
+                ttl=QUERY_CACHE_TTL
             )
-            message_bus.send_message(error_message)
 
+        to_search: List[Tuple[int, str, List[float]]] = []
+        for (position, query), query_embedding in zip(misses, query_embeddings):
+            cached = self._semantic_cache.get(query_embedding)
+            if cached is not None:
+                self._cache_stats["semantic_hits"] += 1
+                logger.debug("Semantic query cache hit for '%s'.", query)
+                results[position] = cached
+                self._exact_cache.put(query, cached)
+            else:
+                self._cache_stats["misses"] += 1
+                to_search.append((position, query, query_embedding))
+
+        if not to_search:
+            return
+        generation = self._cache_generation
+        search_embeddings = [query_embedding for _, _, query_embedding in to_search]
+        if RERANK_ENABLED:
+            # Fetch more candidates than needed and keep a relevant but diverse subset.
+            retrieved_batches = []
+            for (_, _, query_embedding), (candidates, candidate_embeddings) in zip(
+                    to_search, self.vector_store_manager.retrieve_candidates_batch(search_embeddings, k=RERANK_FETCH_K)):
+                selected = mmr_rerank(query_embedding, candidate_embeddings,
+                                      lambda_=RERANK_LAMBDA, k=TOP_K_RETRIEVED_CHUNKS)
+                retrieved_batches.append([candidates[i] for i in selected])
+        else:
+            # TOP_K_RETRIEVED_CHUNKS is defined in config.py
+            retrieved_batches = self.vector_store_manager.retrieve_relevant_chunks_batch(
+                search_embeddings, k=TOP_K_RETRIEVED_CHUNKS
+            )
+        for (position, query, query_embedding), retrieved_chunks in zip(to_search, retrieved_batches):
+            # Extract the text content and metadata from the retrieved LangChain Document objects
+            context_texts = [doc.page_content for doc in retrieved_chunks]
+            source_info = [doc.metadata for doc in retrieved_chunks] # Keep metadata for source context
+            result = (context_texts, source_info)
+            results[position] = result
+            if generation == self._cache_generation:
+                self._semantic_cache.put(query_embedding, result)
+                self._exact_cache.put(query, result)
+
+    def _embed_queries(self, queries: List[str]) -> List[Any]:
+        """
+        Returns the embedding of each query, from the embedding cache where possible;
+        the remaining queries are embedded in a single call.
+
+        Args:
+            queries (List[str]): The queries to embed.
+
+        Returns:
+            List[Any]: One embedding (a float32 vector) per query, in order.
+        """
+        embeddings = [self._embedding_cache.get(query) for query in queries]
+        to_embed = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        self._cache_stats["embedding_hits"] += len(queries) - len(to_embed)
+        if to_embed:
+            computed = self.vector_store_manager.embed_queries([queries[i] for i in to_embed])
+            for i, embedding in zip(to_embed, computed):
+                embeddings[i] = embedding
+                self._embedding_cache.put(queries[i], embedding)
+        return embeddings
+
+    def _invalidate_query_caches(self):
+        """Discards all cached retrieval results, e.g. after the index has changed."""
+        self._cache_generation += 1
+        self._exact_cache.clear()
+        if self._semantic_cache is not None:
+            self._semantic_cache.clear()
+        logger.debug("Query caches invalidated.")
+
+    def _report_cache_stats(self, message: MCPMessage):
+        """
+        Sends the query cache statistics back to the sender of a CACHE_STATS message.
+
+        Args:
+            message (MCPMessage): The CACHE_STATS request.
+        """
+        stats_message = MCPMessage(
+            sender=self.name,
+            receiver=message.sender,
+            type=MessageType.CACHE_STATS,
+            trace_id=message.trace_id,
+            payload={
+                **self._cache_stats,
+                "exact_entries": len(self._exact_cache),
+                "embedding_entries": len(self._embedding_cache),
+                "semantic_entries": len(self._semantic_cache) if self._semantic_cache is not None else 0
+            }
+        )
+        message_bus.send_message(stats_message)
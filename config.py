@@ -7,11 +7,99 @@ GEMINI_API_KEY = "" # Leave as empty string as per instructions
 # Embedding Model Configuration
 # Using a local Sentence Transformers model for embeddings
 EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2" # A good balance of performance and size
+# EMBEDDING_BACKEND: How the embedding model is run.
+# "torch" runs it with sentence-transformers. "onnx-int8" runs an int8-quantized
+# ONNX export on the CPU with ONNX Runtime (requires 'optimum[onnxruntime]'); it is
+# several times faster on CPUs with int8 dot-product instructions. "model2vec" uses
+# the static model EMBEDDING_MODEL2VEC_NAME instead (requires 'model2vec'): no
+# transformer forward pass at all, for CPU-only deployments where latency matters
+# more than retrieval quality. Vectors differ between backends (model2vec's also
+# have a different size), so rebuild the index after switching.
+EMBEDDING_BACKEND = "torch"
+# The "torch" backend runs on a CUDA GPU when one is available, otherwise on the CPU.
+# EMBEDDING_DTYPE: Precision of the "torch" backend. "fp16" halves memory traffic on
+# a CUDA GPU; without one the model stays at "fp32", which is faster on CPUs.
+EMBEDDING_DTYPE = "fp16"
+# The quantized ONNX file used by the "onnx-int8" backend, within the model repository.
+# None picks the export matching this CPU (AVX-512 VNNI, AVX-512, AVX2 or ARM64).
+# If the model cannot be loaded, the "torch" backend is used instead.
+EMBEDDING_ONNX_FILE = None
+# EMBEDDING_ONNX_SESSIONS: Number of ONNX Runtime sessions of the "onnx-int8" backend,
+# each using an equal share of the CPU cores. Batches and concurrent queries run on
+# separate sessions in parallel. None uses one per CPU core, up to 4.
+EMBEDDING_ONNX_SESSIONS = None
+# The Model2Vec model used by the "model2vec" backend (256-dimensional embeddings).
+# If it cannot be loaded, loading the index fails: unlike "onnx-int8", this backend
+# cannot fall back to "torch", whose embeddings have a different size.
+EMBEDDING_MODEL2VEC_NAME = "minishlab/potion-base-8M"
+
+# Number of chunks embedded per forward pass of the embedding model.
+EMBEDDING_BATCH_SIZE = 64
+# EMBEDDING_BATCH_SIZE_GPU: The same, when the model runs on a CUDA GPU, which needs
+# larger batches to keep its cores busy.
+EMBEDDING_BATCH_SIZE_GPU = 128
 
 # Vector Store Configuration
 # Path to save/load the FAISS index
 FAISS_INDEX_PATH = "faiss_index.bin"
 
+# FAISS_QUANTIZER: "flat" stores full float32 vectors. "sq8" and "pq" switch the
+# index to a compressed IVF index once it holds FAISS_IVF_MIN_VECTORS vectors, so a
+# query only scans FAISS_NPROBE clusters:
+# - "sq8" (IndexIVFScalarQuantizer) stores 8 bits per dimension: 4x less memory,
+#   at a small cost in recall.
+# - "pq" (IndexIVFPQ) stores FAISS_PQ_M bytes per vector (48 instead of 1536 for
+#   384-dimensional embeddings), at a larger cost in recall.
+# - "pq-fastscan" (IndexIVFPQFastScan) stores FAISS_FASTSCAN_M 4-bit codes per
+#   vector and scans them 32 at a time with SIMD table lookups (AVX2/NEON), which
+#   makes queries several times faster than "pq" at the same memory footprint.
+# Smaller corpora stay on the exact flat index. The IVF index is trained once, on
+# the vectors it is converted from (at most FAISS_TRAIN_MAX_VECTORS of them).
+FAISS_QUANTIZER = "sq8"
+FAISS_IVF_MIN_VECTORS = 1000
+# FAISS_PQ_M: Number of sub-quantizers of the "pq" index; must divide the embedding dimension.
+FAISS_PQ_M = 48
+# FAISS_FASTSCAN_M: Number of 4-bit sub-quantizers of the "pq-fastscan" index; must
+# divide the embedding dimension. 96 codes take the same 48 bytes as FAISS_PQ_M = 48.
+FAISS_FASTSCAN_M = 96
+# FAISS_IVF_NLIST: Number of inverted lists (clusters) of the IVF index.
+FAISS_IVF_NLIST = 100
+# FAISS_NPROBE: Number of inverted lists scanned per query.
+FAISS_NPROBE = 8
+# FAISS_TRAIN_MAX_VECTORS: At most this many vectors are used to train the index.
+FAISS_TRAIN_MAX_VECTORS = 10000
+# FAISS_MMAP: Memory-map a saved IVF index read-only at startup instead of reading
+# it into RAM. It is read fully the first time documents are added to it.
+FAISS_MMAP = True
+# FAISS_PREFETCH_LISTS: With a memory-mapped IVF index, look up which inverted lists
+# a query batch will probe and ask the kernel to read them in (madvise WILLNEED)
+# before the search scans them, so page faults on a cold cache overlap instead of
+# stalling the scan one list at a time. Linux and macOS only.
+FAISS_PREFETCH_LISTS = True
+# Saving writes the whole index and docstore, so it is deferred while documents
+# keep arriving: the index is saved once FAISS_SAVE_EVERY_CHUNKS chunks were added
+# since the last save, or FAISS_SAVE_INTERVAL seconds after the first unsaved one.
+# Unsaved chunks are also written when the application exits.
+FAISS_SAVE_EVERY_CHUNKS = 256
+FAISS_SAVE_INTERVAL = 30.0
+# FAISS_BINARY_PREFILTER: Keep a 1-bit-per-dimension copy of every embedding (its
+# signs, 32x smaller than float32) in a binary index. A query first shortlists
+# FAISS_BINARY_PREFILTER_FACTOR * k chunks by Hamming distance (popcount), and only
+# those are scored exactly against the main index's stored vectors.
+FAISS_BINARY_PREFILTER = False
+FAISS_BINARY_PREFILTER_FACTOR = 10
+
+# Document Parsing Configuration
+# PDFs with at least PDF_PARALLEL_MIN_PAGES pages have their text extracted in
+# parallel worker processes, PDF_PAGES_PER_TASK pages at a time.
+PDF_PARALLEL_MIN_PAGES = 8
+PDF_PAGES_PER_TASK = 16
+# PDF_PARSE_WORKERS: Number of worker processes. None uses one per CPU core.
+PDF_PARSE_WORKERS = None
+# CSV_BLOCK_SIZE: Bytes of a CSV file read (and converted to text) at a time when
+# pyarrow is installed.
+CSV_BLOCK_SIZE = 8 << 20 # 8 MiB
+
 # Document Chunking Parameters
 # These values are crucial for effective retrieval.
 # CHUNK_SIZE: The maximum number of characters in each text chunk.
@@ -20,10 +108,77 @@ CHUNK_SIZE = 1000
 # This helps maintain context across chunks.
 CHUNK_OVERLAP = 200
 
+# Chunk Deduplication
+# Chunks whose text matches an indexed chunk (ignoring case and whitespace) are never
+# embedded again. CHUNK_NEAR_DUP_THRESHOLD additionally skips chunks whose estimated
+# Jaccard similarity (over word 3-shingles, using MinHash LSH) to an indexed chunk
+# reaches the threshold, e.g. 0.9. This requires 'datasketch' and can drop chunks
+# that differ only in a few words or numbers, so it is disabled (None) by default.
+CHUNK_NEAR_DUP_THRESHOLD = None
+# CHUNK_MINHASH_PERMUTATIONS: Signature size; more permutations estimate similarity more precisely.
+CHUNK_MINHASH_PERMUTATIONS = 64
+
 # Large Language Model (LLM) Configuration
 # Using Gemini 2.0 Flash model
 LLM_MODEL_NAME = "gemini-2.0-flash" # <--- CHANGED TO GEMINI MODEL NAME
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent" # <--- ADDED GEMINI API URL
+# Streaming endpoint: answers are delivered incrementally as Server-Sent Events.
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:streamGenerateContent"
+
+# Connection pool and retry policy for Gemini API calls.
+# GEMINI_MAX_CONNECTIONS: The maximum number of pooled (keep-alive) connections.
+GEMINI_MAX_CONNECTIONS = 32
+# GEMINI_MAX_RETRIES: How many times a request is retried after a connection failure
+# or a transient server error (GEMINI_RETRY_STATUSES).
+GEMINI_MAX_RETRIES = 2
+# GEMINI_RETRY_BACKOFF: Base delay in seconds; retry n waits GEMINI_RETRY_BACKOFF * 2**n.
+GEMINI_RETRY_BACKOFF = 0.5
+GEMINI_RETRY_STATUSES = (502, 503, 504)
+
+# LLM_CACHE_SIZE: How many generated answers are remembered. A question asked again
+# against the same retrieved context is answered from this cache without calling the LLM.
+LLM_CACHE_SIZE = 512
 
 # Maximum number of retrieved chunks to pass to the LLM
-TOP_K_RETRIEVED_CHUNKS = 4
\ No newline at end of file
+TOP_K_RETRIEVED_CHUNKS = 4
+
+# Reranking Configuration
+# RERANK_ENABLED: Rerank retrieved chunks with Maximal Marginal Relevance (MMR), so the
+# LLM receives relevant chunks that do not repeat each other.
+RERANK_ENABLED = False
+# RERANK_FETCH_K: Number of candidate chunks retrieved per query before reranking.
+RERANK_FETCH_K = 20
+# RERANK_LAMBDA: 1.0 ranks purely by relevance, 0.0 purely by diversity.
+RERANK_LAMBDA = 0.5
+
+# Query Batching Configuration
+# Queries arriving close together are embedded and searched as one batch.
+# RETRIEVAL_BATCH_SIZE: A batch is processed as soon as it holds this many queries.
+RETRIEVAL_BATCH_SIZE = 16
+# RETRIEVAL_MAX_WAIT_MS: Otherwise it is processed this many milliseconds after its
+# first query arrived. This delay is added to every query answered on its own.
+RETRIEVAL_MAX_WAIT_MS = 10
+
+# Query Cache Configuration
+# Retrieval results are cached per query and reused until a document is added.
+# QUERY_CACHE_SIZE: The maximum number of cached queries.
+QUERY_CACHE_SIZE = 256
+# QUERY_CACHE_TTL: Seconds after which a cached retrieval result expires.
+QUERY_CACHE_TTL = 300
+# SEMANTIC_CACHE_THRESHOLD: Minimum cosine similarity between two query embeddings
+# for the cached result of one to be reused for the other.
+SEMANTIC_CACHE_THRESHOLD = 0.97
+# QUERY_EMBEDDING_CACHE_SIZE: The maximum number of cached query embeddings. They are
+# kept when documents are added, since adding documents does not change them.
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+
+# UI Configuration
+# UI_RESPONSE_TIMEOUT: Seconds the chat UI waits for the answer to a question.
+UI_RESPONSE_TIMEOUT = 60
+# UI_MESSAGE_QUEUE_SIZE: The maximum number of updates kept for the sidebar between two
+# reruns of the app (e.g. upload errors). When it is full, the oldest ones are dropped.
+UI_MESSAGE_QUEUE_SIZE = 100
+
+# Logging Configuration
+# Level used for the application's log output ("DEBUG", "INFO", "WARNING", ...).
+# Per-message tracing is logged at DEBUG and is skipped entirely at higher levels.
+LOG_LEVEL = "INFO"
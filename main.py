@@ -1,16 +1,29 @@
 # rag_chatbot/main.py
 
 import streamlit as st
+import asyncio
+import atexit
+import collections
+import logging
 import os
 import uuid # For generating unique IDs for uploaded files
-from typing import Dict, Any # For type hinting
+from typing import Dict, Any, List, Tuple # For type hinting
 
 # Import agents and message bus
 from agents.coordinator_agent import CoordinatorAgent
 from agents.ingestion_agent import IngestionAgent
 from agents.retrieval_agent import RetrievalAgent
 from agents.llm_response_agent import LLMResponseAgent
-from utils.mcp import message_bus, MCPMessage
+from utils.mcp import message_bus, MCPMessage, MessageType
+from utils.cache import content_hash
+from config import LOG_LEVEL, UI_MESSAGE_QUEUE_SIZE, UI_RESPONSE_TIMEOUT
+
+# Configure logging once for the whole application.
+logging.basicConfig(
+    level=LOG_LEVEL,
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+logger = logging.getLogger(__name__)
 
 # --- Global Agent Initialization ---
 # Initialize agents only once when the Streamlit app starts.
@@ -18,24 +31,86 @@ from utils.mcp import message_bus, MCPMessage
 # This prevents re-initialization on every rerun.
 
 if 'coordinator_agent' not in st.session_state:
-    # Initialize the UI message queue
-    st.session_state.ui_message_queue = []
+    # Initialize the UI message queue. It is drained by the sidebar on every rerun;
+    # the bound keeps it from growing if no rerun happens for a long time.
+    ui_message_queue: collections.deque = collections.deque(maxlen=UI_MESSAGE_QUEUE_SIZE)
+    st.session_state.ui_message_queue = ui_message_queue
+    # The (file_name, content_hash, file_id) of the files sent for ingestion, keyed
+    # by the trace_id of their upload request, so the sidebar can tell this
+    # session's upload errors apart from other updates and find the failed files.
+    upload_traces: Dict[int, List[Tuple[str, str, str]]] = {}
+    st.session_state.upload_traces = upload_traces
+    # Queries waiting for their answer, keyed by trace_id. Each entry holds the
+    # event loop the query is awaited on and the queue its UI updates are put on.
+    pending_queries: Dict[int, Tuple[asyncio.AbstractEventLoop, asyncio.Queue]] = {}
+    st.session_state.pending_queries = pending_queries
 
     # Callback function for the CoordinatorAgent to send messages back to the UI
     def ui_message_callback(message: Dict[str, Any]):
-        # This function is called by the CoordinatorAgent to update the UI
-        # We append to a message queue. Streamlit's rerun will then process it.
-        st.session_state.ui_message_queue.append(message)
-        print(f"UI Callback: Added message to queue. Type: {message.get('type')}, Trace ID: {message.get('trace_id')}, Queue size: {len(st.session_state.ui_message_queue)}")
+        # This function is called by the CoordinatorAgent to update the UI.
+        # Updates for a query that is being awaited are handed to its event loop;
+        # anything else (e.g. upload progress and errors) is appended to the message queue.
+        # The callback may run on an agent's background thread, so it uses the
+        # objects captured above instead of going through st.session_state.
+        # The CoordinatorAgent delivers updates in batches; unpack them here.
+        items = message["items"] if message.get("type") == "BATCH" else [message]
+        for item in items:
+            waiter = pending_queries.get(item.get("trace_id"))
+            if waiter is not None:
+                loop, queue = waiter
+                try:
+                    loop.call_soon_threadsafe(queue.put_nowait, item)
+                    continue
+                except RuntimeError:
+                    pass # The wait has just finished and its loop is closed
+            ui_message_queue.append(item)
+            logger.debug("UI callback: added %s message to queue (trace=%s). Queue size: %d", item.get("type"), item.get("trace_id"), len(ui_message_queue))
 
     st.session_state.ingestion_agent = IngestionAgent()
     st.session_state.retrieval_agent = RetrievalAgent()
     st.session_state.llm_response_agent = LLMResponseAgent()
     st.session_state.coordinator_agent = CoordinatorAgent(ui_message_callback)
 
+    # Release the agents' worker threads when the Streamlit server exits.
+    for agent_key in ("coordinator_agent", "llm_response_agent", "retrieval_agent", "ingestion_agent"):
+        atexit.register(st.session_state[agent_key].shutdown, wait=False)
+
     # Ensure all agents are registered with the message bus.
     message_bus.process_queued_messages() # Process any messages queued during agent initialization
 
+async def _await_response(query_message: MCPMessage, response_placeholder) -> Dict[str, Any]:
+    """
+    Sends a query to the CoordinatorAgent and waits for its FINAL_RESPONSE or
+    ERROR_MESSAGE, showing status updates and the partial answer meanwhile.
+
+    Args:
+        query_message (MCPMessage): The UI_QUERY_REQUEST message to send.
+        response_placeholder: The Streamlit placeholder for the bot's response.
+
+    Returns:
+        Dict[str, Any]: The FINAL_RESPONSE or ERROR_MESSAGE UI update.
+    """
+    trace_id = query_message.trace_id
+    queue: asyncio.Queue = asyncio.Queue()
+    # Register before sending, so no update for this trace can be missed.
+    st.session_state.pending_queries[trace_id] = (asyncio.get_running_loop(), queue)
+    try:
+        message_bus.send_message(query_message)
+        logger.info("Sent UI_QUERY_REQUEST for query '%s' (trace=%s)", query_message.payload["query"], trace_id)
+        while True:
+            msg = await queue.get()
+            if msg["type"] in ("FINAL_RESPONSE", "ERROR_MESSAGE"):
+                return msg
+            if msg["type"] == "PARTIAL_RESPONSE":
+                # Show the answer generated so far while the LLM is still streaming
+                response_placeholder.markdown(msg["answer"])
+            elif msg["type"] == "STATUS_UPDATE":
+                # Update placeholder with status, but don't stop waiting
+                response_placeholder.markdown(f"*{msg['status']}*")
+                logger.debug("STATUS_UPDATE received for trace %s: %s", trace_id, msg["status"])
+    finally:
+        del st.session_state.pending_queries[trace_id]
+
 # --- Streamlit UI Setup ---
 st.set_page_config(page_title="Agentic RAG Chatbot", layout="wide")
 
@@ -54,9 +129,56 @@ with st.sidebar:
         accept_multiple_files=True
     )
 
+    # Content hashes of the files already sent for ingestion in this session, unless
+    # their ingestion failed. Streamlit reruns this script on every interaction while
+    # the files stay in the uploader, so without it they would be ingested again each time.
+    if "submitted_uploads" not in st.session_state:
+        st.session_state.submitted_uploads = set()
+    # The uploader file_id of each file whose ingestion failed, by content hash. The
+    # file is retried once it is selected again, which gives it a new file_id.
+    if "failed_uploads" not in st.session_state:
+        st.session_state.failed_uploads = {}
+
+    # Show the upload errors reported since the last rerun. Progress updates are
+    # stale by now, and so are updates for queries that are no longer awaited.
+    while st.session_state.ui_message_queue:
+        item = st.session_state.ui_message_queue.popleft()
+        upload = st.session_state.upload_traces.get(item.get("trace_id"))
+        if item["type"] == "ERROR_MESSAGE" and upload is not None:
+            st.error(f"{item['error']}\n\n{item.get('context', '')}")
+            # An error naming a file only concerns that file; any other, the whole upload.
+            failed = [f for f in upload if f[0] == item.get("file_name")] or upload
+            for _, file_hash, file_id in failed:
+                st.session_state.submitted_uploads.discard(file_hash)
+                st.session_state.failed_uploads[file_hash] = file_id
+        else:
+            logger.debug("Discarding %s UI update (trace=%s).", item["type"], item.get("trace_id"))
+
     if uploaded_files:
         st.subheader("Uploaded Files:")
+        # Save every file first, then hand them to the CoordinatorAgent in a single
+        # request so their chunks are embedded together in one pass.
+        batch_files = []
+        submitted_files = [] # (file_name, content_hash, file_id) of each file in batch_files
         for uploaded_file in uploaded_files:
+            st.write(f"- {uploaded_file.name}")
+            # UploadedFile is an in-memory BytesIO: getbuffer() is a zero-copy view of
+            # its contents, used for both the hash and the write below.
+            file_buffer = uploaded_file.getbuffer()
+            file_hash = content_hash(file_buffer)
+            if file_hash in st.session_state.submitted_uploads:
+                continue
+            if st.session_state.failed_uploads.get(file_hash) == uploaded_file.file_id:
+                continue # Its error was shown; it is retried once selected again
+            # Marked right away, so a copy in the same selection is skipped too. The
+            # mark is removed again if the file's ingestion fails (see above).
+            st.session_state.submitted_uploads.add(file_hash)
+            st.session_state.failed_uploads.pop(file_hash, None)
+            # Skip files whose contents were indexed before, e.g. in an earlier session.
+            if st.session_state.retrieval_agent.is_document_indexed(file_hash):
+                st.toast(f"{uploaded_file.name} is already indexed.", icon="✅")
+                continue
+
             # Create a unique temporary path for each uploaded file
             unique_filename = f"{uuid.uuid4()}_{uploaded_file.name}"
             temp_file_path = os.path.join("./temp_uploaded_files", unique_filename)
@@ -64,24 +186,31 @@ with st.sidebar:
             # Ensure the temporary directory exists
             os.makedirs(os.path.dirname(temp_file_path), exist_ok=True)
 
+            # A single write of the view: the data goes straight from the upload's
+            # buffer to the kernel, without an intermediate bytes copy.
             with open(temp_file_path, "wb") as f:
-                f.write(uploaded_file.getbuffer())
+                f.write(file_buffer)
             
-            st.write(f"- {uploaded_file.name}")
+            batch_files.append({
+                "file_path": temp_file_path,
+                "file_name": uploaded_file.name,
+                "file_type": os.path.splitext(uploaded_file.name)[1].lower(),
+                "content_hash": file_hash
+            })
+            submitted_files.append((uploaded_file.name, file_hash, uploaded_file.file_id))
 
-            # Send a UI_UPLOAD_REQUEST message to the CoordinatorAgent
+        if batch_files:
+            # Send a UI_UPLOAD_BATCH_REQUEST message to the CoordinatorAgent
             upload_message = MCPMessage(
                 sender="UI",
                 receiver="CoordinatorAgent",
-                type="UI_UPLOAD_REQUEST",
-                payload={
-                    "file_path": temp_file_path,
-                    "file_name": uploaded_file.name,
-                    "file_type": os.path.splitext(uploaded_file.name)[1].lower()
-                }
+                type=MessageType.UI_UPLOAD_BATCH_REQUEST,
+                payload={"files": batch_files}
             )
+            # Registered before sending, so no error for this upload can be discarded.
+            st.session_state.upload_traces[upload_message.trace_id] = submitted_files
             message_bus.send_message(upload_message)
-            st.toast(f"Processing {uploaded_file.name}...", icon="⏳")
+            st.toast(f"Processing {len(batch_files)} file(s)...", icon="⏳")
 
 # --- Chat Interface ---
 # Initialize chat history in session state
@@ -106,15 +235,13 @@ if prompt := st.chat_input("Ask a question about the documents..."):
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    # Send a UI_QUERY_REQUEST message to the CoordinatorAgent
+    # Create the UI_QUERY_REQUEST message for the CoordinatorAgent
     query_message = MCPMessage(
         sender="UI",
         receiver="CoordinatorAgent",
-        type="UI_QUERY_REQUEST",
+        type=MessageType.UI_QUERY_REQUEST,
         payload={"query": prompt}
     )
-    message_bus.send_message(query_message)
-    print(f"UI: Sent UI_QUERY_REQUEST for query '{prompt}' with Trace ID: {query_message.trace_id}")
 
     # Add a placeholder for the bot's response while processing
     with st.chat_message("assistant"):
@@ -122,56 +249,32 @@ if prompt := st.chat_input("Ask a question about the documents..."):
         response_placeholder = st.empty()
         response_placeholder.markdown("Thinking...")
 
-        response_received = False
-        bot_response_content = "Still thinking..."
         source_context_info = []
         current_query_trace_id = query_message.trace_id
+        try:
+            # The script waits here, without rerunning, until the answer arrives.
+            msg = asyncio.run(asyncio.wait_for(
+                _await_response(query_message, response_placeholder),
+                timeout=UI_RESPONSE_TIMEOUT
+            ))
+        except asyncio.TimeoutError:
+            logger.error("No response for trace %s within %d seconds", current_query_trace_id, UI_RESPONSE_TIMEOUT)
+            bot_response_content = "Error: The answer took too long. Please try again."
+        else:
+            if msg["type"] == "FINAL_RESPONSE":
+                bot_response_content = msg["answer"]
+                for i, chunk_content in enumerate(msg["source_chunks"]):
+                    metadata = msg["source_metadata"][i] if i < len(msg["source_metadata"]) else {}
+                    source_context_info.append({
+                        "file_name": metadata.get("file_name", "N/A"),
+                        "content": chunk_content
+                    })
+                logger.info("FINAL_RESPONSE received for trace %s", current_query_trace_id)
+            else:
+                bot_response_content = f"Error: {msg['error']}\nContext: {msg['context']}"
+                logger.info("ERROR_MESSAGE received for trace %s", current_query_trace_id)
 
-        # Loop to process messages from the queue until a final response for this trace_id is found
-        while not response_received:
-            # Create a new list for messages that are not processed in this iteration
-            messages_to_keep = []
-            
-            # Process messages from the queue
-            for msg in st.session_state.ui_message_queue:
-                if msg.get("trace_id") == current_query_trace_id:
-                    if msg["type"] == "FINAL_RESPONSE":
-                        bot_response_content = msg["answer"]
-                        source_context_info = []
-                        for i, chunk_content in enumerate(msg["source_chunks"]):
-                            metadata = msg["source_metadata"][i] if i < len(msg["source_metadata"]) else {}
-                            source_context_info.append({
-                                "file_name": metadata.get("file_name", "N/A"),
-                                "content": chunk_content
-                            })
-                        response_received = True
-                        print(f"UI: FINAL_RESPONSE received for Trace ID: {current_query_trace_id}")
-                        break # Exit inner loop, found response
-                    elif msg["type"] == "ERROR_MESSAGE":
-                        bot_response_content = f"Error: {msg['error']}\nContext: {msg['context']}"
-                        response_received = True
-                        print(f"UI: ERROR_MESSAGE received for Trace ID: {current_query_trace_id}")
-                        break # Exit inner loop, found error
-                    elif msg["type"] == "STATUS_UPDATE":
-                        # Update placeholder with status, but don't stop waiting
-                        response_placeholder.markdown(f"*{msg['status']}*")
-                        print(f"UI: STATUS_UPDATE received for Trace ID: {current_query_trace_id}: {msg['status']}")
-                        messages_to_keep.append(msg) # Keep status updates until final response
-                else:
-                    messages_to_keep.append(msg) # Keep messages not for this trace
-
-            # Update the queue, removing processed messages for the current trace
-            st.session_state.ui_message_queue = messages_to_keep
-            
-            if not response_received:
-                # If no response yet, force a rerun to check the queue again
-                # This is crucial for Streamlit to re-execute and pick up new messages
-                print(f"UI: No final response for Trace ID {current_query_trace_id}. Rerunning...")
-                import time
-                time.sleep(0.1) # Small delay to prevent excessive reruns
-                st.rerun()
-
-        # Display bot response after it's received and loop has broken
+        # Display bot response after it has been received
         response_placeholder.markdown(bot_response_content) # Update the placeholder with the final answer
         if source_context_info:
             with st.expander("Source Context"):
@@ -180,7 +283,7 @@ if prompt := st.chat_input("Ask a question about the documents..."):
                     st.code(source.get('content', 'No content available'))
                     st.markdown("---")
 
-    # Add bot response to chat history (this happens on the next rerun after the loop breaks)
+    # Add bot response to chat history
     st.session_state.messages.append({
         "role": "assistant",
         "content": bot_response_content,
@@ -0,0 +1,45 @@
+# rag_chatbot/tests/test_cache.py
+
+from utils import cache
+from utils.cache import LRUCache, content_hash, fingerprint
+
+def test_evicts_the_least_recently_used_entry():
+    lru = LRUCache(maxsize=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    assert lru.get("a") == 1 # "a" is now the most recently used
+    lru.put("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1 and lru.get("c") == 3
+    assert len(lru) == 2
+
+def test_put_replaces_and_refreshes_an_entry():
+    lru = LRUCache(maxsize=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    lru.put("a", 10)
+    lru.put("c", 3)
+    assert lru.get("a") == 10
+    assert lru.get("b", "missing") == "missing"
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    lru = LRUCache(maxsize=4, ttl=10)
+    lru.put("a", 1)
+    now[0] = 109.0
+    assert lru.get("a") == 1
+    now[0] = 110.0
+    assert lru.get("a") is None
+    assert len(lru) == 0
+
+def test_clear_removes_all_entries():
+    lru = LRUCache(maxsize=4)
+    lru.put("a", 1)
+    lru.clear()
+    assert lru.get("a") is None and len(lru) == 0
+
+def test_fingerprint_separates_strings():
+    assert fingerprint(["ab", "c"]) != fingerprint(["a", "bc"])
+    assert fingerprint(["ab", "c"]) == fingerprint(["ab", "c"])
+    assert content_hash(b"data") == content_hash(memoryview(b"data"))
@@ -0,0 +1,74 @@
+# rag_chatbot/tests/test_chunk_store.py
+
+import os
+import pickle
+
+import pytest
+
+pytest.importorskip("langchain_community")
+pytest.importorskip("langchain_core")
+
+from langchain_core.documents import Document
+
+from utils import chunk_store
+from utils.chunk_store import open_chunk_store
+
+@pytest.fixture
+def data_path(tmp_path):
+    """A data file path, with the process's store registry cleared around the test."""
+    chunk_store._stores.clear()
+    yield str(tmp_path / "index.chunks")
+    chunk_store._stores.clear()
+
+def _text(store, doc_id):
+    doc = store.search(doc_id)
+    assert isinstance(doc, Document), doc
+    return doc.page_content
+
+def test_sessions_share_the_store_and_reloads_keep_records(data_path):
+    store = open_chunk_store(data_path)
+    store.add({"a": Document(page_content="alpha", metadata={"page": 1}), "b": Document(page_content="beta")})
+    saved = pickle.dumps(store)
+
+    # Two sessions load the saved index in a new process.
+    chunk_store._stores.clear()
+    first, second = pickle.loads(saved), pickle.loads(saved)
+    assert first is second
+
+    # Appends from both sessions must not overwrite each other's records.
+    first.add({"c": Document(page_content="gamma")})
+    second.add({"d": Document(page_content="delta")})
+    for doc_id, text in [("a", "alpha"), ("b", "beta"), ("c", "gamma"), ("d", "delta")]:
+        assert _text(first, doc_id) == text
+    assert first.search("a").metadata == {"page": 1}
+
+    # Reloading the older save must not truncate the records appended since.
+    size = os.path.getsize(data_path)
+    chunk_store._stores.clear()
+    reloaded = pickle.loads(saved)
+    assert os.path.getsize(data_path) == size
+    reloaded.add({"e": Document(page_content="epsilon")})
+    assert _text(reloaded, "a") == "alpha"
+    assert _text(reloaded, "e") == "epsilon"
+    assert reloaded.search("c") == "ID c not found."
+
+def test_separate_handles_append_after_each_other(data_path):
+    first = chunk_store.ChunkStore(data_path)
+    second = chunk_store.ChunkStore(data_path)
+    first.add({"a": Document(page_content="alpha")})
+    second.add({"b": Document(page_content="beta")})
+    first.add({"c": Document(page_content="gamma")})
+    assert _text(first, "a") == "alpha"
+    assert _text(second, "b") == "beta"
+    assert _text(first, "c") == "gamma"
+
+def test_unpickling_fails_if_the_data_file_is_short(data_path):
+    store = open_chunk_store(data_path)
+    store.add({"a": Document(page_content="alpha")})
+    saved = pickle.dumps(store)
+    chunk_store._stores.clear()
+    store._file.close()
+    with open(data_path, "wb"):
+        pass
+    with pytest.raises(ValueError):
+        pickle.loads(saved)
@@ -0,0 +1,24 @@
+# rag_chatbot/tests/test_rerank.py
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils.rerank import mmr_rerank
+
+QUERY = [1.0, 0.0, 0.0]
+# Two near-identical documents closest to the query, and a less relevant distinct one.
+DOCS = [[1.0, 0.1, 0.0], [1.0, 0.11, 0.0], [0.7, 0.0, 0.7], [0.0, 1.0, 0.0]]
+
+def test_pure_relevance_ranks_by_similarity_to_the_query():
+    assert mmr_rerank(QUERY, DOCS, lambda_=1.0, k=4) == [0, 1, 2, 3]
+
+def test_skips_a_near_duplicate_of_a_selected_document():
+    assert mmr_rerank(QUERY, DOCS, lambda_=0.5, k=2) == [0, 2]
+
+def test_returns_each_document_at_most_once():
+    selected = mmr_rerank(QUERY, DOCS, lambda_=0.3, k=10)
+    assert sorted(selected) == [0, 1, 2, 3]
+
+def test_no_candidates():
+    assert mmr_rerank(QUERY, np.empty((0, 3)), k=4) == []
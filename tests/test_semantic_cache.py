@@ -0,0 +1,42 @@
+# rag_chatbot/tests/test_semantic_cache.py
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from utils import semantic_cache
+from utils.semantic_cache import SemanticCache
+
+def test_returns_the_most_similar_entry_above_the_threshold():
+    sc = SemanticCache(dimension=2, maxsize=4, threshold=0.9)
+    sc.put([1.0, 0.0], "x")
+    sc.put([0.0, 2.0], "y") # Stored normalized, so the norm does not matter
+    assert sc.get([10.0, 1.0]) == "x"
+    assert sc.get([0.1, 1.0]) == "y"
+    assert sc.get([1.0, 1.0]) is None # cos = 0.707 to both
+    assert sc.get([0.0, 0.0]) is None
+
+def test_replaces_the_oldest_entry_when_full():
+    sc = SemanticCache(dimension=2, maxsize=2, threshold=0.99)
+    sc.put([1.0, 0.0], "x")
+    sc.put([0.0, 1.0], "y")
+    sc.put([-1.0, 0.0], "z")
+    assert len(sc) == 2
+    assert sc.get([1.0, 0.0]) is None
+    assert sc.get([0.0, 1.0]) == "y" and sc.get([-1.0, 0.0]) == "z"
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(semantic_cache.time, "monotonic", lambda: now[0])
+    sc = SemanticCache(dimension=2, maxsize=2, threshold=0.9, ttl=10)
+    sc.put([1.0, 0.0], "x")
+    now[0] = 109.0
+    assert sc.get([1.0, 0.0]) == "x"
+    now[0] = 110.0
+    assert sc.get([1.0, 0.0]) is None
+
+def test_clear_removes_all_entries():
+    sc = SemanticCache(dimension=2, maxsize=2, threshold=0.9)
+    sc.put([1.0, 0.0], "x")
+    sc.clear()
+    assert len(sc) == 0 and sc.get([1.0, 0.0]) is None
@@ -0,0 +1,68 @@
+# rag_chatbot/tests/test_text_chunker.py
+
+import random
+
+import pytest
+
+from utils.text_chunker import chunk_stream
+
+# Words and separators of every level, plus words longer than a chunk, which force hard cuts.
+_TOKENS = ["alpha", "beta", "gamma", "delta", " ", " ", " ", ". ", "! ", "? ", "\n", "\n\n", "  ",
+           "x" * 70, "y" * 130]
+
+def _random_text(rng: random.Random) -> str:
+    return "".join(rng.choice(_TOKENS) for _ in range(rng.randint(0, 400)))
+
+def _random_segments(rng: random.Random, text: str):
+    """Splits 'text' at random positions, including empty segments."""
+    cuts = sorted(rng.randint(0, len(text)) for _ in range(rng.randint(0, 20)))
+    return [text[a:b] for a, b in zip([0] + cuts, cuts + [len(text)])]
+
+@pytest.mark.parametrize("chunk_size,chunk_overlap", [(50, 0), (50, 10), (100, 40), (1000, 200)])
+def test_chunks_are_exact_bounded_and_cover_the_text(chunk_size, chunk_overlap):
+    rng = random.Random(chunk_size * 1000 + chunk_overlap)
+    for _ in range(300):
+        text = _random_text(rng)
+        chunks = list(chunk_stream([text], chunk_size, chunk_overlap))
+
+        # The result does not depend on how the text is split into segments.
+        assert list(chunk_stream(_random_segments(rng, text), chunk_size, chunk_overlap)) == chunks
+
+        covered = [False] * len(text)
+        previous_start = -1
+        for start, chunk in chunks:
+            # start_index points at the chunk within the full text.
+            assert text[start:start + len(chunk)] == chunk
+            assert chunk == chunk.strip() and chunk
+            assert len(chunk) <= chunk_size
+            # Chunks are in text order. Two chunks can start at the same character
+            # when stripping whitespace moved both starts there.
+            assert start >= previous_start
+            previous_start = start
+            covered[start:start + len(chunk)] = [True] * len(chunk)
+        # Every character other than whitespace is in some chunk.
+        assert all(covered[i] for i, c in enumerate(text) if not c.isspace())
+
+def test_prefers_paragraph_breaks():
+    text = "one two three four five.\n\nsix seven eight nine ten eleven twelve"
+    assert list(chunk_stream([text], chunk_size=40, chunk_overlap=10)) == [
+        (0, "one two three four five."),
+        (26, "six seven eight nine ten eleven twelve"),
+    ]
+
+def test_consecutive_chunks_overlap_at_word_boundaries():
+    text = "one two three four five six seven eight nine ten eleven twelve"
+    chunks = list(chunk_stream([text], chunk_size=30, chunk_overlap=10))
+    assert len(chunks) > 1
+    for (start, chunk), (next_start, _) in zip(chunks, chunks[1:]):
+        # The next chunk repeats the end of this one, starting at a word.
+        assert start < next_start < start + len(chunk)
+        assert text[next_start - 1] == " "
+
+def test_empty_and_whitespace_input_yields_nothing():
+    assert list(chunk_stream([])) == []
+    assert list(chunk_stream(["", "  \n\n ", ""])) == []
+
+def test_rejects_overlap_not_smaller_than_size():
+    with pytest.raises(ValueError):
+        list(chunk_stream(["text"], chunk_size=10, chunk_overlap=10))
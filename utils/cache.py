@@ -0,0 +1,117 @@
+# rag_chatbot/utils/cache.py
+
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Iterable, Optional, Tuple
+
+# xxhash is considerably faster than the hashlib algorithms for fingerprinting
+# large amounts of text. It is optional: blake2b is used when it is not installed.
+try:
+    import xxhash
+except ImportError:
+    xxhash = None
+
+# The algorithm behind fingerprint(). Fingerprints saved to disk are only valid
+# while it stays the same.
+FINGERPRINT_ALGORITHM = "xxh64" if xxhash is not None else "blake2b"
+
+def fingerprint(texts: Iterable[str]) -> int:
+    """
+    Computes a stable 64-bit fingerprint of a sequence of strings.
+
+    Unlike the built-in hash(), the result does not change between interpreter
+    runs, so it can be used in keys of caches that are persisted.
+
+    Args:
+        texts (Iterable[str]): The strings to fingerprint, in order.
+
+    Returns:
+        int: The fingerprint.
+    """
+    hasher = xxhash.xxh64() if xxhash is not None else hashlib.blake2b(digest_size=8)
+    for text in texts:
+        hasher.update(text.encode("utf-8"))
+        hasher.update(b"\x00") # Separator, so ["ab", "c"] and ["a", "bc"] differ
+    return int.from_bytes(hasher.digest(), "big")
+
+def content_hash(data) -> str:
+    """
+    Computes a digest identifying the contents of a file, e.g. to recognize
+    a document that was uploaded before.
+
+    Args:
+        data: The file contents, as a bytes-like object.
+
+    Returns:
+        str: The hex digest (128 bits).
+    """
+    if xxhash is not None:
+        return xxhash.xxh3_128(data).hexdigest()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+class LRUCache:
+    """
+    A thread-safe, fixed-size mapping that evicts its least recently used entry.
+    Entries can optionally expire a fixed time after they were stored.
+    """
+    def __init__(self, maxsize: int, ttl: Optional[float] = None):
+        """
+        Initializes an empty cache.
+
+        Args:
+            maxsize (int): The maximum number of entries to keep.
+            ttl (Optional[float]): Seconds after which an entry expires. None keeps
+                                   entries until they are evicted.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # Values are stored as (value, expiry time) pairs.
+        self._data: "OrderedDict[Hashable, Tuple[Any, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        """
+        Returns the value stored for 'key', marking it as recently used.
+
+        Args:
+            key (Hashable): The key to look up.
+            default (Optional[Any]): The value returned when 'key' is not cached.
+
+        Returns:
+            Any: The cached value, or 'default'.
+        """
+        with self._lock:
+            try:
+                value, expires_at = self._data[key]
+            except KeyError:
+                return default
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """
+        Stores 'value' for 'key', evicting the least recently used entry if the cache is full.
+
+        Args:
+            key (Hashable): The key to store the value under.
+            value (Any): The value to cache.
+        """
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
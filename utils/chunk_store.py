@@ -0,0 +1,192 @@
+# rag_chatbot/utils/chunk_store.py
+
+import mmap
+import os
+import threading
+from array import array
+from typing import Dict, Iterable, Iterator, List, Union
+
+import orjson
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+# One ChunkStore per data file in this process, by absolute path. Streamlit creates
+# a VectorStoreManager per browser session; they all load and save the same index,
+# so they must share the store that appends to its data file (see open_chunk_store).
+_stores: Dict[str, "ChunkStore"] = {}
+_stores_lock = threading.Lock()
+
+def open_chunk_store(path: str) -> "ChunkStore":
+    """
+    Returns this process's ChunkStore for the data file at 'path', creating it on
+    first use.
+
+    Args:
+        path (str): The path of the data file, created if it does not exist.
+
+    Returns:
+        ChunkStore: The shared store.
+    """
+    key = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(key)
+        if store is None:
+            store = _stores[key] = ChunkStore(path)
+        return store
+
+def _restore_chunk_store(path: str, ids: Dict[str, int], spans: array) -> "ChunkStore":
+    """Unpickles a ChunkStore into this process's store for the same data file."""
+    store = open_chunk_store(path)
+    store._merge(ids, spans)
+    return store
+
+class ChunkStore(Docstore, AddableMixin):
+    """
+    A LangChain docstore that keeps chunk texts and metadata in a file instead of
+    in Python objects.
+
+    Each chunk is one record (its text and metadata, as a JSON array) appended to
+    the data file. In memory, the store only keeps the byte span of every record
+    and the record number of every docstore ID; a record is read back through a
+    read-only memory map when a search returns it. Loading the store therefore
+    costs time and memory proportional to the number of chunks, not to the amount
+    of text they hold.
+
+    The data file is only ever appended to, never truncated or rewritten, so the
+    records referenced by any saved index stay valid. Records whose index was never
+    saved are left in place as unused bytes.
+
+    Use open_chunk_store rather than the constructor, so each process has a single
+    store appending to a given file. When pickled (FAISS.save_local pickles the
+    docstore into index.pkl), only the spans and IDs are saved; unpickling merges
+    them into that shared store.
+    """
+    def __init__(self, path: str):
+        """
+        Opens the store's data file for appending.
+
+        Args:
+            path (str): The path of the data file, created if it does not exist.
+        """
+        self._path = path
+        self._ids: Dict[str, int] = {}
+        # Record i spans bytes spans[2 * i] to spans[2 * i + 1] of the data file.
+        self._spans = array("q")
+        # Guards appends, the spans and the memory map.
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._file = open(path, "ab")
+
+    def __reduce__(self):
+        with self._lock:
+            return _restore_chunk_store, (self._path, dict(self._ids), array("q", self._spans))
+
+    def _merge(self, ids: Dict[str, int], spans: array):
+        """
+        Adds the records of an unpickled store, which refer to the same data file.
+
+        Raises:
+            ValueError: If the data file is shorter than the records require.
+        """
+        required = max(spans[1::2], default=0)
+        with self._lock:
+            self._file.flush()
+            size = os.fstat(self._file.fileno()).st_size
+            if size < required:
+                raise ValueError(f"Chunk data file {self._path} is shorter than its saved index.")
+            if not self._ids:
+                self._ids = dict(ids)
+                self._spans = array("q", spans)
+                return
+            for doc_id, record in ids.items():
+                if doc_id not in self._ids:
+                    self._spans.extend(spans[2 * record:2 * record + 2])
+                    self._ids[doc_id] = len(self._spans) // 2 - 1
+
+    def add(self, texts: Dict[str, Document]):
+        """
+        Appends documents to the store.
+
+        Args:
+            texts (Dict[str, Document]): The documents to add, by docstore ID.
+
+        Raises:
+            ValueError: If an ID is already in the store.
+        """
+        records = [orjson.dumps([doc.page_content, doc.metadata], default=str) for doc in texts.values()]
+        with self._lock:
+            overlapping = set(texts).intersection(self._ids)
+            if overlapping:
+                raise ValueError(f"Tried to add ids that already exist: {overlapping}")
+            # Records start wherever the file actually ends, which is past this
+            # store's last record if the file was appended to through another handle.
+            start = self._file.seek(0, os.SEEK_END)
+            self._file.write(b"".join(records))
+            self._file.flush() # So the memory map can read the new records
+            for doc_id, record in zip(texts, records):
+                self._spans.append(start)
+                start += len(record)
+                self._spans.append(start)
+                self._ids[doc_id] = len(self._spans) // 2 - 1
+
+    def delete(self, ids: List):
+        """
+        Removes documents from the store. Their records stay in the data file.
+
+        Args:
+            ids (List): The docstore IDs to remove.
+
+        Raises:
+            ValueError: If an ID is not in the store.
+        """
+        with self._lock:
+            missing = set(ids).difference(self._ids)
+            if missing:
+                raise ValueError(f"Tried to delete ids that does not exist: {missing}")
+            for doc_id in ids:
+                del self._ids[doc_id]
+
+    def search(self, search: str) -> Union[str, Document]:
+        """
+        Reads a document from the data file.
+
+        Args:
+            search (str): The docstore ID of the document.
+
+        Returns:
+            Union[str, Document]: The document, or an error message (like
+            InMemoryDocstore) if the ID is not in the store.
+        """
+        with self._lock:
+            record = self._ids.get(search)
+            if record is None:
+                return f"ID {search} not found."
+            start, end = self._spans[2 * record], self._spans[2 * record + 1]
+            if self._mmap is None or end > len(self._mmap):
+                # The file grew since it was mapped.
+                if self._mmap is not None:
+                    self._mmap.close()
+                with open(self._path, "rb") as f:
+                    self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            data = self._mmap[start:end]
+        text, metadata = orjson.loads(data)
+        return Document(page_content=text, metadata=metadata)
+
+    def documents(self, ids: Iterable[str]) -> Iterator[Document]:
+        """Yields the documents with the given docstore IDs that are in the store."""
+        for doc_id in ids:
+            doc = self.search(doc_id)
+            if isinstance(doc, Document):
+                yield doc
+
+    def sync(self):
+        """Writes appended records through to disk, before an index referring to them is saved."""
+        with self._lock:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
@@ -1,7 +1,16 @@
 # rag_chatbot/utils/document_parser.py
 
+import logging
+import multiprocessing
 import os
-from typing import List, Dict, Any
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Import configuration settings
+from config import PDF_PARALLEL_MIN_PAGES, PDF_PAGES_PER_TASK, PDF_PARSE_WORKERS, CSV_BLOCK_SIZE
+
+logger = logging.getLogger(__name__)
 
 # Libraries for document parsing
 # Ensure these are installed: pip install pypdf python-docx python-pptx pandas
@@ -9,35 +18,80 @@ try:
     from pypdf import PdfReader
 except ImportError:
     PdfReader = None
-    print("Warning: pypdf not installed. PDF parsing will not be available.")
+    logger.warning("pypdf not installed. PDF parsing will not be available.")
 
 try:
     from docx import Document
 except ImportError:
     Document = None
-    print("Warning: python-docx not installed. DOCX parsing will not be available.")
+    logger.warning("python-docx not installed. DOCX parsing will not be available.")
 
 try:
     from pptx import Presentation
 except ImportError:
     Presentation = None
-    print("Warning: python-pptx not installed. PPTX parsing will not be available.")
+    logger.warning("python-pptx not installed. PPTX parsing will not be available.")
 
 try:
     import pandas as pd
 except ImportError:
     pd = None
-    print("Warning: pandas not installed. CSV parsing will not be available.")
+    logger.warning("pandas not installed. CSV parsing will not be available.")
 
-def parse_pdf(file_path: str) -> str:
+# PyArrow's multi-threaded CSV reader is much faster than pandas on large files.
+# It is optional: pandas is used when it is not installed.
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.csv as pv
+except ImportError:
+    pa = pc = pv = None
+
+# Process pool for extracting the text of large PDFs in parallel. It is created on
+# first use and shared by all uploads, so worker processes are started only once.
+_pdf_pool: Optional[ProcessPoolExecutor] = None
+_pdf_pool_lock = threading.Lock()
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    """Returns the shared PDF extraction process pool, creating it if needed."""
+    global _pdf_pool
+    with _pdf_pool_lock:
+        if _pdf_pool is None:
+            # "spawn" rather than "fork": the application runs many threads, and
+            # forking a multi-threaded process can deadlock the child.
+            _pdf_pool = ProcessPoolExecutor(max_workers=PDF_PARSE_WORKERS or os.cpu_count(),
+                                            mp_context=multiprocessing.get_context("spawn"))
+        return _pdf_pool
+
+def _pdf_pages_text(args: Tuple[str, int, int]) -> List[str]:
     """
-    Parses a PDF file and extracts all text content.
+    Extracts the text of a range of pages of a PDF file. Runs in a worker process.
 
     Args:
-        file_path (str): The path to the PDF file.
+        args (Tuple[str, int, int]): The file path, and the first and (exclusive)
+                                     last page index of the range.
 
     Returns:
-        str: The concatenated text content from all pages of the PDF.
+        List[str]: The text of each page in the range, each followed by a newline.
+    """
+    file_path, start, stop = args
+    reader = PdfReader(file_path)
+    return [(reader.pages[i].extract_text() or "") + "\n" for i in range(start, stop)]
+
+def iter_pdf(file_path: str) -> Iterator[str]:
+    """
+    Parses a PDF file and yields the text content of each page.
+
+    Text extraction is CPU-bound and independent across pages, so PDFs with at
+    least PDF_PARALLEL_MIN_PAGES pages are split into ranges of PDF_PAGES_PER_TASK
+    pages that are extracted in parallel worker processes. Pages are still
+    yielded in document order.
+
+    Args:
+        file_path (str): The path to the PDF file.
+
+    Yields:
+        str: The text of one page, followed by a newline.
 
     Raises:
         ValueError: If pypdf is not installed or if the file cannot be read.
@@ -47,22 +101,30 @@ def parse_pdf(file_path: str) -> str:
     
     try:
         reader = PdfReader(file_path)
-        text = ""
-        for page in reader.pages:
-            text += page.extract_text() or "" # Use .extract_text() and handle None
-        return text
+        num_pages = len(reader.pages)
+        if num_pages < PDF_PARALLEL_MIN_PAGES:
+            # Not worth the inter-process overhead.
+            for page in reader.pages:
+                # Use .extract_text() and handle None
+                yield (page.extract_text() or "") + "\n"
+            return
+
+        page_ranges = [(file_path, start, min(start + PDF_PAGES_PER_TASK, num_pages))
+                       for start in range(0, num_pages, PDF_PAGES_PER_TASK)]
+        for page_texts in _get_pdf_pool().map(_pdf_pages_text, page_ranges):
+            yield from page_texts
     except Exception as e:
         raise ValueError(f"Error parsing PDF file {file_path}: {e}")
 
-def parse_pptx(file_path: str) -> str:
+def iter_pptx(file_path: str) -> Iterator[str]:
     """
-    Parses a PPTX file and extracts text from all slides.
+    Parses a PPTX file and yields the text of every shape on every slide.
 
     Args:
         file_path (str): The path to the PPTX file.
 
-    Returns:
-        str: The concatenated text content from all shapes in all slides.
+    Yields:
+        str: The text of one shape, followed by a newline.
 
     Raises:
         ValueError: If python-pptx is not installed or if the file cannot be read.
@@ -72,47 +134,68 @@ def parse_pptx(file_path: str) -> str:
 
     try:
         prs = Presentation(file_path)
-        text_runs = []
         for slide in prs.slides:
             for shape in slide.shapes:
                 if hasattr(shape, "text"):
-                    text_runs.append(shape.text)
-        return "\n".join(text_runs)
+                    yield shape.text + "\n"
     except Exception as e:
         raise ValueError(f"Error parsing PPTX file {file_path}: {e}")
 
-def parse_csv(file_path: str) -> str:
+def _iter_csv_arrow(file_path: str) -> Iterator[str]:
+    """
+    Reads a CSV file block by block with PyArrow and yields its rows as
+    tab-separated lines, starting with the header.
     """
-    Parses a CSV file and converts its content into a string representation.
+    reader = pv.open_csv(file_path, read_options=pv.ReadOptions(block_size=CSV_BLOCK_SIZE))
+    yield "\t".join(reader.schema.names) + "\n"
+    for batch in reader:
+        # Each column is converted to strings in one vectorized call; empty cells become "".
+        columns = [pc.fill_null(pc.cast(column, pa.string()), "").to_pylist() for column in batch.columns]
+        yield "".join(["\t".join(row) + "\n" for row in zip(*columns)])
+
+def iter_csv(file_path: str) -> Iterator[str]:
+    """
+    Parses a CSV file and yields its content as a string representation.
+
+    With PyArrow installed, the file is read in blocks of CSV_BLOCK_SIZE bytes and
+    yielded as tab-separated rows, one block at a time, so the whole table is never
+    held in memory. Otherwise it is read with pandas and yielded as one table string.
 
     Args:
         file_path (str): The path to the CSV file.
 
-    Returns:
+    Yields:
         str: A string representation of the CSV data.
 
     Raises:
-        ValueError: If pandas is not installed or if the file cannot be read.
+        ValueError: If neither pyarrow nor pandas is installed or if the file cannot be read.
     """
+    if pv is not None:
+        try:
+            yield from _iter_csv_arrow(file_path)
+        except Exception as e:
+            raise ValueError(f"Error parsing CSV file {file_path}: {e}")
+        return
+
     if pd is None:
         raise ValueError("pandas library is not installed. Cannot parse CSV files.")
     
     try:
         df = pd.read_csv(file_path)
         # Convert DataFrame to a markdown-like table string or just its string representation
-        return df.to_string(index=False)
+        yield df.to_string(index=False)
     except Exception as e:
         raise ValueError(f"Error parsing CSV file {file_path}: {e}")
 
-def parse_docx(file_path: str) -> str:
+def iter_docx(file_path: str) -> Iterator[str]:
     """
-    Parses a DOCX file and extracts all text content.
+    Parses a DOCX file and yields the text of each paragraph.
 
     Args:
         file_path (str): The path to the DOCX file.
 
-    Returns:
-        str: The concatenated text content from all paragraphs in the DOCX.
+    Yields:
+        str: The text of one paragraph, followed by a newline.
 
     Raises:
         ValueError: If python-docx is not installed or if the file cannot be read.
@@ -122,21 +205,19 @@ def parse_docx(file_path: str) -> str:
 
     try:
         doc = Document(file_path)
-        full_text = []
         for para in doc.paragraphs:
-            full_text.append(para.text)
-        return "\n".join(full_text)
+            yield para.text + "\n"
     except Exception as e:
         raise ValueError(f"Error parsing DOCX file {file_path}: {e}")
 
-def parse_txt_md(file_path: str) -> str:
+def iter_txt_md(file_path: str) -> Iterator[str]:
     """
-    Reads a plain text or Markdown file and returns its content.
+    Reads a plain text or Markdown file and yields its content.
 
     Args:
         file_path (str): The path to the TXT/Markdown file.
 
-    Returns:
+    Yields:
         str: The full text content of the file.
 
     Raises:
@@ -144,36 +225,74 @@ def parse_txt_md(file_path: str) -> str:
     """
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
-            return f.read()
+            yield f.read()
     except Exception as e:
         raise ValueError(f"Error reading TXT/Markdown file {file_path}: {e}")
 
-def parse_document(file_path: str) -> str:
+# Maps each supported file extension to its streaming parser.
+_STREAM_PARSERS: Dict[str, Callable[[str], Iterator[str]]] = {
+    ".pdf": iter_pdf,
+    ".pptx": iter_pptx,
+    ".csv": iter_csv,
+    ".docx": iter_docx,
+    ".txt": iter_txt_md,
+    ".md": iter_txt_md,
+}
+
+def parse_document_stream(file_path: str) -> Iterator[str]:
     """
-    Parses a document based on its file extension and returns its text content.
+    Parses a document based on its file extension and yields its text content
+    piece by piece (pages, slides' shapes or paragraphs), so callers can process
+    the document without holding its full text in memory.
 
     Args:
         file_path (str): The path to the document file.
 
-    Returns:
-        str: The extracted text content.
+    Yields:
+        str: Consecutive pieces of the extracted text content.
 
     Raises:
         ValueError: If the file format is not supported or parsing fails.
     """
     file_extension = os.path.splitext(file_path)[1].lower()
 
-    if file_extension == ".pdf":
-        return parse_pdf(file_path)
-    elif file_extension == ".pptx":
-        return parse_pptx(file_path)
-    elif file_extension == ".csv":
-        return parse_csv(file_path)
-    elif file_extension == ".docx":
-        return parse_docx(file_path)
-    elif file_extension in [".txt", ".md"]:
-        return parse_txt_md(file_path)
-    else:
+    parser = _STREAM_PARSERS.get(file_extension)
+    if parser is None:
         raise ValueError(f"Unsupported file format: {file_extension}. "
                          "Supported formats are .pdf, .pptx, .csv, .docx, .txt, .md.")
+    return parser(file_path)
+
+def parse_pdf(file_path: str) -> str:
+    """Parses a PDF file and returns the concatenated text of all its pages."""
+    return "".join(iter_pdf(file_path))
+
+def parse_pptx(file_path: str) -> str:
+    """Parses a PPTX file and returns the concatenated text of all shapes in all slides."""
+    return "".join(iter_pptx(file_path))
+
+def parse_csv(file_path: str) -> str:
+    """Parses a CSV file and returns a string representation of its data."""
+    return "".join(iter_csv(file_path))
+
+def parse_docx(file_path: str) -> str:
+    """Parses a DOCX file and returns the concatenated text of all its paragraphs."""
+    return "".join(iter_docx(file_path))
+
+def parse_txt_md(file_path: str) -> str:
+    """Reads a plain text or Markdown file and returns its content."""
+    return "".join(iter_txt_md(file_path))
 
+def parse_document(file_path: str) -> str:
+    """
+    Parses a document based on its file extension and returns its text content.
+
+    Args:
+        file_path (str): The path to the document file.
+
+    Returns:
+        str: The extracted text content.
+
+    Raises:
+        ValueError: If the file format is not supported or parsing fails.
+    """
+    return "".join(parse_document_stream(file_path))
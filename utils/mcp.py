@@ -1,12 +1,57 @@
 # rag_chatbot/utils/mcp.py
 
+from collections import deque
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Callable, Optional
-import uuid
+from enum import IntEnum
+from typing import Any, Deque, Dict, FrozenSet, Iterable, List, Callable, Optional, Tuple
+import itertools
+import logging
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+class MessageType(IntEnum):
+    """
+    The types of MCP messages exchanged between agents.
+
+    Members hash and compare as small integers, which makes the dispatch-table
+    lookup each agent performs per message cheaper than keying on strings.
+    Use '.name' when a readable type is needed, e.g. in log output.
+    """
+    UI_UPLOAD_REQUEST = 1   # UI -> CoordinatorAgent: a document was uploaded
+    UI_QUERY_REQUEST = 2    # UI -> CoordinatorAgent: the user asked a question
+    UPLOAD_DOCUMENT = 3     # CoordinatorAgent -> IngestionAgent: parse a document
+    INGESTION_COMPLETE = 4  # IngestionAgent -> RetrievalAgent: chunks are ready to index
+    QUERY_REQUEST = 5       # CoordinatorAgent -> RetrievalAgent: retrieve chunks for a query
+    RETRIEVAL_RESULT = 6    # RetrievalAgent -> LLMResponseAgent: context for a query
+    PARTIAL_RESPONSE = 7    # LLMResponseAgent -> CoordinatorAgent: a streamed piece of the answer
+    FINAL_RESPONSE = 8      # LLMResponseAgent -> CoordinatorAgent: the complete answer
+    ERROR_MESSAGE = 9       # Any agent -> CoordinatorAgent: processing failed
+    UI_UPLOAD_BATCH_REQUEST = 10  # UI -> CoordinatorAgent: several documents were uploaded together
+    UPLOAD_DOCUMENT_BATCH = 11    # CoordinatorAgent -> IngestionAgent: parse several documents
+    INGESTION_BATCH_COMPLETE = 12 # IngestionAgent -> RetrievalAgent: chunks of several documents
+    CACHE_STATS = 13              # Any -> RetrievalAgent: request query cache statistics (also the reply)
+
+# Source of trace IDs. Trace IDs only need to be unique within the running process,
+# so a counter is used instead of UUIDs: small ints are cheaper to create, copy,
+# hash and compare. next() on itertools.count is atomic under the GIL.
+_trace_counter = itertools.count(1)
+
+def new_trace_id() -> int:
+    """
+    Returns a new trace ID, unique within this process.
+
+    Returns:
+        int: The trace ID.
+    """
+    return next(_trace_counter)
 
 # Define the Model Context Protocol (MCP) message structure using a dataclass.
 # This ensures consistency and type safety for messages exchanged between agents.
-@dataclass
+# slots=True stores the fields in fixed slots instead of a per-instance __dict__,
+# which makes each message smaller and faster to create and to read from.
+@dataclass(slots=True)
 class MCPMessage:
     """
     Represents a message conforming to the Model Context Protocol (MCP).
@@ -14,18 +59,50 @@ class MCPMessage:
     Attributes:
         sender (str): The name of the agent sending the message.
         receiver (str): The name of the agent intended to receive the message.
-        type (str): The type of message (e.g., "UPLOAD_DOCUMENT", "QUERY_REQUEST",
-                    "INGESTION_COMPLETE", "RETRIEVAL_RESULT", "FINAL_RESPONSE").
-        trace_id (str): A unique identifier to trace a conversation or task flow.
+        type (MessageType): The type of message (e.g., MessageType.UPLOAD_DOCUMENT,
+                            MessageType.QUERY_REQUEST, MessageType.FINAL_RESPONSE).
+        trace_id (int): A unique identifier to trace a conversation or task flow.
                         Generated automatically if not provided.
         payload (Dict[str, Any]): The actual data being transmitted.
                                   Contents vary based on message type.
     """
     sender: str
     receiver: str
-    type: str
+    type: MessageType
     payload: Dict[str, Any] = field(default_factory=dict)
-    trace_id: str = field(default_factory=lambda: str(uuid.uuid4()))
+    trace_id: int = field(default_factory=new_trace_id)
+
+    def to_json(self) -> bytes:
+        """
+        Serializes the message to JSON, e.g. to send it to another process.
+
+        orjson encodes dataclasses (and the MessageType, as its integer value)
+        natively in C, without first converting the message to a dict.
+        The payload must be JSON-serializable; tuples are encoded as lists.
+
+        Returns:
+            bytes: The UTF-8 encoded JSON.
+        """
+        return orjson.dumps(self)
+
+    @classmethod
+    def from_json(cls, data: bytes) -> "MCPMessage":
+        """
+        Deserializes a message produced by to_json.
+
+        Args:
+            data (bytes): The JSON-encoded message.
+
+        Returns:
+            MCPMessage: The decoded message, keeping its original trace_id.
+
+        Raises:
+            orjson.JSONDecodeError: If 'data' is not valid JSON.
+            ValueError: If the message type is unknown.
+        """
+        fields = orjson.loads(data)
+        fields["type"] = MessageType(fields["type"])
+        return cls(**fields)
 
 # A simple in-memory message bus to simulate communication between agents.
 # In a more complex system, this could be a real message queue (e.g., RabbitMQ, Kafka)
@@ -34,15 +111,21 @@ class MessageBus:
     """
     A simple in-memory message bus for inter-agent communication.
     Agents can register handlers for specific message types and send messages.
+    A handler only receives the message types it subscribed to.
     """
     def __init__(self):
         # Dictionary to store registered handlers.
-        # Key: receiver agent name (str), Value: list of handler functions (Callable)
-        self._handlers: Dict[str, List[Callable[[MCPMessage], None]]] = {}
-        # List to store messages temporarily if no handler is immediately available
-        self._message_queue: List[MCPMessage] = []
+        # Key: receiver agent name (str), Value: list of (handler function, subscribed
+        # message types) pairs. A types value of None means every type is delivered.
+        self._handlers: Dict[str, List[Tuple[Callable[[MCPMessage], None], Optional[FrozenSet[MessageType]]]]] = {}
+        # Fast path for the common case of a receiver with exactly one handler:
+        # receiver name -> (handler function, subscribed message types).
+        self._single_handlers: Dict[str, Tuple[Callable[[MCPMessage], None], Optional[FrozenSet[MessageType]]]] = {}
+        # Queue to store messages temporarily if no handler is immediately available
+        self._message_queue: Deque[MCPMessage] = deque()
 
-    def register_handler(self, receiver_name: str, handler_func: Callable[[MCPMessage], None]):
+    def register_handler(self, receiver_name: str, handler_func: Callable[[MCPMessage], None],
+                         types: Optional[Iterable[MessageType]] = None):
         """
         Registers a handler function for a specific receiver agent.
         When a message is sent to 'receiver_name', the 'handler_func' will be called.
@@ -52,43 +135,80 @@ class MessageBus:
             handler_func (Callable): The function to call when a message for
                                      this receiver is received. It must accept
                                      one argument: an MCPMessage object.
+            types (Optional[Iterable[MessageType]]): The message types the handler
+                                                     consumes; messages of other types
+                                                     are not delivered to it. None
+                                                     subscribes to every type.
         """
         if receiver_name not in self._handlers:
             self._handlers[receiver_name] = []
-        self._handlers[receiver_name].append(handler_func)
-        print(f"MessageBus: Handler registered for {receiver_name}")
+        handlers = self._handlers[receiver_name]
+        handlers.append((handler_func, frozenset(types) if types is not None else None))
+        if len(handlers) == 1:
+            self._single_handlers[receiver_name] = handlers[0]
+        else:
+            self._single_handlers.pop(receiver_name, None)
+        logger.debug("Handler registered for %s", receiver_name)
 
     def send_message(self, message: MCPMessage):
         """
         Sends an MCPMessage to its intended receiver.
-        If a handler is registered for the receiver, the message is processed immediately.
+        If a handler is registered for the receiver, the message is processed immediately
+        by each of its handlers that subscribed to the message's type.
         Otherwise, it's added to a queue (though for this synchronous model,
         handlers should typically be registered before messages are sent).
 
+        Messages are delivered in-process by reference: the payload is never
+        serialized or copied, so handing a large payload (e.g. a document's
+        raw text) to another agent costs no more than handing over a small one.
+
         Args:
             message (MCPMessage): The message to send.
         """
-        print(f"MessageBus: Sending message from {message.sender} to {message.receiver} "
-              f"of type '{message.type}' (Trace ID: {message.trace_id})")
+        # Per-message tracing is only formatted when DEBUG logging is enabled.
+        logger.debug("Sending message from %s to %s of type '%s' (Trace ID: %s)",
+                     message.sender, message.receiver, message.type.name, message.trace_id)
         
+        # Every agent registers a single handler, so most messages are delivered
+        # with one dict lookup and no loop over the handler list.
+        single = self._single_handlers.get(message.receiver)
+        if single is not None:
+            handler, types = single
+            if types is None or message.type in types:
+                try:
+                    handler(message)
+                except Exception as e:
+                    logger.error("Handler for %s failed to process message type '%s': %s",
+                                 message.receiver, message.type.name, e)
+            return
+
         # Find handlers for the intended receiver
         handlers = self._handlers.get(message.receiver)
 
         if handlers:
-            for handler in handlers:
-                try:
-                    # Call the handler function with the message
-                    handler(message)
-                except Exception as e:
-                    print(f"MessageBus Error: Handler for {message.receiver} failed "
-                          f"to process message type '{message.type}': {e}")
+            self._deliver(message, handlers)
         else:
             # If no handler is registered, queue the message.
             # In this project's synchronous flow, this might indicate an issue
             # or a message intended for a future state.
             self._message_queue.append(message)
-            print(f"MessageBus Warning: No handler registered for {message.receiver}. "
-                  f"Message queued. Current queue size: {len(self._message_queue)}")
+            logger.warning("No handler registered for %s. Message queued. Current queue size: %d",
+                           message.receiver, len(self._message_queue))
+
+    @staticmethod
+    def _deliver(message: MCPMessage,
+                 handlers: List[Tuple[Callable[[MCPMessage], None], Optional[FrozenSet[MessageType]]]]):
+        """Calls each of 'handlers' that subscribed to the message's type."""
+        for handler, types in handlers:
+            # Skip handlers that did not subscribe to this message type.
+            if types is not None and message.type not in types:
+                continue
+            try:
+                # Call the handler function with the message
+                handler(message)
+            except Exception as e:
+                logger.error("Handler for %s failed to process message type '%s': %s",
+                             message.receiver, message.type.name, e)
 
     def process_queued_messages(self):
         """
@@ -98,24 +218,21 @@ class MessageBus:
         if not self._message_queue:
             return
 
-        print(f"MessageBus: Attempting to process {len(self._message_queue)} queued messages.")
-        new_queue = []
-        for message in self._message_queue:
+        logger.debug("Attempting to process %d queued messages.", len(self._message_queue))
+        # Each queued message is taken off the front once; messages that still
+        # have no handler go to the back, so their order is preserved.
+        for _ in range(len(self._message_queue)):
+            message = self._message_queue.popleft()
             handlers = self._handlers.get(message.receiver)
             if handlers:
-                for handler in handlers:
-                    try:
-                        handler(message)
-                    except Exception as e:
-                        print(f"MessageBus Error: Queued handler for {message.receiver} failed: {e}")
+                self._deliver(message, handlers)
             else:
-                new_queue.append(message) # Still no handler, keep in queue
+                self._message_queue.append(message) # Still no handler, keep in queue
 
-        self._message_queue = new_queue
         if self._message_queue:
-            print(f"MessageBus: {len(self._message_queue)} messages remain in queue after processing.")
+            logger.warning("%d messages remain in queue after processing.", len(self._message_queue))
         else:
-            print("MessageBus: All queued messages processed.")
+            logger.debug("All queued messages processed.")
 
 # Global instance of the MessageBus for easy access across agents.
 # In a production system, this might be passed as a dependency.
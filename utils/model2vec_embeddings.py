@@ -0,0 +1,72 @@
+# rag_chatbot/utils/model2vec_embeddings.py
+
+from typing import List
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from model2vec import StaticModel
+
+class Model2VecEmbeddings(Embeddings):
+    """
+    LangChain embeddings computed with a Model2Vec static model: a table of token
+    embeddings distilled from a Sentence Transformers model. Embedding a text is
+    tokenization followed by averaging table rows, with no transformer forward
+    pass, so it is orders of magnitude faster on a CPU, at some cost in quality.
+
+    The vectors are L2-normalized like those of the other backends, so the index
+    can rank them by inner product.
+    """
+    def __init__(self, model_name: str, batch_size: int = 1024):
+        """
+        Loads the static model.
+
+        Args:
+            model_name (str): The Hugging Face model ID, e.g. "minishlab/potion-base-8M".
+            batch_size (int): The number of texts encoded per call into the model.
+        """
+        self.batch_size = batch_size
+        self.model = StaticModel.from_pretrained(model_name)
+
+    @property
+    def dimension(self) -> int:
+        """The size of the embeddings."""
+        return self.model.dim
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds a list of texts into a float32 matrix.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            np.ndarray: A (len(texts), dimension) matrix with one embedding per row.
+        """
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        embeddings = np.asarray(self.model.encode(texts, batch_size=self.batch_size), dtype=np.float32)
+        return embeddings / np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds a list of texts (see encode).
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[List[float]]: One embedding per text.
+        """
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a single query.
+
+        Args:
+            text (str): The query to embed.
+
+        Returns:
+            List[float]: The query embedding.
+        """
+        return self.encode([text])[0].tolist()
@@ -0,0 +1,184 @@
+# rag_chatbot/utils/onnx_embeddings.py
+
+import os
+import platform
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import numpy as np
+import onnxruntime as ort
+from langchain_core.embeddings import Embeddings
+from optimum.onnxruntime import ORTModelForFeatureExtraction
+from transformers import AutoTokenizer
+
+def select_quantized_onnx_file() -> str:
+    """
+    Picks the int8 ONNX export best suited to this CPU, among those published with
+    Sentence Transformers models. AVX-512 VNNI executes int8 dot products in a
+    single instruction, so its export is preferred where available.
+
+    Returns:
+        str: The path of the ONNX file within the model repository.
+    """
+    if platform.machine().lower() in ("arm64", "aarch64"):
+        return "onnx/model_qint8_arm64.onnx"
+    flags = set()
+    try:
+        with open("/proc/cpuinfo", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("flags"):
+                    flags = set(line.split(":", 1)[1].split())
+                    break
+    except OSError:
+        pass # Not Linux; use the most widely supported export
+    if "avx512_vnni" in flags:
+        return "onnx/model_qint8_avx512_vnni.onnx"
+    if "avx512f" in flags:
+        return "onnx/model_qint8_avx512.onnx"
+    return "onnx/model_quint8_avx2.onnx"
+
+class OnnxEmbeddings(Embeddings):
+    """
+    LangChain embeddings computed with an int8-quantized ONNX export of a
+    Sentence Transformers model, run on the CPU by ONNX Runtime.
+
+    The output matches the model's Sentence Transformers pipeline (mean pooling
+    over the tokens followed by L2 normalization), so the vectors can be used in
+    place of those produced by SentenceTransformerEmbeddings.
+
+    Several ONNX Runtime sessions can be loaded, each with an equal share of the
+    CPU cores. ONNX Runtime releases the GIL while it runs, so the batches of a
+    large encode call run in parallel on different sessions, and a query embedded
+    while documents are being encoded gets a session of its own instead of
+    competing for the threads of a shared one.
+    """
+    def __init__(self, model_name: str, file_name: str, batch_size: int = 64, max_length: int = 256,
+                 sessions: int = 1):
+        """
+        Loads the tokenizer and the quantized ONNX model.
+
+        Args:
+            model_name (str): The Hugging Face model ID, e.g. "sentence-transformers/all-MiniLM-L6-v2".
+            file_name (str): The path of the quantized ONNX file within the model repository.
+            batch_size (int): The number of texts encoded per forward pass.
+            max_length (int): Texts are truncated to this many tokens.
+            sessions (int): The number of ONNX Runtime sessions (model copies) to load.
+        """
+        self.batch_size = batch_size
+        self.max_length = max_length
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        # Tokenizing sets the padding and truncation state of the Rust tokenizer,
+        # which fails if two threads do it at once.
+        self._tokenizer_lock = threading.Lock()
+
+        session_options = ort.SessionOptions()
+        session_options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if sessions > 1:
+            # Each session gets its share of the cores, so parallel runs do not oversubscribe them.
+            session_options.intra_op_num_threads = max(1, (os.cpu_count() or 1) // sessions)
+        models = [
+            ORTModelForFeatureExtraction.from_pretrained(
+                model_name,
+                file_name=file_name,
+                provider="CPUExecutionProvider",
+                session_options=session_options
+            )
+            for _ in range(sessions)
+        ]
+        self.model = models[0]
+        # Sessions not currently running a batch. Every forward pass borrows one.
+        self._idle_models: "queue.SimpleQueue[ORTModelForFeatureExtraction]" = queue.SimpleQueue()
+        for model in models:
+            self._idle_models.put(model)
+        self._executor = (ThreadPoolExecutor(max_workers=sessions, thread_name_prefix="onnx-embed")
+                          if sessions > 1 else None)
+
+    @property
+    def dimension(self) -> int:
+        """The size of the embeddings."""
+        return self.model.config.hidden_size
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        """Encodes a batch of texts into normalized float32 embeddings."""
+        with self._tokenizer_lock:
+            inputs = self.tokenizer(texts, padding=True, truncation=True,
+                                    max_length=self.max_length, return_tensors="np")
+        return self._forward(inputs)
+
+    def _forward(self, inputs) -> np.ndarray:
+        """Runs an idle session on a padded batch of token IDs and pools the output."""
+        model = self._idle_models.get()
+        try:
+            token_embeddings = model(**inputs).last_hidden_state
+        finally:
+            self._idle_models.put(model)
+        # Mean pooling over the non-padding tokens
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        return pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds a list of texts into a float32 matrix.
+
+        All texts are tokenized up front (without padding), then encoded in
+        batches of similar token counts, so each batch is padded only as much as
+        its longest sequence requires. Sorting by token count rather than by
+        character count keeps, e.g., short tables of numbers (many tokens per
+        character) out of batches of prose. The results are returned in the
+        original order.
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            np.ndarray: A (len(texts), dimension) matrix with one embedding per row.
+        """
+        if not texts:
+            return np.empty((0, self.dimension), dtype=np.float32)
+        with self._tokenizer_lock:
+            encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length)
+        input_ids = encoded["input_ids"]
+        order = sorted(range(len(texts)), key=lambda i: len(input_ids[i]))
+        embeddings = np.empty((len(texts), self.dimension), dtype=np.float32)
+
+        def _encode_batch(batch: List[int]):
+            # Pad the already tokenized texts instead of tokenizing them again.
+            inputs = self.tokenizer.pad({key: [values[i] for i in batch] for key, values in encoded.items()},
+                                        return_tensors="np")
+            embeddings[batch] = self._forward(inputs) # Batches write disjoint rows
+
+        batches = [order[start:start + self.batch_size] for start in range(0, len(order), self.batch_size)]
+        if self._executor is None or len(batches) == 1:
+            for batch in batches:
+                _encode_batch(batch)
+        else:
+            # list() waits for every batch and re-raises the first error.
+            list(self._executor.map(_encode_batch, batches))
+        return embeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embeds a list of texts (see encode).
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            List[List[float]]: One embedding per text.
+        """
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        """
+        Embeds a single query.
+
+        Args:
+            text (str): The query to embed.
+
+        Returns:
+            List[float]: The query embedding.
+        """
+        return self._encode([text])[0].tolist()
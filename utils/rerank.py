@@ -0,0 +1,69 @@
+# rag_chatbot/utils/rerank.py
+
+from typing import List
+
+import numpy as np
+
+# SimSIMD provides SIMD (AVX2/AVX-512/NEON) kernels for distance computations.
+# It is optional: numpy matrix products are used when it is not installed.
+try:
+    import simsimd
+except ImportError:
+    simsimd = None
+
+def _cosine_similarities(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Computes the cosine similarity of every row of 'a' with every row of 'b'.
+
+    Args:
+        a (np.ndarray): A (n, d) float32 matrix.
+        b (np.ndarray): A (m, d) float32 matrix.
+
+    Returns:
+        np.ndarray: The (n, m) similarity matrix.
+    """
+    if simsimd is not None:
+        # cdist returns cosine distances, computed for all pairs in one call.
+        return 1.0 - np.asarray(simsimd.cdist(a, b, metric="cosine"), dtype=np.float32)
+    a = a / np.clip(np.linalg.norm(a, axis=1, keepdims=True), 1e-12, None)
+    b = b / np.clip(np.linalg.norm(b, axis=1, keepdims=True), 1e-12, None)
+    return a @ b.T
+
+def mmr_rerank(query_emb, doc_embs, lambda_: float = 0.5, k: int = 4) -> List[int]:
+    """
+    Selects 'k' documents by Maximal Marginal Relevance: each pick maximizes
+    lambda_ * similarity to the query - (1 - lambda_) * similarity to the
+    documents already picked, trading relevance against redundancy.
+
+    All similarities are computed up front (one query-to-documents and one
+    documents-to-documents matrix), so the selection loop only indexes arrays.
+
+    Args:
+        query_emb: The query embedding, of dimension d.
+        doc_embs: The candidate document embeddings, as a (n, d) array.
+        lambda_ (float): 1.0 ranks purely by relevance, 0.0 purely by diversity.
+        k (int): The number of documents to select.
+
+    Returns:
+        List[int]: The indices of the selected documents in 'doc_embs', in rank order.
+    """
+    docs = np.ascontiguousarray(doc_embs, dtype=np.float32)
+    if docs.shape[0] == 0:
+        return []
+    query = np.ascontiguousarray(query_emb, dtype=np.float32).reshape(1, -1)
+    relevance = _cosine_similarities(query, docs)[0]
+    pairwise = _cosine_similarities(docs, docs)
+
+    selected = [int(np.argmax(relevance))]
+    # Highest similarity of each candidate to any selected document
+    redundancy = pairwise[selected[0]].copy()
+    available = np.ones(docs.shape[0], dtype=bool)
+    available[selected[0]] = False
+    while len(selected) < min(k, docs.shape[0]):
+        scores = lambda_ * relevance - (1.0 - lambda_) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        available[best] = False
+        np.maximum(redundancy, pairwise[best], out=redundancy)
+    return selected
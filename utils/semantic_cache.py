@@ -0,0 +1,99 @@
+# rag_chatbot/utils/semantic_cache.py
+
+import threading
+import time
+from typing import Any, List, Optional
+
+import numpy as np
+
+class SemanticCache:
+    """
+    A fixed-size cache keyed by embedding vectors rather than exact keys.
+
+    A lookup returns the value stored for the most similar cached vector, provided
+    its cosine similarity to the query vector reaches the configured threshold.
+    Vectors are normalized on insertion and kept in one contiguous matrix, so a
+    lookup is a single matrix-vector product. When the cache is full, the oldest
+    entry is replaced.
+    """
+    def __init__(self, dimension: int, maxsize: int, threshold: float, ttl: Optional[float] = None):
+        """
+        Initializes an empty cache.
+
+        Args:
+            dimension (int): The dimensionality of the embedding vectors.
+            maxsize (int): The maximum number of entries to keep.
+            threshold (float): The minimum cosine similarity for a cache hit.
+            ttl (Optional[float]): Seconds after which an entry expires. None keeps
+                                   entries until they are replaced.
+        """
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        self._vectors = np.zeros((maxsize, dimension), dtype=np.float32)
+        self._expires_at = np.full(maxsize, np.inf)
+        self._values: List[Any] = [None] * maxsize
+        self._size = 0 # Number of slots in use
+        self._next = 0 # Slot written by the next insertion
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _normalize(vector) -> Optional[np.ndarray]:
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            return None
+        return vector / norm
+
+    def get(self, vector) -> Optional[Any]:
+        """
+        Returns the value stored for the cached vector most similar to 'vector'.
+
+        Args:
+            vector: The query embedding.
+
+        Returns:
+            Optional[Any]: The cached value, or None if no cached vector is similar enough.
+        """
+        query = self._normalize(vector)
+        if query is None:
+            return None
+        with self._lock:
+            if self._size == 0:
+                return None
+            similarities = self._vectors[:self._size] @ query
+            # Expired entries never match.
+            similarities[self._expires_at[:self._size] <= time.monotonic()] = -np.inf
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                return None
+            return self._values[best]
+
+    def put(self, vector, value: Any):
+        """
+        Stores 'value' under 'vector', replacing the oldest entry if the cache is full.
+
+        Args:
+            vector: The key embedding.
+            value (Any): The value to cache.
+        """
+        key = self._normalize(vector)
+        if key is None:
+            return
+        with self._lock:
+            slot = self._next
+            self._vectors[slot] = key
+            self._expires_at[slot] = time.monotonic() + self.ttl if self.ttl is not None else np.inf
+            self._values[slot] = value
+            self._next = (slot + 1) % self.maxsize
+            self._size = max(self._size, slot + 1)
+
+    def clear(self):
+        """Removes all entries from the cache."""
+        with self._lock:
+            self._values = [None] * self.maxsize
+            self._size = 0
+            self._next = 0
+
+    def __len__(self) -> int:
+        return self._size
@@ -0,0 +1,115 @@
+# rag_chatbot/utils/text_chunker.py
+
+from typing import Iterable, Iterator, Tuple
+
+# Import configuration settings
+from config import CHUNK_SIZE, CHUNK_OVERLAP
+
+# Separators tried, in order of preference, when choosing where a chunk ends.
+# This mirrors the behaviour of LangChain's RecursiveCharacterTextSplitter:
+# paragraph breaks first, then line breaks, then sentence ends, then spaces, then
+# a hard cut. Separators of the same level are equally good; the one closest to
+# the size limit wins. Every lookup is a bounded str.rfind/str.find, so the text
+# is scanned in C rather than character by character in Python.
+_SEPARATORS = (("\n\n",), ("\n",), (". ", "! ", "? "), (" ",))
+
+def _find_chunk_end(text: str, start: int, chunk_size: int, min_size: int) -> int:
+    """
+    Finds where a chunk beginning at 'start' should end.
+
+    Args:
+        text (str): The text being chunked.
+        start (int): The index at which the chunk begins.
+        chunk_size (int): The maximum number of characters in the chunk.
+        min_size (int): The minimum number of characters in the chunk, which
+                        guarantees progress past the overlap region.
+
+    Returns:
+        int: The (exclusive) end index of the chunk.
+    """
+    limit = start + chunk_size
+    for level in _SEPARATORS:
+        end = max(text.rfind(separator, start + min_size, limit) + len(separator) for separator in level)
+        if end > start + min_size: # rfind returned -1 for all, at most len(separator) - 1 here
+            return end
+    return limit
+
+def _find_next_start(text: str, end: int, chunk_overlap: int) -> int:
+    """
+    Finds where the chunk following one that ends at 'end' should begin, so that
+    consecutive chunks share roughly 'chunk_overlap' characters without starting
+    in the middle of a word.
+    """
+    if chunk_overlap == 0:
+        return end
+    start = end - chunk_overlap
+    for level in _SEPARATORS:
+        found = [idx + len(separator) for separator in level
+                 if (idx := text.find(separator, start, end)) != -1]
+        if found:
+            return min(found)
+    return start
+
+def chunk_stream(segments: Iterable[str], chunk_size: int = CHUNK_SIZE,
+                 chunk_overlap: int = CHUNK_OVERLAP) -> Iterator[Tuple[int, str]]:
+    """
+    Splits a stream of text segments (e.g. pages or paragraphs) into overlapping chunks.
+
+    Only the text that has not yet been emitted is kept in memory, so a document can
+    be chunked while it is still being parsed.
+
+    Args:
+        segments (Iterable[str]): Consecutive pieces of a document's text.
+        chunk_size (int): The maximum number of characters in each chunk.
+        chunk_overlap (int): The number of characters to overlap between consecutive chunks.
+
+    Yields:
+        Tuple[int, str]: The chunk's start index within the full text, and the chunk
+                         text with surrounding whitespace stripped.
+
+    Raises:
+        ValueError: If chunk_overlap is not smaller than chunk_size.
+    """
+    if chunk_overlap >= chunk_size:
+        raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size}).")
+
+    buffer = ""
+    offset = 0 # Position of buffer[0] within the full text
+    start = 0 # Start of the next chunk within the buffer
+    emitted_end = 0 # End of the last emitted chunk within the buffer
+    min_size = chunk_overlap + 1
+
+    def _emit(chunk_start: int, chunk_end: int):
+        chunk = buffer[chunk_start:chunk_end]
+        stripped = chunk.lstrip()
+        leading = len(chunk) - len(stripped)
+        stripped = stripped.rstrip()
+        if stripped:
+            return offset + chunk_start + leading, stripped
+        return None
+
+    for segment in segments:
+        if not segment:
+            continue
+        # Drop the already-emitted head of the buffer before appending, so each
+        # segment costs one copy of the pending text.
+        if start:
+            buffer = buffer[start:]
+            offset += start
+            emitted_end -= start
+            start = 0
+        buffer += segment
+
+        while len(buffer) - start > chunk_size:
+            end = _find_chunk_end(buffer, start, chunk_size, min_size)
+            chunk = _emit(start, end)
+            if chunk:
+                yield chunk
+            emitted_end = end
+            start = _find_next_start(buffer, end, chunk_overlap)
+
+    # Emit the remaining text, unless it is entirely covered by the previous chunk.
+    if len(buffer) > emitted_end:
+        chunk = _emit(start, len(buffer))
+        if chunk:
+            yield chunk
@@ -1,16 +1,117 @@
 # rag_chatbot/utils/vector_store_manager.py
 
+import atexit
+import ctypes
+import logging
+import mmap
 import os
-from typing import List, Dict, Any, Optional
+import pickle
+import shutil
+import threading
+import time
+from typing import List, Dict, Any, Iterable, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+import torch
+
+# datasketch provides MinHash LSH for near-duplicate chunk detection. It is
+# optional and only used when CHUNK_NEAR_DUP_THRESHOLD is set.
+try:
+    from datasketch import MinHash, MinHashLSH
+except ImportError:
+    MinHash = MinHashLSH = None
 
 # LangChain components
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import DistanceStrategy
 from langchain_community.embeddings import SentenceTransformerEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document as LangchainDocument
+from langchain_core.embeddings import Embeddings
+
+from utils.cache import FINGERPRINT_ALGORITHM, fingerprint
+from utils.chunk_store import open_chunk_store
+from utils.text_chunker import chunk_stream
 
 # Import configuration settings
-from config import EMBEDDING_MODEL_NAME, CHUNK_SIZE, CHUNK_OVERLAP, FAISS_INDEX_PATH
+from config import (
+    EMBEDDING_MODEL_NAME, EMBEDDING_BATCH_SIZE, EMBEDDING_BATCH_SIZE_GPU, EMBEDDING_BACKEND, EMBEDDING_DTYPE, EMBEDDING_ONNX_FILE, EMBEDDING_ONNX_SESSIONS, EMBEDDING_MODEL2VEC_NAME,
+    CHUNK_SIZE, CHUNK_OVERLAP, FAISS_INDEX_PATH,
+    FAISS_QUANTIZER, FAISS_IVF_MIN_VECTORS, FAISS_IVF_NLIST, FAISS_PQ_M, FAISS_FASTSCAN_M, FAISS_NPROBE, FAISS_TRAIN_MAX_VECTORS,
+    FAISS_MMAP, FAISS_PREFETCH_LISTS, FAISS_SAVE_EVERY_CHUNKS, FAISS_SAVE_INTERVAL, FAISS_BINARY_PREFILTER,
+    FAISS_BINARY_PREFILTER_FACTOR, CHUNK_NEAR_DUP_THRESHOLD, CHUNK_MINHASH_PERMUTATIONS
+)
+
+logger = logging.getLogger(__name__)
+
+# Chunk fingerprints are saved next to the index, so they need not be recomputed
+# from every chunk's text at startup. The content hashes of the indexed files are
+# saved with them. The version is bumped whenever VectorStoreManager._chunk_hash
+# or the file layout changes, which invalidates saved fingerprints.
+_CHUNK_HASHES_FILE = "chunk_hashes.npz"
+_CHUNK_HASH_VERSION = 2
+
+# The chunk texts and metadata (see utils.chunk_store.ChunkStore). The file is only
+# ever appended to, so it lives outside the index directory and is not copied on save.
+# All VectorStoreManagers of the process share one ChunkStore for it.
+_CHUNK_STORE_PATH = FAISS_INDEX_PATH + ".chunks"
+
+# madvise from the C library, for prefetching pages of the memory-mapped index
+# (see VectorStoreManager._prefetch_inverted_lists). None where it is unavailable.
+try:
+    _madvise = ctypes.CDLL(None, use_errno=True).madvise
+    _madvise.argtypes = (ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int)
+    _madvise.restype = ctypes.c_int
+except (OSError, AttributeError, TypeError):
+    _madvise = None # E.g. Windows
+_MADV_WILLNEED = 3 # The same value on Linux and macOS
+
+def _advise_willneed(address: int, length: int):
+    """Asks the kernel to read in the memory-mapped pages covering [address, address + length)."""
+    start = address & ~(mmap.PAGESIZE - 1) # madvise needs a page-aligned address
+    _madvise(start, address + length - start, _MADV_WILLNEED)
+
+# A save writes a complete copy of the index directory next to it, then swaps the
+# two with renames, so a crash mid-save never leaves a half-written index behind.
+_SAVE_TMP_PATH = FAISS_INDEX_PATH + ".tmp"
+_SAVE_OLD_PATH = FAISS_INDEX_PATH + ".old"
+
+# The embedding model, shared by all VectorStoreManager instances (Streamlit creates
+# one per browser session) and loaded on first use (see _SharedEmbeddings).
+_embedding_model: Optional[Embeddings] = None
+_embedding_model_lock = threading.Lock()
+
+class _SharedEmbeddings(Embeddings):
+    """
+    Stands in for the embedding model until it is first needed. The model weights
+    take seconds to load and hundreds of MB of memory; loading them on the first
+    embedding call lets the index load without waiting for them, and makes every
+    VectorStoreManager in the process use one copy.
+    """
+    @property
+    def model(self) -> Embeddings:
+        """The shared embedding model, loaded on first access."""
+        global _embedding_model
+        if _embedding_model is None:
+            with _embedding_model_lock:
+                if _embedding_model is None: # Another thread may have loaded it meanwhile
+                    _embedding_model = VectorStoreManager._create_embeddings()
+        return _embedding_model
+
+    @property
+    def dimension(self) -> int:
+        """The size of the model's embeddings."""
+        model = self.model
+        if isinstance(model, SentenceTransformerEmbeddings):
+            return model.client.get_sentence_embedding_dimension()
+        return model.dimension # OnnxEmbeddings or Model2VecEmbeddings
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.model.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.model.embed_query(text)
 
 class VectorStoreManager:
     """
@@ -18,60 +119,513 @@ class VectorStoreManager:
     document chunking, adding documents, and retrieval.
     """
     def __init__(self):
-        # Initialize the embedding model.
-        # SentenceTransformerEmbeddings uses the 'sentence-transformers' library.
-        self.embeddings = SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL_NAME)
-        
-        # Initialize the text splitter for breaking down large documents.
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=CHUNK_SIZE,
-            chunk_overlap=CHUNK_OVERLAP,
-            length_function=len,
-            add_start_index=True, # Adds metadata about the chunk's original position
-        )
+        # The embedding model, loaded on first use and shared with other instances.
+        self.embeddings = _SharedEmbeddings()
         
         # Initialize FAISS vector store as None; it will be loaded or created later.
         self.vector_store: Optional[FAISS] = None
+        # Fingerprints of the indexed chunk texts, so a chunk is never indexed twice,
+        # and content hashes of the indexed files, so a re-uploaded file can be skipped.
+        # Both are loaded (or rebuilt from the docstore) when an index is loaded.
+        self._chunk_hashes: Set[int] = set()
+        self._document_hashes: Set[str] = set()
+        # MinHash LSH index of the indexed chunks, keyed by the same fingerprints,
+        # for skipping near-duplicates (e.g. repeated headers with a different page number).
+        self._near_dup_index = None
+        if CHUNK_NEAR_DUP_THRESHOLD is not None:
+            if MinHashLSH is None:
+                logger.warning("datasketch not installed; near-duplicate chunk detection is disabled.")
+            else:
+                self._near_dup_index = MinHashLSH(threshold=CHUNK_NEAR_DUP_THRESHOLD,
+                                                  num_perm=CHUNK_MINHASH_PERMUTATIONS)
+        # Guards the FAISS index: searches and additions may come from different
+        # threads, and FAISS indexes are not safe to search while being modified.
+        # Embedding, the slow part of both, happens outside the lock.
+        self._index_lock = threading.Lock()
+        # Whether the index is a read-only memory map of the file on disk (see _read_vector_store).
+        self._index_mmapped = False
+        # Sign bits of every vector of the main index, at the same positions, for
+        # the Hamming prefilter (see _prefiltered_search). Rebuilt when an index is loaded.
+        self._binary_index: Optional[faiss.IndexBinaryFlat] = None
+        # Serializes additions with saves, so the index is never written to disk
+        # while documents are being appended to it.
+        self._write_lock = threading.Lock()
+        # Chunks added since the index was last saved (see _maybe_save_vector_store),
+        # plus one per batch of file hashes recorded without adding any chunk.
+        self._unsaved_chunks = 0
+        self._last_save = time.monotonic()
+        self._flush_timer: Optional[threading.Timer] = None
         self._load_or_create_vector_store()
+        if FAISS_BINARY_PREFILTER:
+            self._build_binary_index()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def _create_embeddings() -> Embeddings:
+        """
+        Creates the embedding model selected by EMBEDDING_BACKEND and EMBEDDING_DTYPE.
+
+        Returns:
+            Embeddings: The LangChain embeddings object.
+
+        Raises:
+            ValueError: If EMBEDDING_BACKEND is not supported.
+            Exception: If EMBEDDING_BACKEND is "model2vec" and its model cannot be loaded.
+        """
+        if EMBEDDING_BACKEND == "onnx-int8":
+            # Imported here so optimum/onnxruntime are only needed for this backend.
+            try:
+                from utils.onnx_embeddings import OnnxEmbeddings, select_quantized_onnx_file
+                model_id = EMBEDDING_MODEL_NAME if "/" in EMBEDDING_MODEL_NAME else f"sentence-transformers/{EMBEDDING_MODEL_NAME}"
+                onnx_file = EMBEDDING_ONNX_FILE or select_quantized_onnx_file()
+                sessions = EMBEDDING_ONNX_SESSIONS or min(4, os.cpu_count() or 1)
+                logger.info("Loading int8 ONNX embedding model %s (%s, %d sessions).", model_id, onnx_file, sessions)
+                return OnnxEmbeddings(model_id, onnx_file, batch_size=EMBEDDING_BATCH_SIZE, sessions=sessions)
+            except Exception as e:
+                # E.g. optimum not installed, or no such export for this model.
+                logger.warning("Could not load the int8 ONNX embedding model (%s); using the torch backend.", e)
+        elif EMBEDDING_BACKEND == "model2vec":
+            # Imported here so model2vec is only needed for this backend. There is no
+            # fallback: the torch model's embeddings have a different size (and meaning),
+            # so they could neither be added to nor searched in a Model2Vec index.
+            from utils.model2vec_embeddings import Model2VecEmbeddings
+            logger.info("Loading Model2Vec embedding model %s.", EMBEDDING_MODEL2VEC_NAME)
+            return Model2VecEmbeddings(EMBEDDING_MODEL2VEC_NAME)
+        elif EMBEDDING_BACKEND != "torch":
+            raise ValueError(f"Unsupported EMBEDDING_BACKEND: {EMBEDDING_BACKEND}")
+
+        use_cuda = torch.cuda.is_available()
+        use_fp16 = EMBEDDING_DTYPE == "fp16" and use_cuda
+        # SentenceTransformerEmbeddings uses the 'sentence-transformers' library.
+        # SentenceTransformer.encode sorts its input by length before batching,
+        # so each batch is padded only to the length of similar-sized chunks.
+        embeddings = SentenceTransformerEmbeddings(
+            model_name=EMBEDDING_MODEL_NAME,
+            model_kwargs={"device": "cuda" if use_cuda else "cpu"},
+            # Unit-length embeddings make cosine similarity a plain inner product
+            # (see _new_vector_store). The normalization runs on the whole batch.
+            encode_kwargs={"batch_size": EMBEDDING_BATCH_SIZE_GPU if use_cuda else EMBEDDING_BATCH_SIZE,
+                           "show_progress_bar": False, "normalize_embeddings": True}
+        )
+        if use_fp16:
+            # Half precision halves the memory traffic of every forward pass. The
+            # embeddings are still returned (and stored in FAISS) as float32.
+            embeddings.client.half()
+            logger.info("Embedding model running in fp16 on CUDA.")
+        elif use_cuda:
+            logger.info("Embedding model running in fp32 on CUDA.")
+        elif EMBEDDING_DTYPE == "fp16":
+            logger.info("No CUDA device available; embedding model running in fp32 on CPU.")
+        return embeddings
 
     def _load_or_create_vector_store(self):
         """
         Loads an existing FAISS index from disk if it exists,
         otherwise initializes an empty one.
         """
+        if not os.path.exists(FAISS_INDEX_PATH) and os.path.exists(_SAVE_OLD_PATH):
+            # A save was interrupted between its two renames; the previous index is intact.
+            logger.warning("Restoring the FAISS index saved before an interrupted save.")
+            os.replace(_SAVE_OLD_PATH, FAISS_INDEX_PATH)
         if os.path.exists(FAISS_INDEX_PATH):
-            print(f"VectorStoreManager: Loading FAISS index from {FAISS_INDEX_PATH}")
+            logger.info("Loading FAISS index from %s", FAISS_INDEX_PATH)
             try:
                 # Load the FAISS index with the initialized embeddings
-                self.vector_store = FAISS.load_local(FAISS_INDEX_PATH, self.embeddings, allow_dangerous_deserialization=True)
-                print("VectorStoreManager: FAISS index loaded successfully.")
+                self.vector_store = self._read_vector_store()
+                converted = self._convert_docstore()
+                converted |= self._remove_placeholder_text()
+                self._configure_index()
+                self._index_hashes()
+                logger.info("FAISS index loaded successfully.")
+                if self._convert_to_inner_product() or converted:
+                    self._save_vector_store()
             except Exception as e:
-                print(f"VectorStoreManager Error: Could not load FAISS index: {e}. Creating a new one.")
+                logger.error("Could not load FAISS index: %s. Creating a new one.", e)
                 # If loading fails, create a new empty one.
-                self.vector_store = FAISS.from_texts([""], self.embeddings) # Initialize with a dummy text
+                self.vector_store = self._new_vector_store()
                 self._save_vector_store() # Save the newly created empty store
         else:
-            print("VectorStoreManager: No existing FAISS index found. Creating a new one.")
-            # Initialize an empty FAISS store.
-            # FAISS.from_texts requires at least one text to initialize.
-            # We'll add a dummy text and then delete it if necessary, or just overwrite.
-            self.vector_store = FAISS.from_texts([""], self.embeddings)
+            logger.info("No existing FAISS index found. Creating a new one.")
+            self.vector_store = self._new_vector_store()
             self._save_vector_store() # Save the newly created empty store
 
+    def _new_vector_store(self) -> FAISS:
+        """
+        Creates an empty vector store, backed by the process's ChunkStore. Records
+        already in its data file are kept, since another session's index may use them.
+
+        The index is built directly from the model's embedding dimension, rather
+        than with FAISS.from_texts, which needs at least one text to embed.
+
+        All embedding backends return L2-normalized vectors, so the index ranks by
+        inner product (IndexFlatIP), which equals cosine similarity on unit vectors.
+        FAISS's normalize_L2 option is left off: normalizing again on every add
+        and search would only repeat work.
+        """
+        return FAISS(self.embeddings, faiss.IndexFlatIP(self.embeddings.dimension),
+                     open_chunk_store(_CHUNK_STORE_PATH), {},
+                     distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT)
+
+    def _remove_placeholder_text(self) -> bool:
+        """
+        Removes the empty text that stores created by earlier versions started with
+        (FAISS.from_texts needed one text to embed), so it no longer takes a place
+        in search results. It is the first vector of such an index. Vectors can only
+        be removed from a flat index; search results skip it in IVF indexes.
+
+        Returns:
+            bool: Whether the text was removed.
+        """
+        doc_id = self.vector_store.index_to_docstore_id.get(0)
+        if doc_id is None or not isinstance(self.vector_store.index, faiss.IndexFlat):
+            return False
+        doc = self.vector_store.docstore.search(doc_id)
+        if not isinstance(doc, LangchainDocument) or doc.page_content:
+            return False
+        self.vector_store.delete([doc_id])
+        logger.info("Removed the placeholder text from the FAISS index.")
+        return True
+
+    def _convert_docstore(self) -> bool:
+        """
+        Moves the chunks of an index saved with LangChain's pickled InMemoryDocstore
+        into a ChunkStore, keeping their docstore IDs.
+
+        Returns:
+            bool: Whether the docstore was converted.
+        """
+        docstore = self.vector_store.docstore
+        if not isinstance(docstore, InMemoryDocstore):
+            return False
+        chunk_store = open_chunk_store(_CHUNK_STORE_PATH)
+        # Another session may have converted the same saved index already.
+        chunk_store.add({doc_id: doc for doc_id, doc in docstore._dict.items() if doc_id not in chunk_store})
+        self.vector_store.docstore = chunk_store
+        logger.info("Moved %d chunks from the pickled docstore to %s.", len(docstore._dict), _CHUNK_STORE_PATH)
+        return True
+
+    @staticmethod
+    def _distance_strategy(index) -> DistanceStrategy:
+        """Returns the LangChain distance strategy matching a FAISS index's metric."""
+        if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+            return DistanceStrategy.MAX_INNER_PRODUCT
+        # IVF indexes saved before the switch to inner product keep using L2, which
+        # ranks unit vectors in the same order (flat ones are converted on load).
+        return DistanceStrategy.EUCLIDEAN_DISTANCE
+
+    def _convert_to_inner_product(self) -> bool:
+        """
+        Converts a flat L2 index saved before the switch to inner product into an
+        IndexFlatIP holding the same vectors, normalized to unit length. Vectors
+        keep their positions, so the mapping to stored documents stays valid.
+        IVF indexes would need retraining and are left as they are.
+
+        Returns:
+            bool: Whether the index was converted.
+        """
+        index = self.vector_store.index
+        if not isinstance(index, faiss.IndexFlat) or index.metric_type != faiss.METRIC_L2:
+            return False
+        vectors = index.reconstruct_n(0, index.ntotal)
+        faiss.normalize_L2(vectors)
+        ip_index = faiss.IndexFlatIP(index.d)
+        ip_index.add(vectors)
+        self.vector_store.index = ip_index
+        self.vector_store.distance_strategy = DistanceStrategy.MAX_INNER_PRODUCT
+        logger.info("Converted flat L2 FAISS index to inner product (%d vectors).", ip_index.ntotal)
+        return True
+
+    @staticmethod
+    def _binarize(vectors: np.ndarray) -> np.ndarray:
+        """Packs the sign of every component into one bit: (n, d) floats to (n, d / 8) bytes."""
+        return np.packbits(vectors > 0, axis=1)
+
+    def _build_binary_index(self):
+        """Fills the binary prefilter index from the vectors stored in the main index."""
+        index = self.vector_store.index
+        if index.d % 8 != 0:
+            logger.warning("Embedding dimension %d is not a multiple of 8; binary prefilter disabled.", index.d)
+            return
+        binary_index = faiss.IndexBinaryFlat(index.d)
+        try:
+            # In slices, so a large index is never reconstructed into float32 all at once.
+            for start in range(0, index.ntotal, 65536):
+                count = min(65536, index.ntotal - start)
+                binary_index.add(self._binarize(index.reconstruct_n(start, count)))
+        except RuntimeError as e:
+            # The second stage reads vectors back the same way.
+            logger.warning("Cannot read vectors back from the FAISS index (%s); binary prefilter disabled.", e)
+            return
+        self._binary_index = binary_index
+        logger.info("Built binary prefilter index (%d vectors).", self._binary_index.ntotal)
+
+    def _read_vector_store(self) -> FAISS:
+        """
+        Reads the saved vector store. With FAISS_MMAP, an IVF index is memory-mapped
+        read-only instead of being read into RAM: startup does not depend on the
+        index size, and only the inverted lists that queries touch are paged in.
+
+        Returns:
+            FAISS: The loaded vector store.
+        """
+        if not FAISS_MMAP:
+            vector_store = FAISS.load_local(FAISS_INDEX_PATH, self.embeddings, allow_dangerous_deserialization=True)
+            vector_store.distance_strategy = self._distance_strategy(vector_store.index)
+            return vector_store
+
+        # The same files FAISS.save_local writes and FAISS.load_local reads.
+        index_file = os.path.join(FAISS_INDEX_PATH, "index.faiss")
+        self._advise_index_file(index_file)
+        index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        with open(os.path.join(FAISS_INDEX_PATH, "index.pkl"), "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        # Only the inverted lists of IVF indexes are memory-mapped; other index
+        # types are read into RAM as usual and stay writable.
+        self._index_mmapped = faiss.try_extract_index_ivf(index) is not None
+        if self._index_mmapped:
+            logger.info("Memory-mapped FAISS index (%d vectors).", index.ntotal)
+        return FAISS(self.embeddings, index, docstore, index_to_docstore_id,
+                     distance_strategy=self._distance_strategy(index))
+
+    @staticmethod
+    def _advise_index_file(path: str):
+        """
+        Asks the kernel to start reading the index file into the page cache in the
+        background (POSIX_FADV_WILLNEED). The inverted lists hold the quantized codes
+        every query scans, so on a cold cache the first queries would otherwise
+        fault pages in one at a time. Does nothing where posix_fadvise is unavailable.
+
+        Args:
+            path (str): The path of the index file.
+        """
+        if not hasattr(os, "posix_fadvise"):
+            return # E.g. macOS or Windows
+        try:
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            logger.debug("posix_fadvise failed for %s: %s", path, e)
+
+    def _ensure_writable_index(self):
+        """Reads a memory-mapped index fully into RAM, so vectors can be added to it."""
+        if not self._index_mmapped:
+            return
+        logger.info("Loading memory-mapped FAISS index into RAM before adding documents.")
+        self.vector_store.index = faiss.read_index(os.path.join(FAISS_INDEX_PATH, "index.faiss"))
+        self._index_mmapped = False
+        self._configure_index()
+
+    def _index_hashes(self):
+        """
+        Rebuilds the chunk and document hash sets: from the hashes saved with the
+        index if they are valid, otherwise by reading every chunk from the docstore.
+        """
+        # The shared ChunkStore may also hold other sessions' chunks, so this index's
+        # chunks are the ones its positions map to.
+        doc_ids = self.vector_store.index_to_docstore_id
+        # The MinHash index needs every chunk's text anyway.
+        saved_hashes = self._load_chunk_hashes(len(doc_ids)) if self._near_dup_index is None else None
+        if saved_hashes is not None:
+            self._chunk_hashes, self._document_hashes = saved_hashes
+            logger.debug("Loaded hashes of %d chunks from %d files.", len(self._chunk_hashes), len(self._document_hashes))
+            return
+        for doc in self.vector_store.docstore.documents(doc_ids.values()):
+            chunk_hash = self._chunk_hash(doc.page_content)
+            if self._near_dup_index is not None and chunk_hash not in self._chunk_hashes:
+                self._near_dup_index.insert(chunk_hash, self._minhash(doc.page_content))
+            self._chunk_hashes.add(chunk_hash)
+            if doc.metadata.get("content_hash"):
+                self._document_hashes.add(doc.metadata["content_hash"])
+        logger.debug("Indexed hashes of %d chunks from %d files.", len(self._chunk_hashes), len(self._document_hashes))
+
+    @staticmethod
+    def _load_chunk_hashes(num_docs: int) -> Optional[Tuple[Set[int], Set[str]]]:
+        """
+        Loads the chunk fingerprints and file content hashes saved with the index.
+
+        Args:
+            num_docs (int): The number of documents in the loaded index.
+
+        Returns:
+            Optional[Tuple[Set[int], Set[str]]]: The chunk fingerprints and file hashes,
+            or None if they are missing or were saved for a different docstore,
+            fingerprint version or hash algorithm.
+        """
+        try:
+            with np.load(os.path.join(FAISS_INDEX_PATH, _CHUNK_HASHES_FILE)) as saved:
+                if (int(saved["version"]) != _CHUNK_HASH_VERSION or str(saved["algorithm"]) != FINGERPRINT_ALGORITHM
+                        or int(saved["num_docs"]) != num_docs):
+                    return None
+                return set(saved["hashes"].tolist()), set(saved["document_hashes"].tolist())
+        except (OSError, KeyError, ValueError):
+            return None
+
+    def _save_chunk_hashes(self, folder_path: str):
+        """Saves the chunk fingerprints and file hashes into the index directory 'folder_path'."""
+        np.savez(os.path.join(folder_path, _CHUNK_HASHES_FILE),
+                 hashes=np.fromiter(self._chunk_hashes, dtype=np.uint64, count=len(self._chunk_hashes)),
+                 document_hashes=np.array(sorted(self._document_hashes), dtype=str),
+                 num_docs=len(self.vector_store.index_to_docstore_id),
+                 version=_CHUNK_HASH_VERSION,
+                 algorithm=FINGERPRINT_ALGORITHM)
+
+    @staticmethod
+    def _chunk_hash(text: str) -> int:
+        """
+        Fingerprints a chunk's text, ignoring case and whitespace, so the same
+        text extracted with different line breaks or capitalization matches.
+        """
+        return fingerprint((" ".join(text.lower().split()),))
+
+    @staticmethod
+    def _minhash(text: str) -> "MinHash":
+        """Computes the MinHash signature of a chunk's word 3-shingles."""
+        words = text.lower().split()
+        shingles = {" ".join(words[i:i + 3]).encode("utf-8") for i in range(max(1, len(words) - 2))}
+        minhash = MinHash(num_perm=CHUNK_MINHASH_PERMUTATIONS)
+        minhash.update_batch(list(shingles))
+        return minhash
+
+    def is_document_indexed(self, content_hash: str) -> bool:
+        """
+        Checks whether a file with the given contents has already been added.
+
+        Args:
+            content_hash (str): The digest of the file contents.
+
+        Returns:
+            bool: True if the file's chunks are in the index.
+        """
+        return content_hash in self._document_hashes
+
+    def _configure_index(self):
+        """
+        Applies query-time settings (nprobe) if the loaded index is an IVF index, and
+        enables reading stored vectors back from it (used for reranking).
+        """
+        try:
+            ivf_index = faiss.extract_index_ivf(self.vector_store.index)
+        except RuntimeError:
+            return # Not an IVF index
+        ivf_index.nprobe = FAISS_NPROBE
+        ivf_index.make_direct_map()
+
+    def _maybe_quantize_index(self):
+        """
+        Replaces the flat index with a compressed IVF index once it holds
+        FAISS_IVF_MIN_VECTORS vectors: 8-bit scalar quantization if FAISS_QUANTIZER
+        is "sq8", product quantization if it is "pq", and 4-bit product quantization
+        scanned with SIMD lookups if it is "pq-fastscan".
+
+        Vectors keep their positions, so the mapping from index positions to
+        stored documents stays valid.
+        """
+        index = self.vector_store.index
+        if FAISS_QUANTIZER not in ("sq8", "pq", "pq-fastscan") or not isinstance(index, faiss.IndexFlat):
+            return
+        if index.ntotal < FAISS_IVF_MIN_VECTORS:
+            return
+        if FAISS_QUANTIZER == "pq" and index.d % FAISS_PQ_M != 0:
+            logger.error("FAISS_PQ_M (%d) must divide the embedding dimension (%d); keeping the flat index.",
+                         FAISS_PQ_M, index.d)
+            return
+        if FAISS_QUANTIZER == "pq-fastscan" and index.d % FAISS_FASTSCAN_M != 0:
+            logger.error("FAISS_FASTSCAN_M (%d) must divide the embedding dimension (%d); keeping the flat index.",
+                         FAISS_FASTSCAN_M, index.d)
+            return
+
+        vectors = index.reconstruct_n(0, index.ntotal)
+        # FAISS needs about 39 training vectors per list for good centroids.
+        nlist = max(1, min(FAISS_IVF_NLIST, index.ntotal // 39))
+        quantizer = faiss.IndexFlat(index.d, index.metric_type)
+        if FAISS_QUANTIZER == "pq":
+            # FAISS_PQ_M sub-vectors of 8-bit codes: FAISS_PQ_M bytes per vector.
+            ivf_index = faiss.IndexIVFPQ(quantizer, index.d, nlist, FAISS_PQ_M, 8, index.metric_type)
+            description = f"IVF{nlist},PQ{FAISS_PQ_M}"
+        elif FAISS_QUANTIZER == "pq-fastscan":
+            # FastScan only supports 4-bit codes, packed in blocks of 32 vectors
+            # (the default bbs) so each SIMD lookup scores a whole block.
+            ivf_index = faiss.IndexIVFPQFastScan(quantizer, index.d, nlist, FAISS_FASTSCAN_M, 4, index.metric_type)
+            description = f"IVF{nlist},PQ{FAISS_FASTSCAN_M}x4fs"
+        else:
+            ivf_index = faiss.IndexIVFScalarQuantizer(quantizer, index.d, nlist,
+                                                      faiss.ScalarQuantizer.QT_8bit, index.metric_type)
+            description = f"IVF{nlist},SQ8"
+        if index.ntotal > FAISS_TRAIN_MAX_VECTORS:
+            sample = np.random.default_rng(0).choice(index.ntotal, FAISS_TRAIN_MAX_VECTORS, replace=False)
+            ivf_index.train(vectors[sample])
+        else:
+            ivf_index.train(vectors)
+        ivf_index.add(vectors)
+        self.vector_store.index = ivf_index
+        self._configure_index()
+        logger.info("Converted FAISS index to %s with %d vectors.", description, ivf_index.ntotal)
+
     def _save_vector_store(self):
         """
         Saves the current state of the FAISS index to disk.
+
+        The index, docstore and chunk fingerprints are written to a temporary
+        directory, which then replaces the saved one. Until the replacement, the
+        previous save stays complete on disk. The chunk data file is append-only,
+        so the records the previous save refers to are still there too.
         """
         if self.vector_store:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
             try:
-                self.vector_store.save_local(FAISS_INDEX_PATH)
-                print(f"VectorStoreManager: FAISS index saved to {FAISS_INDEX_PATH}")
+                shutil.rmtree(_SAVE_TMP_PATH, ignore_errors=True) # Left over from a failed save
+                # The saved docstore refers to records of the chunk data file by offset.
+                self.vector_store.docstore.sync()
+                self.vector_store.save_local(_SAVE_TMP_PATH)
+                self._save_chunk_hashes(_SAVE_TMP_PATH)
+                if os.path.exists(FAISS_INDEX_PATH):
+                    shutil.rmtree(_SAVE_OLD_PATH, ignore_errors=True)
+                    os.replace(FAISS_INDEX_PATH, _SAVE_OLD_PATH)
+                os.replace(_SAVE_TMP_PATH, FAISS_INDEX_PATH)
+                shutil.rmtree(_SAVE_OLD_PATH, ignore_errors=True)
+                self._unsaved_chunks = 0
+                self._last_save = time.monotonic()
+                logger.debug("FAISS index saved to %s", FAISS_INDEX_PATH)
             except Exception as e:
-                print(f"VectorStoreManager Error: Could not save FAISS index: {e}")
+                logger.error("Could not save FAISS index: %s", e)
         else:
-            print("VectorStoreManager: No vector store to save.")
+            logger.warning("No vector store to save.")
+
+    def _maybe_save_vector_store(self, at_document_end: bool):
+        """
+        Saves the index if enough chunks were added or enough time has passed
+        since the last save; otherwise schedules a save FAISS_SAVE_INTERVAL
+        seconds from now. Must be called with the write lock held.
+
+        Args:
+            at_document_end (bool): Whether the last added chunks completed a document.
+                                    Saves triggered by the chunk count wait for one.
+        """
+        if self._unsaved_chunks == 0:
+            return
+        if at_document_end and (self._unsaved_chunks >= FAISS_SAVE_EVERY_CHUNKS
+                                or time.monotonic() - self._last_save >= FAISS_SAVE_INTERVAL):
+            self._save_vector_store()
+        elif self._flush_timer is None:
+            self._flush_timer = threading.Timer(FAISS_SAVE_INTERVAL, self.flush)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def flush(self):
+        """
+        Saves chunks added since the last save to disk, waiting for an addition
+        in progress to finish first. Does nothing if everything is saved.
+        """
+        with self._write_lock:
+            if self._unsaved_chunks:
+                self._save_vector_store()
 
-    def add_documents_to_index(self, raw_text: str, source_metadata: Dict[str, Any]) -> List[LangchainDocument]:
+    def add_documents_to_index(self, raw_text: str, source_metadata: Dict[str, Any]) -> List[str]:
         """
         Splits raw text into chunks, generates embeddings, and adds them to the FAISS index.
 
@@ -81,33 +635,185 @@ class VectorStoreManager:
                                                (e.g., file_name, file_type).
 
         Returns:
-            List[LangchainDocument]: A list of LangChain Document objects that were added.
+            List[str]: The docstore IDs of the chunks that were added.
+
+        Raises:
+            Exception: If embedding or indexing the chunks failed.
         """
-        print(f"VectorStoreManager: Splitting text into chunks (size={CHUNK_SIZE}, overlap={CHUNK_OVERLAP})...")
-        # Create LangChain Document objects from the raw text
-        # The metadata will be attached to each chunk
-        documents = self.text_splitter.create_documents(
-            texts=[raw_text],
-            metadatas=[source_metadata]
-        )
-        print(f"VectorStoreManager: Created {len(documents)} chunks.")
+        return self.add_many([(raw_text, source_metadata)])
+
+    def add_many(self, sources: List[Tuple[str, Dict[str, Any]]]) -> List[str]:
+        """
+        Splits several documents into chunks and adds all of them to the FAISS index
+        with a single embedding pass and a single FAISS add, so a folder of small
+        files is encoded in full batches rather than one short batch per file.
+
+        Args:
+            sources (List[Tuple[str, Dict[str, Any]]]): One (raw_text, source_metadata)
+                pair per document.
+
+        Returns:
+            List[str]: The docstore IDs of the chunks that were added.
+
+        Raises:
+            Exception: If embedding or indexing the chunks failed.
+        """
+        logger.debug("Splitting %d documents into chunks (size=%d, overlap=%d)...",
+                     len(sources), CHUNK_SIZE, CHUNK_OVERLAP)
+        # The same chunker as the streaming ingestion path, so both produce identical
+        # chunks (and start_index metadata) for the same text.
+        batches = [(list(chunk_stream([raw_text])), source_metadata) for raw_text, source_metadata in sources]
+        logger.debug("Created %d chunks.", sum(len(chunks) for chunks, _ in batches))
+        return self.add_chunk_batches_to_index(batches)
+
+    def add_chunks_to_index(self, chunks: List[Tuple[int, str]], source_metadata: Dict[str, Any],
+                            save: bool = True) -> List[str]:
+        """
+        Generates embeddings for already-split chunks and adds them to the FAISS index.
+
+        Args:
+            chunks (List[Tuple[int, str]]): (start_index, chunk_text) pairs, as produced
+                                            by utils.text_chunker.chunk_stream.
+            source_metadata (Dict[str, Any]): Metadata associated with the document
+                                               (e.g., file_name, file_type).
+            save (bool): Whether these chunks complete the document. A document added
+                         in several batches is only saved after its last one.
+
+        Returns:
+            List[str]: The docstore IDs of the chunks that were added.
+
+        Raises:
+            Exception: If embedding or indexing the chunks failed.
+        """
+        if not chunks:
+            logger.warning("No chunks to add.")
+            return []
+        # A document sent in several batches is complete once its last batch is saved.
+        return self._add_to_vector_store([(chunks, source_metadata)], save=save,
+                                         document_hashes=[source_metadata.get("content_hash")] if save else ())
 
-        if not documents:
-            print("VectorStoreManager: No documents to add after splitting.")
+    def add_chunk_batches_to_index(self, batches: List[Tuple[List[Tuple[int, str]], Dict[str, Any]]]) -> List[str]:
+        """
+        Adds the chunks of several documents to the FAISS index with a single
+        embedding pass over all of them.
+
+        Args:
+            batches (List[Tuple[List[Tuple[int, str]], Dict[str, Any]]]): One
+                (chunks, source_metadata) pair per document, where chunks are
+                (start_index, chunk_text) pairs as produced by utils.text_chunker.chunk_stream.
+
+        Returns:
+            List[str]: The docstore IDs of the chunks that were added.
+
+        Raises:
+            Exception: If embedding or indexing the chunks failed.
+        """
+        if not any(chunks for chunks, _ in batches):
+            logger.warning("No chunks to add.")
             return []
+        # A file without chunks was not indexed, so its hash is not recorded.
+        return self._add_to_vector_store(batches, document_hashes=[
+            source_metadata.get("content_hash") for chunks, source_metadata in batches if chunks
+        ])
+
+    def _add_to_vector_store(self, batches: List[Tuple[List[Tuple[int, str]], Dict[str, Any]]], save: bool = True,
+                             document_hashes: Iterable[Optional[str]] = ()) -> List[str]:
+        """
+        Embeds the given chunks and appends them to the FAISS index. The index is
+        saved once enough unsaved chunks have accumulated (see _maybe_save_vector_store).
+        Chunks whose text is already indexed are skipped without being embedded.
+        Safe to call from several threads; chunks that a concurrent call adds first
+        are dropped before they reach the index.
+
+        A chunk's metadata dict is only built once it is known to be new, so nothing
+        is allocated per chunk for duplicates. Only the docstore IDs of the added
+        chunks are returned, so they are not read back out of the docstore.
+
+        Args:
+            batches (List[Tuple[List[Tuple[int, str]], Dict[str, Any]]]): One
+                (chunks, source_metadata) pair per document, where chunks are
+                (start_index, chunk_text) pairs.
+            save (bool): Whether the index may be saved afterwards, i.e. whether
+                         these chunks complete the documents they belong to.
+            document_hashes (Iterable[Optional[str]]): Content hashes of the files that
+                are complete once these chunks are added.
+
+        Returns:
+            List[str]: The docstore IDs of the chunks that were added.
+
+        Raises:
+            Exception: Whatever embedding or indexing the chunks raised. The caller
+                       reports it, e.g. to the user whose upload failed.
+        """
+        # (text, metadata) of each new chunk, keyed by chunk fingerprint, which also
+        # drops duplicates within 'batches'.
+        new_chunks: Dict[int, Tuple[str, Dict[str, Any]]] = {}
+        total = 0
+        # The write lock serializes the checks with concurrent additions; the
+        # near-duplicate index is not thread-safe either.
+        with self._write_lock:
+            for chunks, source_metadata in batches:
+                total += len(chunks)
+                for start_index, text in chunks:
+                    chunk_hash = self._chunk_hash(text)
+                    if chunk_hash in self._chunk_hashes or chunk_hash in new_chunks:
+                        continue
+                    if self._near_dup_index is not None:
+                        minhash = self._minhash(text)
+                        if self._near_dup_index.query(minhash):
+                            continue
+                        # Inserted right away, so near-duplicates within 'batches' and of
+                        # concurrent calls are caught too.
+                        self._near_dup_index.insert(chunk_hash, minhash)
+                    new_chunks[chunk_hash] = (text, {**source_metadata, "start_index": start_index})
+        if len(new_chunks) < total:
+            logger.info("Deduplicated %d of %d chunks (already indexed or repeated).",
+                        total - len(new_chunks), total)
 
         # Add the documents (chunks with embeddings) to the vector store
+        ids: List[str] = []
         try:
-            # If the vector store was initialized with a dummy text, we need to handle it.
-            # A simpler way is to just add the new documents. FAISS.add_documents
-            # will append to the existing index.
-            self.vector_store.add_documents(documents)
-            self._save_vector_store() # Save after adding documents
-            print(f"VectorStoreManager: Added {len(documents)} chunks to FAISS index.")
-            return documents
-        except Exception as e:
-            print(f"VectorStoreManager Error: Failed to add documents to FAISS index: {e}")
-            return []
+            texts = [text for text, _ in new_chunks.values()]
+            # Embed without holding either lock, so queries are not blocked meanwhile.
+            vectors = self._encode_texts(texts) if new_chunks else None
+            with self._write_lock:
+                # A concurrent call may have added some of the chunks while they were embedded.
+                if new_chunks and not self._chunk_hashes.isdisjoint(new_chunks):
+                    keep = [i for i, chunk_hash in enumerate(new_chunks) if chunk_hash not in self._chunk_hashes]
+                    new_chunks = {chunk_hash: chunk for chunk_hash, chunk in new_chunks.items()
+                                  if chunk_hash not in self._chunk_hashes}
+                    texts = [text for text, _ in new_chunks.values()]
+                    vectors = vectors[keep]
+                if new_chunks:
+                    with self._index_lock:
+                        self._ensure_writable_index()
+                        # FAISS.add_embeddings appends to the existing index.
+                        ids = self.vector_store.add_embeddings(
+                            zip(texts, vectors),
+                            metadatas=[metadata for _, metadata in new_chunks.values()]
+                        )
+                        if self._binary_index is not None:
+                            self._binary_index.add(self._binarize(vectors))
+                        self._maybe_quantize_index()
+                    self._chunk_hashes.update(new_chunks)
+                    self._unsaved_chunks += len(new_chunks)
+                # Saved along with the chunk fingerprints.
+                new_document_hashes = {h for h in document_hashes if h}.difference(self._document_hashes)
+                self._document_hashes.update(new_document_hashes)
+                if new_document_hashes and not new_chunks:
+                    # All chunks of these files were already indexed, but their hashes
+                    # still have to be saved.
+                    self._unsaved_chunks += 1
+                # Writing only reads the index, which is safe alongside searches.
+                self._maybe_save_vector_store(at_document_end=save)
+            logger.info("Added %d chunks to FAISS index.", len(ids))
+            return ids
+        except Exception:
+            if self._near_dup_index is not None:
+                with self._write_lock:
+                    for chunk_hash in new_chunks:
+                        self._near_dup_index.remove(chunk_hash)
+            raise
 
     def retrieve_relevant_chunks(self, query_text: str, k: int) -> List[LangchainDocument]:
         """
@@ -122,18 +828,217 @@ class VectorStoreManager:
                                      most relevant to the query.
         """
         if not self.vector_store:
-            print("VectorStoreManager: Vector store not initialized. Cannot retrieve chunks.")
+            logger.warning("Vector store not initialized. Cannot retrieve chunks.")
             return []
 
-        print(f"VectorStoreManager: Retrieving top {k} relevant chunks for query: '{query_text}'")
+        logger.debug("Retrieving top %d relevant chunks for query: '%s'", k, query_text)
         try:
-            # Perform similarity search
-            # The 'search_type="similarity"' is default, but explicitly stated for clarity.
-            # 'k' specifies the number of results to return.
-            retrieved_docs = self.vector_store.similarity_search(query_text, k=k)
-            print(f"VectorStoreManager: Retrieved {len(retrieved_docs)} chunks.")
+            # The query is embedded once, before taking the index lock, and
+            # searched like any other precomputed embedding.
+            query_embedding = self.embed_query(query_text)
+        except Exception as e:
+            logger.error("Failed to embed query: %s", e)
+            return []
+        return self.retrieve_relevant_chunks_by_vector(query_embedding, k)
+
+    def embed_query(self, query_text: str) -> List[float]:
+        """
+        Computes the embedding of a query with the store's embedding model.
+
+        Args:
+            query_text (str): The user's query.
+
+        Returns:
+            List[float]: The query embedding.
+        """
+        return self.embeddings.embed_query(query_text)
+
+    def embed_queries(self, query_texts: List[str]) -> np.ndarray:
+        """
+        Computes the embeddings of several queries in a single call to the embedding model.
+
+        Args:
+            query_texts (List[str]): The user queries.
+
+        Returns:
+            np.ndarray: One embedding per query, in order, as the rows of a float32 matrix.
+        """
+        # Both backends embed queries and documents the same way, so all queries
+        # are encoded in one batch like documents are.
+        return self._encode_texts(query_texts)
+
+    def _encode_texts(self, texts: List[str]) -> np.ndarray:
+        """
+        Embeds texts straight into a float32 matrix.
+
+        LangChain's embed_documents converts the model's output matrix into lists
+        of Python floats, which FAISS then converts back into a matrix. Calling the
+        model directly skips both conversions (a few hundred floats per chunk).
+
+        Args:
+            texts (List[str]): The texts to embed.
+
+        Returns:
+            np.ndarray: A (len(texts), dimension) matrix with one embedding per row.
+        """
+        model = self.embeddings.model
+        if isinstance(model, SentenceTransformerEmbeddings):
+            # encode_kwargs holds the batch size and normalization settings.
+            return model.client.encode(texts, convert_to_numpy=True, **model.encode_kwargs)
+        return model.encode(texts) # OnnxEmbeddings or Model2VecEmbeddings
+
+    def retrieve_relevant_chunks_by_vector(self, query_embedding: List[float], k: int) -> List[LangchainDocument]:
+        """
+        Performs a similarity search for an already-computed query embedding,
+        so a query that was embedded for another purpose is not embedded twice.
+
+        Args:
+            query_embedding (List[float]): The embedding of the user's query.
+            k (int): The number of top relevant chunks to retrieve.
+
+        Returns:
+            List[LangchainDocument]: A list of LangChain Document objects (chunks)
+                                     most relevant to the query.
+        """
+        if not self.vector_store:
+            logger.warning("Vector store not initialized. Cannot retrieve chunks.")
+            return []
+
+        try:
+            # The same search as for query batches, including the binary prefilter.
+            retrieved_docs, _ = self._search_batch([query_embedding], k, with_vectors=False)[0]
+            logger.debug("Retrieved %d chunks.", len(retrieved_docs))
             return retrieved_docs
         except Exception as e:
-            print(f"VectorStoreManager Error: Failed to retrieve chunks: {e}")
+            logger.error("Failed to retrieve chunks: %s", e)
             return []
 
+    def retrieve_relevant_chunks_batch(self, query_embeddings: List[List[float]], k: int) -> List[List[LangchainDocument]]:
+        """
+        Performs one FAISS search for several query embeddings at once.
+
+        Args:
+            query_embeddings (List[List[float]]): The embeddings of the user queries.
+            k (int): The number of top relevant chunks to retrieve per query.
+
+        Returns:
+            List[List[LangchainDocument]]: For each query, in order, the chunks most relevant to it.
+        """
+        return [docs for docs, _ in self._search_batch(query_embeddings, k, with_vectors=False)]
+
+    def retrieve_candidates_batch(self, query_embeddings: List[List[float]],
+                                  k: int) -> List[Tuple[List[LangchainDocument], np.ndarray]]:
+        """
+        Like retrieve_relevant_chunks_batch, but also returns the stored embedding of
+        every retrieved chunk (read back from the index), e.g. for reranking.
+
+        Args:
+            query_embeddings (List[List[float]]): The embeddings of the user queries.
+            k (int): The number of candidate chunks to retrieve per query.
+
+        Returns:
+            List[Tuple[List[LangchainDocument], np.ndarray]]: For each query, in order,
+            the retrieved chunks and a (len(chunks), d) array of their embeddings.
+        """
+        return self._search_batch(query_embeddings, k, with_vectors=True)
+
+    def _prefetch_inverted_lists(self, vectors: np.ndarray):
+        """
+        Asks the kernel to read in the codes and IDs of every inverted list the
+        search for 'vectors' will probe, so the pages of all of them are read in
+        parallel while FAISS scans the first ones. The probed lists are found with
+        the same coarse quantizer search FAISS repeats (against only FAISS_IVF_NLIST
+        centroids). Must be called with the index lock held.
+
+        Args:
+            vectors (np.ndarray): A (batch, d) float32 matrix of query embeddings.
+        """
+        ivf_index = faiss.extract_index_ivf(self.vector_store.index)
+        invlists = ivf_index.invlists
+        try:
+            _, list_nos = ivf_index.quantizer.search(vectors, ivf_index.nprobe)
+            for list_no in np.unique(list_nos).tolist():
+                if list_no < 0 or invlists.list_size(list_no) == 0:
+                    continue
+                size = invlists.list_size(list_no)
+                codes = invlists.get_codes(list_no)
+                _advise_willneed(faiss.rev_swig_ptr(codes, size * invlists.code_size).ctypes.data,
+                                 size * invlists.code_size)
+                invlists.release_codes(list_no, codes)
+                ids = invlists.get_ids(list_no)
+                _advise_willneed(faiss.rev_swig_ptr(ids, size).ctypes.data, size * 8) # int64 IDs
+                invlists.release_ids(list_no, ids)
+        except Exception as e:
+            # Only a hint; the search itself does not depend on it.
+            logger.debug("Could not prefetch inverted lists: %s", e)
+
+    def _prefiltered_search(self, vectors: np.ndarray, k: int) -> np.ndarray:
+        """
+        Two-stage search: shortlists FAISS_BINARY_PREFILTER_FACTOR * k candidates per
+        query by Hamming distance between sign bits, then ranks the shortlist by the
+        main index's metric on its stored vectors. Must be called with the index lock held.
+
+        Args:
+            vectors (np.ndarray): A (batch, d) float32 matrix of query embeddings.
+            k (int): The number of results per query.
+
+        Returns:
+            np.ndarray: A (batch, k) matrix of index positions, best first, like the
+            indices returned by index.search.
+        """
+        index = self.vector_store.index
+        _, candidates = self._binary_index.search(self._binarize(vectors), k * FAISS_BINARY_PREFILTER_FACTOR)
+        indices = np.full((len(vectors), k), -1, dtype=np.int64)
+        for row, (query, ids) in enumerate(zip(vectors, candidates)):
+            ids = ids[ids != -1]
+            stored = index.reconstruct_batch(ids)
+            if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+                scores = stored @ query
+            else:
+                scores = -((stored - query) ** 2).sum(axis=1)
+            best = ids[np.argsort(-scores)[:k]]
+            indices[row, :len(best)] = best
+        return indices
+
+    def _search_batch(self, query_embeddings: List[List[float]], k: int,
+                      with_vectors: bool) -> List[Tuple[List[LangchainDocument], Optional[np.ndarray]]]:
+        """
+        Searches the FAISS index with a (batch, dimension) matrix and maps the hits
+        back to documents the same way FAISS.similarity_search_by_vector does.
+        """
+        if not self.vector_store:
+            logger.warning("Vector store not initialized. Cannot retrieve chunks.")
+            return [([], None) for _ in query_embeddings]
+
+        vectors = np.asarray(query_embeddings, dtype=np.float32)
+        if self.vector_store._normalize_L2:
+            vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        with self._index_lock:
+            index = self.vector_store.index
+            if self._binary_index is not None and index.ntotal > k * FAISS_BINARY_PREFILTER_FACTOR:
+                indices = self._prefiltered_search(vectors, k)
+            else:
+                if self._index_mmapped and FAISS_PREFETCH_LISTS and _madvise is not None:
+                    self._prefetch_inverted_lists(vectors)
+                _, indices = index.search(vectors, k)
+
+            results = []
+            for row in indices:
+                docs = []
+                hit_ids = []
+                for i in row:
+                    if i == -1: # Fewer than k vectors in the index
+                        continue
+                    doc = self.vector_store.docstore.search(self.vector_store.index_to_docstore_id[i])
+                    # Empty chunks are never indexed, except the placeholder text of
+                    # older IVF indexes (see _remove_placeholder_text).
+                    if isinstance(doc, LangchainDocument) and doc.page_content:
+                        docs.append(doc)
+                        hit_ids.append(i)
+                hit_vectors = None
+                if with_vectors:
+                    hit_vectors = (index.reconstruct_batch(np.asarray(hit_ids, dtype=np.int64))
+                                   if hit_ids else np.empty((0, index.d), dtype=np.float32))
+                results.append((docs, hit_vectors))
+        logger.debug("Retrieved chunks for %d queries in one search.", len(results))
+        return results